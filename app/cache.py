@@ -0,0 +1,96 @@
+import threading
+import time
+
+from collections import OrderedDict
+from typing import Callable, Hashable
+
+
+MISSING = object()
+
+
+class ResponseCache:
+    """LRU cache of responses bounded by entries and bytes.
+
+    Entries expire after ttl seconds when a ttl is set, and the whole cache
+    is cleared the first time it is used with a newer index generation.
+    Requests still running on an older generation bypass the cache.
+    """
+
+    def __init__(self,
+                 max_entries: int = 1024,
+                 max_bytes: int = 32 * 1024 * 1024,
+                 ttl: float = None,
+                 clock: Callable[[], float] = time.monotonic):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.clock = clock
+        self.generation = None
+        self.n_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # key -> (expiry time, value, size in bytes)
+        self._entries: OrderedDict[Hashable, tuple[float, object, int]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _check_generation(self, generation: int) -> bool:
+        # False for an outdated generation
+        if self.generation is not None and generation < self.generation:
+            return False
+        if generation != self.generation:
+            self._entries.clear()
+            self.n_bytes = 0
+            self.generation = generation
+        return True
+
+    def get(self, key: Hashable, generation: int, default=MISSING):
+        with self._lock:
+            entry = self._entries.get(key) if self._check_generation(generation) else None
+            if entry is not None and self.ttl is not None and entry[0] <= self.clock():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: Hashable, value, generation: int, size: int = None) -> None:
+        """Cache a value, its size defaults to len(value) for bytes-like values."""
+        if size is None:
+            size = len(value or b"")
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if not self._check_generation(generation):
+                return
+            if key in self._entries:
+                self._remove(key)
+            expires = self.clock() + self.ttl if self.ttl is not None else None
+            self._entries[key] = (expires, value, size)
+            self.n_bytes += size
+            while len(self._entries) > self.max_entries or self.n_bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key: Hashable) -> None:
+        _, _, size = self._entries.pop(key)
+        self.n_bytes -= size
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.n_bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.n_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "generation": self.generation,
+            }
@@ -1,10 +1,62 @@
+import os
+
 from app.search_engine import TextProcessing
+from data.constants import DATASET_GITHUB
 
 
 class Config:
     k: int = 10
-    text_processing: TextProcessing = TextProcessing.Lemmatizer
+    text_processing: TextProcessing = TextProcessing(
+        os.environ.get("TEXT_PROCESSING", TextProcessing.Lemmatizer)
+    )
+    # Load spaCy or the stemmer on the first query needing them instead of at startup
+    lazy_loading: bool = os.environ.get("LAZY_LOADING") == "1"
     stopwords: bool = True
     score_filter: bool = False
     score_threshold: float = 0.5
     tags_n_occurences: int = 8
+    # Most completions of each kind returned by /suggest
+    suggest_limit: int = 10
+    dataset_path: str = os.environ.get("DATASET_PATH", DATASET_GITHUB)
+    # Local copy of the dataset, read at startup instead of dataset_path
+    dataset_cache_dir: str = os.environ.get("DATASET_CACHE_DIR", "data/dataset_cache")
+    # Reload the dataset when the local dataset_path file changes
+    watch_dataset: bool = False
+    watch_interval: float = 5.0
+    # Admin endpoints are disabled unless a token is set
+    admin_token: str = os.environ.get("ADMIN_TOKEN")
+    index_workers: int = os.cpu_count() or 1
+    index_batch_size: int = 256
+    index_snapshot_dir: str = os.environ.get("INDEX_SNAPSHOT_DIR", "data/index_snapshots")
+    search_shards: int = 1
+    # Misspelled query words are matched to indexed words within this many edits (0 disables),
+    # scored with the idf multiplied by fuzzy_penalty per edit
+    fuzzy_distance: int = 2
+    fuzzy_penalty: float = 0.5
+    # LSA dense index of dense_dims dimensions (0 disables), int8 quantized or float32, searched
+    # exactly or, with dense_lists > 0, in the dense_probe closest of dense_lists k-means lists
+    dense_dims: int = int(os.environ.get("DENSE_DIMS", 128))
+    dense_quantize: bool = False
+    dense_lists: int = 0
+    dense_probe: int = 8
+    # Dense results less similar to the query are dropped, unrelated movies score around 0
+    dense_min_similarity: float = 0.1
+    # "bm25", "dense" or "hybrid" (reciprocal rank fusion of both), chosen per request
+    retrieval: str = "bm25"
+    rrf_k: int = 60
+    # Movies of /similar, precomputed for every movie (0 disables) and ranked by the plot (BM25),
+    # tags and genres cosine similarities weighted by the similar_*_weight
+    similar_neighbors: int = int(os.environ.get("SIMILAR_NEIGHBORS", 20))
+    similar_plot_weight: float = 0.6
+    similar_tag_weight: float = 0.3
+    similar_genre_weight: float = 0.1
+    response_cache_entries: int = 1024
+    response_cache_bytes: int = 32 * 1024 * 1024
+    response_cache_ttl: float = None
+    # "thread", "process" or "inline" (on the event loop)
+    search_executor: str = "thread"
+    search_workers: int = 4
+    search_max_pending: int = 64
+    batch_max_queries: int = 10_000
+    # Stage timings, Server-Timing headers and the /metrics endpoint
+    metrics_enabled: bool = os.environ.get("METRICS", "1") != "0"
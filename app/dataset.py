@@ -0,0 +1,242 @@
+import gc
+import hashlib
+import json
+import numpy as np
+import os
+import shutil
+
+from contextlib import contextmanager
+from pathlib import Path
+
+from pandas import DataFrame, to_datetime
+
+
+# Bumped when the layout of the cache changes, older caches are rebuilt
+CACHE_VERSION = 2
+
+
+def encode_strings(strings: list[str]) -> dict[str, np.ndarray]:
+    encoded = [string.encode() for string in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(string) for string in encoded], out=offsets[1:])
+    return {"data": np.frombuffer(b"".join(encoded), dtype=np.uint8), "offsets": offsets}
+
+
+def decode_strings(data: np.ndarray, offsets: np.ndarray) -> list[str]:
+    buffer = data.tobytes()
+    bounds = offsets.tolist()
+    return [buffer[start:stop].decode() for start, stop in zip(bounds[:-1], bounds[1:])]
+
+
+def encode_lists(lists: list[list[str]]) -> dict[str, np.ndarray]:
+    # Lists of strings are stored as ids into a vocabulary
+    vocabulary = {}
+    ids = [vocabulary.setdefault(value, len(vocabulary)) for values in lists for value in values]
+    offsets = np.zeros(len(lists) + 1, dtype=np.int64)
+    np.cumsum([len(values) for values in lists], out=offsets[1:])
+    strings = encode_strings(list(vocabulary))
+    return {
+        "ids": np.array(ids, dtype=np.int32),
+        "offsets": offsets,
+        "vocabulary_data": strings["data"],
+        "vocabulary_offsets": strings["offsets"],
+    }
+
+
+def decode_lists(ids: np.ndarray,
+                 offsets: np.ndarray,
+                 vocabulary_data: np.ndarray,
+                 vocabulary_offsets: np.ndarray) -> list[list[str]]:
+    vocabulary = decode_strings(vocabulary_data, vocabulary_offsets)
+    values = [vocabulary[i] for i in ids.tolist()]
+    bounds = offsets.tolist()
+    return [values[start:stop] for start, stop in zip(bounds[:-1], bounds[1:])]
+
+
+def column_kind(values: np.ndarray) -> str:
+    if np.issubdtype(values.dtype, np.datetime64):
+        return "datetime"
+    if values.dtype != object:
+        return "array"
+    if all(isinstance(value, str) for value in values):
+        return "str"
+    if all(isinstance(value, list) and all(isinstance(v, str) for v in value)
+           for value in values):
+        return "list"
+    # Mixed columns, such as numbers with "" for the missing ones
+    return "json"
+
+
+def encode_column(values: np.ndarray, kind: str) -> dict[str, np.ndarray]:
+    if kind == "datetime":
+        return {"values": values.astype("datetime64[ns]").view(np.int64)}
+    if kind == "array":
+        return {"values": values}
+    if kind == "str":
+        return encode_strings(values.tolist())
+    if kind == "list":
+        return encode_lists(values.tolist())
+    return encode_strings([json.dumps(value) for value in values.tolist()])
+
+
+def decode_column(arrays: dict[str, np.ndarray], kind: str):
+    if kind == "datetime":
+        return to_datetime(arrays["values"].view("datetime64[ns]"))
+    if kind == "array":
+        return arrays["values"]
+    if kind == "str":
+        values = decode_strings(arrays["data"], arrays["offsets"])
+    elif kind == "list":
+        values = decode_lists(**arrays)
+    else:
+        values = [json.loads(value) for value in decode_strings(arrays["data"], arrays["offsets"])]
+    # fromiter keeps lists as elements, np.array would nest lists of equal lengths
+    return np.fromiter(values, dtype=object, count=len(values))
+
+
+@contextmanager
+def gc_paused():
+    # Decoding allocates many acyclic objects, which would trigger useless full collections
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def file_sha256(path: Path) -> str:
+    with open(path, "rb") as f:
+        return hashlib.file_digest(f, "sha256").hexdigest()
+
+
+def source_version(source: str) -> dict:
+    """The source path, with the size and modification time of a local file."""
+    try:
+        stat = os.stat(source)
+    except OSError:
+        # Not a local file, such as the dataset URL
+        return {"path": source}
+    return {"path": source, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def save_dataset(documents: DataFrame, path: str, source: str) -> Path:
+    """Write the documents to path as one .npy file per column part.
+
+    Tags and genres (lists of strings) are stored as vocabulary ids, strings
+    as UTF-8 bytes with offsets, so loading needs no parsing. The manifest
+    records the checksum of every file, and the size and modification time of
+    a local source, so the cache goes stale when the source file changes.
+    """
+    directory = Path(path)
+    tmp_directory = directory.with_name(f"{directory.name}.tmp")
+    shutil.rmtree(tmp_directory, ignore_errors=True)
+    tmp_directory.mkdir(parents=True)
+    columns = {}
+    for name in ["__index__", *documents.columns]:
+        values = documents.index.to_numpy() if name == "__index__" else documents[name].to_numpy()
+        kind = column_kind(values)
+        checksums = {}
+        for part, array in encode_column(values, kind).items():
+            file = tmp_directory / f"{name}.{part}.npy"
+            np.save(file, array, allow_pickle=False)
+            checksums[part] = file_sha256(file)
+        columns[name] = {"kind": kind, "sha256": checksums}
+    # The manifest is written last, a cache without it is never loaded
+    with open(tmp_directory / "manifest.json", "w") as f:
+        json.dump({
+            "version": CACHE_VERSION,
+            "source": source_version(source),
+            "rows": len(documents),
+            "columns": columns,
+        }, f)
+    shutil.rmtree(directory, ignore_errors=True)
+    tmp_directory.rename(directory)
+    return directory
+
+
+def read_column(directory: Path, name: str, column: dict) -> dict[str, np.ndarray]:
+    """Arrays of a column, or None if a file is missing or its checksum differs."""
+    arrays = {}
+    for part, checksum in column["sha256"].items():
+        file = directory / f"{name}.{part}.npy"
+        try:
+            if file_sha256(file) != checksum:
+                return None
+            arrays[part] = np.load(file, allow_pickle=False)
+        except (OSError, ValueError):
+            return None
+    return arrays
+
+
+def load_dataset(path: str, source: str, columns: list[str] = None) -> DataFrame:
+    """Load documents saved by save_dataset(), or None if missing, stale or corrupt.
+
+    Only the files of the requested columns (all by default) are read and
+    verified against their checksums.
+    """
+    directory = Path(path)
+    try:
+        with open(directory / "manifest.json") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get("version") != CACHE_VERSION or manifest.get("source") != source_version(source):
+        return None
+    names = [name for name in manifest["columns"] if name != "__index__"]
+    if columns is not None:
+        if not set(columns) <= set(names):
+            return None
+        names = [name for name in names if name in columns]
+    data = {}
+    with gc_paused():
+        for name in ["__index__", *names]:
+            column = manifest["columns"][name]
+            arrays = read_column(directory, name, column)
+            if arrays is None:
+                return None
+            data[name] = decode_column(arrays, column["kind"])
+    index = data.pop("__index__")
+    return DataFrame(data, index=index, columns=names)
+
+
+def save_arrays(directory: Path, arrays: dict[str, np.ndarray], manifest: dict) -> Path:
+    """Write the arrays to directory as .npy files, with the manifest they were built from."""
+    tmp_directory = directory.with_name(f"{directory.name}.tmp")
+    shutil.rmtree(tmp_directory, ignore_errors=True)
+    tmp_directory.mkdir(parents=True)
+    for name, array in arrays.items():
+        np.save(tmp_directory / f"{name}.npy", array, allow_pickle=False)
+    # The manifest is written last, arrays without it are never loaded
+    with open(tmp_directory / "manifest.json", "w") as f:
+        json.dump({"arrays": list(arrays), "manifest": manifest}, f)
+    shutil.rmtree(directory, ignore_errors=True)
+    tmp_directory.rename(directory)
+    return directory
+
+
+def load_arrays(directory: Path, manifest: dict) -> dict[str, np.ndarray]:
+    """Arrays saved by save_arrays() with an equal manifest, memory-mapped read-only,
+    or None if they are missing or stale."""
+    try:
+        with open(directory / "manifest.json") as f:
+            saved = json.load(f)
+        if saved["manifest"] != json.loads(json.dumps(manifest)):
+            return None
+        return {
+            name: np.load(directory / f"{name}.npy", mmap_mode="r", allow_pickle=False)
+            for name in saved["arrays"]
+        }
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+if __name__ == "__main__":
+    # Explicit refresh of the local copy from the dataset source
+    from app.config import Config
+    from app.utils import load_documents
+
+    documents = load_documents(refresh=True)
+    print(f"Cached {len(documents)} movies from {Config.dataset_path} "
+          f"in {Config.dataset_cache_dir}")
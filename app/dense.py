@@ -0,0 +1,243 @@
+import numpy as np
+
+from pathlib import Path
+
+from app.dataset import load_arrays, save_arrays
+
+
+# Upper bound on the postings x dimensions products held at once by csr_matmul
+MAX_PRODUCTS = 1 << 24
+# Rows of the document vectors scored at once
+BLOCK_ROWS = 1 << 16
+# Arrays of a DenseIndex, those not used by its configuration are None
+DENSE_ARRAYS = ["vectors", "projection", "scales", "centroids", "doc_ids", "list_ptr"]
+
+
+def csr_matmul(indptr: np.ndarray,
+               columns: np.ndarray,
+               weights: np.ndarray,
+               dense: np.ndarray) -> np.ndarray:
+    """Product of a CSR matrix, row r being columns/weights[indptr[r]:indptr[r + 1]], and dense."""
+    n_rows, dims = len(indptr) - 1, dense.shape[1]
+    out = np.zeros((n_rows, dims), dtype=np.float32)
+    max_postings = max(1, MAX_PRODUCTS // dims)
+    start = 0
+    while start < n_rows:
+        stop = int(np.searchsorted(indptr, indptr[start] + max_postings, side="right")) - 1
+        stop = min(max(stop, start + 1), n_rows)
+        rows = start + np.flatnonzero(np.diff(indptr[start:stop + 1]))
+        if len(rows):
+            first = indptr[start]
+            products = weights[first:indptr[stop], None] * dense[columns[first:indptr[stop]]]
+            # Empty rows have no postings, so each sum ends where the next non-empty row starts
+            out[rows] = np.add.reduceat(products, indptr[rows] - first)
+        start = stop
+    return out
+
+
+def transpose_csr(indptr: np.ndarray,
+                  columns: np.ndarray,
+                  weights: np.ndarray,
+                  n_columns: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    rows = np.repeat(np.arange(len(indptr) - 1, dtype=np.int32), np.diff(indptr))
+    order = np.argsort(columns, kind="stable")
+    transposed_indptr = np.zeros(n_columns + 1, dtype=np.int64)
+    np.cumsum(np.bincount(columns, minlength=n_columns), out=transposed_indptr[1:])
+    return transposed_indptr, rows[order], weights[order]
+
+
+def orthonormal(matrix: np.ndarray) -> np.ndarray:
+    return np.linalg.qr(matrix)[0]
+
+
+def randomized_svd(term_postings: tuple[np.ndarray, np.ndarray, np.ndarray],
+                   n_documents: int,
+                   dims: int,
+                   n_oversamples: int = 10,
+                   n_iter: int = 2,
+                   seed: int = 0) -> tuple[np.ndarray, np.ndarray]:
+    """Document vectors U * S and term projection V of the rank dims SVD of the
+    documents x terms matrix X, whose transpose is the term_postings CSR.
+
+    Halko et al. randomized range finder with n_iter power iterations.
+    """
+    term_indptr, doc_ids, weights = term_postings
+    n_terms = len(term_indptr) - 1
+    doc_postings = transpose_csr(term_indptr, doc_ids, weights, n_documents)
+    width = min(dims + n_oversamples, n_documents, n_terms)
+    rng = np.random.default_rng(seed)
+    omega = rng.standard_normal((n_terms, width), dtype=np.float32)
+    q = orthonormal(csr_matmul(*doc_postings, omega))
+    for _ in range(n_iter):
+        q = orthonormal(csr_matmul(*doc_postings, orthonormal(csr_matmul(*term_postings, q))))
+    # B = Q^T X is small, its SVD gives the one of X
+    u, s, vt = np.linalg.svd(csr_matmul(*term_postings, q).T, full_matrices=False)
+    dims = min(dims, width)
+    return (q @ u[:, :dims]) * s[:dims], np.ascontiguousarray(vt[:dims].T, dtype=np.float32)
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return (matrix / norms).astype(np.float32)
+
+
+def kmeans(vectors: np.ndarray, n_lists: int, n_iter: int = 10, seed: int = 0) -> np.ndarray:
+    """Centroids of a spherical k-means trained on a sample of the vectors."""
+    rng = np.random.default_rng(seed)
+    sample = vectors[rng.choice(len(vectors), min(len(vectors), 256 * n_lists), replace=False)]
+    centroids = sample[rng.choice(len(sample), n_lists, replace=False)]
+    for _ in range(n_iter):
+        assignment = np.argmax(sample @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, sample)
+        # Empty lists keep their centroid
+        empty = np.bincount(assignment, minlength=n_lists) == 0
+        sums[empty] = centroids[empty]
+        centroids = normalize_rows(sums)
+    return centroids
+
+
+def reciprocal_rank_fusion(rankings: list[list[str]],
+                           k: int,
+                           rrf_k: int = 60) -> list[tuple[str, float]]:
+    """k best items by the sum of 1 / (rrf_k + rank) over the rankings, ties by first seen."""
+    scores: dict[str, float] = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, 1):
+            scores[item] = scores.get(item, 0.0) + 1 / (rrf_k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+
+class DenseIndex:
+    """LSA vectors of the documents, searched by cosine similarity.
+
+    The vectors are the rows of the truncated SVD of the BM25 weighted
+    documents x terms matrix, a query is embedded by projecting the weights of
+    its terms. They are stored as float32, or int8 with a scale per document
+    when quantized. With n_lists, documents are grouped by their nearest
+    k-means centroid (an IVF index) and a search only scores the n_probe
+    groups closest to the query instead of every document.
+    """
+
+    def __init__(self,
+                 vectors: np.ndarray,
+                 projection: np.ndarray,
+                 quantize: bool = False,
+                 n_lists: int = 0,
+                 n_probe: int = 8,
+                 seed: int = 0):
+        vectors = normalize_rows(vectors)
+        self.projection = projection
+        self.n_probe = n_probe
+        self.centroids = None
+        # Row of the stored vectors -> document id, None when they are in document order
+        self.doc_ids = None
+        self.list_ptr = None
+        if n_lists:
+            self.centroids = kmeans(vectors, min(n_lists, len(vectors)), seed=seed)
+            assignment = np.concatenate([
+                np.argmax(vectors[start:start + BLOCK_ROWS] @ self.centroids.T, axis=1)
+                for start in range(0, len(vectors), BLOCK_ROWS)
+            ])
+            self.doc_ids = np.argsort(assignment, kind="stable").astype(np.int32)
+            vectors = vectors[self.doc_ids]
+            self.list_ptr = np.zeros(len(self.centroids) + 1, dtype=np.int64)
+            np.cumsum(np.bincount(assignment, minlength=len(self.centroids)),
+                      out=self.list_ptr[1:])
+        self.scales = None
+        if quantize:
+            self.scales = np.abs(vectors).max(axis=1) / 127
+            self.scales[self.scales == 0] = 1
+            vectors = np.round(vectors / self.scales[:, None]).astype(np.int8)
+        self.vectors = vectors
+
+    @classmethod
+    def build(cls,
+              term_postings: tuple[np.ndarray, np.ndarray, np.ndarray],
+              n_documents: int,
+              dims: int = 128,
+              **kwargs) -> "DenseIndex":
+        vectors, projection = randomized_svd(term_postings, n_documents, dims)
+        return cls(vectors, projection, **kwargs)
+
+    def save(self, directory: Path, parameters: dict) -> Path:
+        """Write the index to directory, with the parameters it was built with."""
+        arrays = {name: getattr(self, name) for name in DENSE_ARRAYS}
+        return save_arrays(
+            directory, {name: array for name, array in arrays.items() if array is not None},
+            parameters,
+        )
+
+    @classmethod
+    def load(cls, directory: Path, parameters: dict, n_probe: int = 8) -> "DenseIndex":
+        """Memory-mapped index saved by save() with the same parameters, or None."""
+        arrays = load_arrays(directory, parameters)
+        if arrays is None:
+            return None
+        index = cls.__new__(cls)
+        for name in DENSE_ARRAYS:
+            setattr(index, name, arrays.get(name))
+        index.n_probe = n_probe
+        return index
+
+    def __len__(self) -> int:
+        return len(self.vectors)
+
+    @property
+    def nbytes(self) -> int:
+        arrays = [self.vectors, self.projection, self.scales, self.centroids, self.doc_ids,
+                  self.list_ptr]
+        return sum(array.nbytes for array in arrays if array is not None)
+
+    def embed(self, term_ids: list[int], weights: list[float]) -> np.ndarray:
+        vector = np.asarray(weights, dtype=np.float32) @ self.projection[term_ids]
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _scores(self, start: int, stop: int, queries: np.ndarray) -> np.ndarray:
+        if self.scales is None:
+            return self.vectors[start:stop] @ queries.T
+        return (self.vectors[start:stop].astype(np.float32) @ queries.T) * \
+            self.scales[start:stop, None]
+
+    def search(self, queries: np.ndarray, k: int) -> tuple[list[np.ndarray], list[np.ndarray]]:
+        """Document ids and scores of the k best documents of each query vector."""
+        if len(self.vectors) == 0:
+            empty = np.empty(0, dtype=np.int64)
+            return [empty] * len(queries), [empty.astype(np.float32)] * len(queries)
+        if self.centroids is not None:
+            results = [self._search_lists(query, k) for query in queries]
+            return [ids for ids, _ in results], [scores for _, scores in results]
+        block_rows, block_scores = [], []
+        for start in range(0, len(self.vectors), BLOCK_ROWS):
+            scores = self._scores(start, min(start + BLOCK_ROWS, len(self.vectors)), queries)
+            top = top_rows(scores, k)
+            block_rows.append(start + top)
+            block_scores.append(np.take_along_axis(scores, top, axis=0))
+        rows, scores = np.concatenate(block_rows), np.concatenate(block_scores)
+        best = top_rows(scores, k)
+        ids = np.take_along_axis(rows, best, axis=0).T
+        return list(ids), list(np.take_along_axis(scores, best, axis=0).T)
+
+    def _search_lists(self, query: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+        probe = top_rows(self.centroids @ query[:, None], self.n_probe)[:, 0]
+        rows = np.concatenate([
+            np.arange(self.list_ptr[i], self.list_ptr[i + 1]) for i in probe.tolist()
+        ])
+        if self.scales is None:
+            scores = self.vectors[rows] @ query
+        else:
+            scores = (self.vectors[rows].astype(np.float32) @ query) * self.scales[rows]
+        best = top_rows(scores[:, None], k)[:, 0]
+        return self.doc_ids[rows[best]], scores[best]
+
+
+def top_rows(scores: np.ndarray, k: int) -> np.ndarray:
+    """Rows of the k highest scores of each column, best first."""
+    if k < len(scores):
+        top = np.argpartition(-scores, k - 1, axis=0)[:k]
+    else:
+        top = np.broadcast_to(np.arange(len(scores))[:, None], scores.shape)
+    order = np.argsort(-np.take_along_axis(scores, top, axis=0), axis=0, kind="stable")
+    return np.take_along_axis(top, order, axis=0)
@@ -0,0 +1,72 @@
+import asyncio
+import contextvars
+
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Hashable
+
+
+class SaturatedError(Exception):
+    pass
+
+
+class SearchExecutor:
+    """Runs blocking search calls off the event loop on a bounded pool.
+
+    At most max_pending calls are queued or running, beyond that run() raises
+    SaturatedError. Calls with the same key made while one is in flight
+    wait for its result instead of computing it again (single-flight).
+    The "inline" kind runs calls directly on the event loop, as a baseline.
+    Must be used from a single event loop.
+    """
+
+    def __init__(self,
+                 workers: int = 4,
+                 max_pending: int = 64,
+                 kind: str = "thread",
+                 initializer: Callable = None):
+        self.max_pending = max_pending
+        self.kind = kind
+        if kind == "inline":
+            self._executor: Executor = None
+        elif kind == "process":
+            self._executor = ProcessPoolExecutor(workers, initializer=initializer)
+        else:
+            self._executor = ThreadPoolExecutor(workers, thread_name_prefix="search")
+        self._in_flight: dict[Hashable, asyncio.Future] = {}
+        self.coalesced = 0
+        self.rejected = 0
+
+    @property
+    def pending(self) -> int:
+        return len(self._in_flight)
+
+    async def run(self, key: Hashable, func: Callable, *args):
+        if self._executor is None:
+            return func(*args)
+        future = self._in_flight.get(key)
+        if future is not None:
+            self.coalesced += 1
+        else:
+            if self.pending >= self.max_pending:
+                self.rejected += 1
+                raise SaturatedError(f"{self.pending} searches pending")
+            loop = asyncio.get_running_loop()
+            if self.kind == "thread":
+                # The request context (such as its stage timings) follows it to the thread
+                func, args = contextvars.copy_context().run, (func, *args)
+            future = loop.run_in_executor(self._executor, func, *args)
+            self._in_flight[key] = future
+            future.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        # A cancelled request must not cancel the computation others wait for
+        return await asyncio.shield(future)
+
+    def stats(self) -> dict:
+        return {
+            "pending": self.pending,
+            "coalesced": self.coalesced,
+            "rejected": self.rejected,
+        }
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
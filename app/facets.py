@@ -0,0 +1,164 @@
+import numpy as np
+
+from collections import Counter
+from dataclasses import dataclass, replace
+from datetime import date
+
+from pandas import DataFrame, Series, to_datetime, to_numeric
+
+
+NUMERIC_FACETS = ["release_date", "budget", "box_office", "profit"]
+
+
+@dataclass
+class MovieFilters:
+    tags: list[str] = None
+    genres: list[str] = None
+    min_release_date: date = None
+    max_release_date: date = None
+    min_budget: float = None
+    max_budget: float = None
+    min_box_office: float = None
+    max_box_office: float = None
+    min_profit: float = None
+    max_profit: float = None
+    sort_by: str = None
+    sort_order: str = "descending"
+    limit: int = None
+
+    def ranges(self) -> list[tuple[str, float, float]]:
+        bounds = [
+            ("release_date", days(self.min_release_date), days(self.max_release_date)),
+            ("budget", self.min_budget, self.max_budget),
+            ("box_office", self.min_box_office, self.max_box_office),
+            ("profit", self.min_profit, self.max_profit),
+        ]
+        return [(column, low, high) for column, low, high in bounds
+                if low is not None or high is not None]
+
+    def key(self) -> tuple:
+        """Hashable form of the filters, tags and genres are order-insensitive."""
+        return (
+            tuple(sorted(set(self.tags or []))),
+            tuple(sorted(set(self.genres or []))),
+            tuple(self.ranges()),
+            self.sort_by,
+            self.sort_order if self.sort_by else None,
+            self.limit,
+        )
+
+    def is_empty(self, show_all: bool = False) -> bool:
+        """No filter, limit nor sort. Show all movies are in release order, which a
+        descending relevancy sort keeps, so for them it counts as no sort."""
+        filters = self
+        if show_all and self.sort_by == "relevancy" and self.sort_order == "descending":
+            filters = replace(self, sort_by=None)
+        return filters.key() == MovieFilters().key()
+
+
+def days(value: date) -> int:
+    if value is None:
+        return None
+    return int(np.datetime64(value, "D").astype(np.int64))
+
+
+class SortedColumn:
+    def __init__(self, values: np.ndarray):
+        # NaN values are sorted last and never match a range
+        self.order = np.argsort(values, kind="stable")
+        self.values = values[self.order]
+        self.n_values = int(np.searchsorted(self.values, np.inf, side="right"))
+
+    def between(self, low: float = None, high: float = None) -> np.ndarray:
+        start = 0 if low is None else np.searchsorted(self.values, low, side="left")
+        end = self.n_values if high is None else np.searchsorted(self.values, high, side="right")
+        return self.order[start:end]
+
+
+class FacetIndex:
+    """Bitmaps and sorted columns over the rows of the movies DataFrame.
+
+    Each tag and genre maps to a bitset of the rows having it (packed with
+    np.packbits), and the numeric columns are kept sorted so range filters
+    are two binary searches.
+    """
+
+    # Columns of the movies DataFrame read by the index
+    COLUMNS = ["url", "tags", "genre", "release_date", "budget", "box_office", "profit"]
+
+    def __init__(self, documents: DataFrame):
+        self.n_rows = len(documents)
+        self.row_of_url = {url: row for row, url in enumerate(documents["url"])}
+        self.tags = self._list_bitmaps(documents["tags"])
+        self.genres = self._list_bitmaps(documents["genre"])
+        release_days = to_datetime(documents["release_date"], errors="coerce")
+        numeric = {
+            "release_date": release_days.values.astype("datetime64[D]").astype(np.float64),
+            "budget": to_numeric(documents["budget"], errors="coerce").to_numpy(np.float64),
+            "box_office": to_numeric(documents["box_office"], errors="coerce").to_numpy(np.float64),
+            "profit": to_numeric(documents["profit"], errors="coerce").to_numpy(np.float64),
+        }
+        numeric["release_date"][release_days.isna().values] = np.nan
+        self.columns = {name: SortedColumn(values) for name, values in numeric.items()}
+        self.empty = np.packbits(np.zeros(self.n_rows, dtype=bool))
+
+    def _list_bitmaps(self, column: Series) -> dict[str, np.ndarray]:
+        rows: dict[str, list[int]] = {}
+        for row, values in enumerate(column):
+            for value in values:
+                rows.setdefault(value, []).append(row)
+        return {value: self.bitmap(value_rows) for value, value_rows in rows.items()}
+
+    def bitmap(self, rows) -> np.ndarray:
+        mask = np.zeros(self.n_rows, dtype=bool)
+        mask[np.asarray(rows, dtype=np.int64)] = True
+        return np.packbits(mask)
+
+    def rows(self, bitmap: np.ndarray) -> np.ndarray:
+        return np.flatnonzero(np.unpackbits(bitmap, count=self.n_rows))
+
+    def tag(self, tag: str) -> np.ndarray:
+        return self.tags.get(tag, self.empty)
+
+    def urls(self, urls) -> np.ndarray:
+        return self.bitmap([self.row_of_url[url] for url in urls if url in self.row_of_url])
+
+    def select(self, filters: MovieFilters) -> np.ndarray:
+        """Bitmap of the rows matching all filters, None when nothing is filtered."""
+        selections = [self.tags.get(tag, self.empty) for tag in filters.tags or []]
+        selections += [self.genres.get(genre, self.empty) for genre in filters.genres or []]
+        selections += [
+            self.bitmap(self.columns[column].between(low, high))
+            for column, low, high in filters.ranges()
+        ]
+        if not selections:
+            return None
+        return np.bitwise_and.reduce(selections)
+
+
+class TagSampler:
+    """Tags by number of occurrences, listed in a random order weighted by their count squared.
+
+    The tags are sorted by count once, so the tags occurring at least n times
+    are a prefix found by binary search. Each call orders that prefix as a
+    weighted sample without replacement (Efraimidis and Spirakis): a tag
+    gets an exponential key of rate its weight and the tags are sorted by
+    key, which only touches the tags returned.
+    """
+
+    def __init__(self, tags: Series, seed: int = None):
+        counts = Counter(tag for movie_tags in tags for tag in movie_tags if tag != "")
+        ordered = counts.most_common()
+        self.tags = np.array([tag for tag, _ in ordered], dtype=object)
+        self.counts = np.array([count for _, count in ordered], dtype=np.int64)
+        self.weights = self.counts.astype(np.float64) ** 2
+        self.rng = np.random.default_rng(seed)
+
+    def n_eligible(self, min_count: int) -> int:
+        return int(np.searchsorted(-self.counts, -min_count, side="right"))
+
+    def sample(self, min_count: int) -> list[str]:
+        """The tags occurring at least min_count times, heavier tags more likely first."""
+        n = self.n_eligible(min_count)
+        keys = self.rng.standard_exponential(n) / self.weights[:n]
+        return self.tags[np.argsort(keys)].tolist()
@@ -0,0 +1,117 @@
+import numpy as np
+
+from itertools import repeat
+
+
+def deletes(word: str, max_distance: int) -> set[str]:
+    """The word and every string obtained by deleting up to max_distance of its characters."""
+    results = {word}
+    frontier = {word}
+    for _ in range(max_distance):
+        frontier = {w[:i] + w[i + 1:] for w in frontier for i in range(len(w))}
+        results |= frontier
+    return results
+
+
+def allowed_distance(word: str, max_distance: int) -> int:
+    """Edits allowed for a word: none up to 3 characters, one up to 6, then max_distance.
+
+    Two edits on a short word match too many unrelated terms.
+    """
+    return min(max_distance, (len(word) - 1) // 3)
+
+
+def edit_distance(a: str, b: str, max_distance: int) -> int:
+    """Optimal string alignment distance (Levenshtein with adjacent transpositions).
+
+    Returns max_distance + 1 as soon as the distance is known to exceed max_distance.
+    """
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    before_previous = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            current[j] = min(previous[j] + 1, current[j - 1] + 1,
+                             previous[j - 1] + (a[i - 1] != b[j - 1]))
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], before_previous[j - 2] + 1)
+        if min(current) > max_distance:
+            return max_distance + 1
+        before_previous, previous = previous, current
+    return min(previous[-1], max_distance + 1)
+
+
+class SymmetricDeleteIndex:
+    """Terms within max_distance edits of a word, found without scanning the terms.
+
+    Every term is stored under the hashes of its deletes (see deletes()), two
+    strings within max_distance edits share a delete. A lookup searches the
+    deletes of the word in the sorted hashes and verifies the candidates with
+    edit_distance. As in SymSpell, the deletes are taken on the first
+    prefix_length characters only, which bounds their number for long terms.
+    Hashes are those of the running process, the index is not persisted.
+    """
+
+    def __init__(self, terms: list[str], max_distance: int = 2, prefix_length: int = 7):
+        self.terms = terms
+        self.max_distance = max_distance
+        self.prefix_length = prefix_length
+        hashes, term_ids = [], []
+        for term_id, term in enumerate(terms):
+            term_deletes = deletes(term[:prefix_length], max_distance)
+            hashes.extend(map(hash, term_deletes))
+            term_ids.extend(repeat(term_id, len(term_deletes)))
+        hashes = np.fromiter(hashes, dtype=np.int64, count=len(hashes))
+        order = np.argsort(hashes, kind="stable")
+        self.hashes = hashes[order]
+        self.term_ids = np.array(term_ids, dtype=np.int32)[order]
+        self.lengths = np.fromiter(map(len, terms), dtype=np.int32, count=len(terms))
+
+    @property
+    def nbytes(self) -> int:
+        return self.hashes.nbytes + self.term_ids.nbytes + self.lengths.nbytes
+
+    def lookup(self, word: str, max_distance: int = None) -> list[tuple[int, int]]:
+        """(term id, distance) of the terms within max_distance edits, closest first."""
+        if max_distance is None or max_distance > self.max_distance:
+            max_distance = self.max_distance
+        word_deletes = deletes(word[:self.prefix_length], max_distance)
+        query = np.fromiter(map(hash, word_deletes), dtype=np.int64, count=len(word_deletes))
+        starts = np.searchsorted(self.hashes, query, side="left")
+        stops = np.searchsorted(self.hashes, query, side="right")
+        found = [self.term_ids[start:stop] for start, stop in zip(starts, stops) if stop > start]
+        if not found:
+            return []
+        candidates = np.unique(np.concatenate(found))
+        # Terms longer or shorter by more than max_distance cannot match
+        candidates = candidates[np.abs(self.lengths[candidates] - len(word)) <= max_distance]
+        matches = []
+        for term_id in candidates.tolist():
+            distance = edit_distance(word, self.terms[term_id], max_distance)
+            if distance <= max_distance:
+                matches.append((term_id, distance))
+        return sorted(matches, key=lambda match: match[1])
+
+
+class WordCorrector:
+    """Closest word within max_distance edits of a misspelled word, the closest word of
+    the highest frequency winning."""
+
+    def __init__(self, words: list[str], frequencies: list[int], max_distance: int = 2):
+        self.index = SymmetricDeleteIndex(words, max_distance)
+        self.frequencies = np.array(frequencies, dtype=np.int64)
+
+    def correct(self, word: str) -> tuple[str, int]:
+        """Closest word and its edit distance, (None, 0) if none."""
+        max_distance = allowed_distance(word, self.index.max_distance)
+        if max_distance == 0:
+            return None, 0
+        matches = self.index.lookup(word, max_distance)
+        if not matches:
+            return None, 0
+        word_id, distance = min(matches, key=lambda match: (
+            match[1], -self.frequencies[match[0]], match[0]
+        ))
+        return self.index.terms[word_id], distance
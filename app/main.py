@@ -1,27 +1,80 @@
+import asyncio
+import hmac
+import logging
 import os
 import uvicorn
 
 from contextlib import asynccontextmanager
-from fastapi import FastAPI
+from datetime import date
+from typing import Literal
+
+from fastapi import Depends, FastAPI, Header, HTTPException, Query, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.requests import Request
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
+from pydantic import BaseModel, Field
 
 from app.config import Config
+from app.executor import SaturatedError, SearchExecutor
+from app.facets import MovieFilters
+from app.metrics import Gauge, registry, stage, TimingMiddleware
+from app.responses import (
+    content_encoding,
+    decode_cursor,
+    encode_cursor,
+    etag_matches,
+    movies_response,
+    strong_etag,
+)
 from app.utils import (
+    close_search_state,
     common_tags,
-    get_search_engine,
+    fetch_batch_results,
+    fetch_query_results,
+    get_response_cache,
+    get_search_state,
+    get_suggester,
+    is_reloading,
+    load_search_state,
+    reload_search_state,
     response_search_movie,
-    topk_documents,
+    SearchState,
 )
+from app.watcher import FileWatcher
+
+
+logger = logging.getLogger(__name__)
+
+
+# Searches are CPU bound, they run here so the event loop stays responsive
+search_executor = SearchExecutor(
+    workers=Config.search_workers,
+    max_pending=Config.search_max_pending,
+    kind=Config.search_executor,
+    initializer=load_search_state,
+)
+
+
+# Background reload started by the admin endpoint
+_reload: asyncio.Future = None
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup logic: Load the documents and create the search engine
-    get_search_engine()
+    load_search_state()
+    watcher = None
+    if Config.watch_dataset and os.path.isfile(Config.dataset_path):
+        watcher = FileWatcher(Config.dataset_path, reload_search_state, Config.watch_interval)
+        watcher.start()
     yield
+    if watcher is not None:
+        watcher.stop()
+    search_executor.shutdown()
+    close_search_state()
 
 app = FastAPI(lifespan=lifespan)
 
@@ -34,35 +87,238 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+app.add_middleware(GZipMiddleware, minimum_size=1000, compresslevel=6)
+
+# Outermost, so the Server-Timing total covers the other middlewares
+if Config.metrics_enabled:
+    app.add_middleware(TimingMiddleware)
+
 app.mount("/static", StaticFiles(directory="app/static"), name="static")
 templates = Jinja2Templates(directory="app/templates")
 
 
+@app.exception_handler(SaturatedError)
+async def saturated_handler(request: Request, exc: SaturatedError):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Too many searches in progress, retry shortly"},
+        headers={"Retry-After": "1"},
+    )
+
+
 @app.get("/")
 async def read_root(request: Request):
     return templates.TemplateResponse("index.html", {"request": request})
 
 
+Retrieval = Literal["bm25", "dense", "hybrid"]
+
+
+def check_retrieval(retrieval: Retrieval, state: SearchState) -> None:
+    if retrieval != "bm25" and state.dense_index is None:
+        raise HTTPException(status_code=400, detail="Dense retrieval is disabled")
+
+
 @app.get("/get_topk_documents")
-async def get_topk_documents(query: str, k: int) -> dict:
-    engine = get_search_engine()
-    query_results = engine.search(query)
-    results = topk_documents(query_results, k=k)
+async def get_topk_documents(query: str, k: int, retrieval: Retrieval = Config.retrieval) -> dict:
+    state = get_search_state()
+    check_retrieval(retrieval, state)
+    results = await search_executor.run(
+        ("topk", query, k, retrieval), fetch_query_results, query, k, False, None, retrieval
+    )
     return {"result": results if results else "Not found"}
 
 
+class BatchSearch(BaseModel):
+    queries: list[str] = Field(min_length=1, max_length=Config.batch_max_queries)
+    k: int = Field(Config.k, gt=0)
+
+
+@app.post("/search/batch")
+async def search_batch(batch: BatchSearch) -> dict:
+    results = await search_executor.run(
+        ("batch", tuple(batch.queries), batch.k), fetch_batch_results, batch.queries, batch.k
+    )
+    return {"results": results}
+
+
 @app.get("/fetch_common_tags")
 async def fetch_common_tags(tags_n_occurences: int = Config.tags_n_occurences):
     tags = common_tags(tags_n_occurences=tags_n_occurences)
     return {"tags": tags}
 
 
+@app.get("/similar/{movie_id}")
+async def similar_movies(request: Request, movie_id: str, n: int = Query(None, gt=0)):
+    state = get_search_state()
+    if state.similar_movies is None:
+        raise HTTPException(status_code=400, detail="Similar movies are disabled")
+    encoding = content_encoding(request.headers.get("accept-encoding", ""))
+    headers = {"ETag": strong_etag(state.generation, ("similar", movie_id, n), encoding)}
+    if etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    # Precomputed, answered on the event loop
+    with stage("similar"):
+        try:
+            ranked = state.similar_movies.similar(movie_id, n)
+        except KeyError:
+            raise HTTPException(status_code=404, detail="Movie not found")
+    with stage("render"):
+        return movies_response(state.record_store, ranked or None, headers, encoding)
+
+
+@app.get("/suggest")
+async def suggest(prefix: str, limit: int = Query(Config.suggest_limit, gt=0)):
+    # Fast enough to answer on the event loop, without the executor round-trip
+    with stage("suggest"):
+        return get_suggester().suggest(prefix, limit)
+
+
+def movie_filters(
+    tags: list[str] = Query(None),
+    genres: list[str] = Query(None),
+    min_release_date: date = None,
+    max_release_date: date = None,
+    min_budget: float = None,
+    max_budget: float = None,
+    min_box_office: float = None,
+    max_box_office: float = None,
+    min_profit: float = None,
+    max_profit: float = None,
+    sort_by: Literal["relevancy", "release_date", "budget", "box_office", "profit"] = None,
+    sort_order: Literal["ascending", "descending"] = "descending",
+    limit: int = Query(None, gt=0),
+) -> MovieFilters:
+    return MovieFilters(
+        tags=tags,
+        genres=genres,
+        min_release_date=min_release_date,
+        max_release_date=max_release_date,
+        min_budget=min_budget,
+        max_budget=max_budget,
+        min_box_office=min_box_office,
+        max_box_office=max_box_office,
+        min_profit=min_profit,
+        max_profit=max_profit,
+        sort_by=sort_by,
+        sort_order=sort_order,
+        limit=limit,
+    )
+
+
 @app.get("/search_disney_movie")
-async def search_movie(query: str, is_tag: bool, k: int = Config.k) -> list[dict]:
-    response = response_search_movie(query=query, is_tag=is_tag, k=Config.k)
-    if not response:
-        return [{"result": "Not found"}]
-    return response
+async def search_movie(request: Request,
+                       query: str,
+                       is_tag: bool,
+                       k: int = Config.k,
+                       filters: MovieFilters = Depends(movie_filters),
+                       cursor: str = None,
+                       page_size: int = Query(None, gt=0),
+                       output: Literal["json", "ndjson"] = Query("json", alias="format"),
+                       retrieval: Retrieval = Config.retrieval):
+    state = get_search_state()
+    check_retrieval(retrieval, state)
+    generation = state.generation
+    encoding = content_encoding(request.headers.get("accept-encoding", ""))
+    request_key = (query, is_tag, k, filters.key(), cursor, page_size, output, retrieval)
+    headers = {"ETag": strong_etag(generation, request_key, encoding)}
+    if etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    start = 0 if cursor is None else decode_cursor(cursor, generation)
+
+    # Worker processes search their own copy of the state
+    shared_state = None if search_executor.kind == "process" else state
+    ranked = await search_executor.run(
+        ("movies", generation, query, is_tag, k, filters.key(), retrieval),
+        response_search_movie, query, is_tag, k, filters, shared_state, retrieval,
+    )
+    if ranked is not None and (page_size or start):
+        stop = len(ranked) if page_size is None else start + page_size
+        if stop < len(ranked):
+            headers["X-Next-Cursor"] = encode_cursor(generation, stop)
+        ranked = ranked.page(start, stop)
+    with stage("render"):
+        return movies_response(
+            state.record_store, ranked, headers, encoding, ndjson=output == "ndjson"
+        )
+
+
+@app.get("/cache_stats")
+async def cache_stats():
+    return {**get_response_cache().stats(), "executor": search_executor.stats()}
+
+
+def register_gauges() -> None:
+    def cache_stat(name: str):
+        return lambda: get_response_cache().stats()[name]
+
+    def executor_stat(name: str):
+        return lambda: search_executor.stats()[name]
+
+    for name, help, func, kind in [
+        ("search_index_documents", "Indexed movies", lambda: len(get_search_state().documents),
+         "gauge"),
+        ("search_index_generation", "Generation of the served index",
+         lambda: get_search_state().generation, "gauge"),
+        ("search_index_build_seconds", "Time taken to build the served search state",
+         lambda: get_search_state().build_seconds, "gauge"),
+        ("dense_index_bytes", "Memory of the dense retrieval index",
+         lambda: getattr(get_search_state().dense_index, "nbytes", None), "gauge"),
+        ("similar_movies_bytes", "Memory of the similar movies neighbor lists",
+         lambda: getattr(get_search_state().similar_movies, "nbytes", None), "gauge"),
+        ("suggest_index_bytes", "Memory of the autocomplete prefix index",
+         lambda: get_suggester().nbytes, "gauge"),
+        ("response_cache_hits_total", "Response cache hits", cache_stat("hits"), "counter"),
+        ("response_cache_misses_total", "Response cache misses", cache_stat("misses"), "counter"),
+        ("response_cache_evictions_total", "Response cache evictions", cache_stat("evictions"),
+         "counter"),
+        ("response_cache_entries", "Responses cached", cache_stat("entries"), "gauge"),
+        ("response_cache_bytes", "Bytes of the cached responses", cache_stat("bytes"), "gauge"),
+        ("search_executor_pending", "Searches queued or running", executor_stat("pending"),
+         "gauge"),
+        ("search_executor_coalesced_total", "Searches that waited for an identical one",
+         executor_stat("coalesced"), "counter"),
+        ("search_executor_rejected_total", "Searches rejected with a 503",
+         executor_stat("rejected"), "counter"),
+    ]:
+        registry.register(Gauge(name, help, func, kind=kind))
+
+
+register_gauges()
+
+
+@app.get("/metrics")
+async def metrics():
+    if not Config.metrics_enabled:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+
+def check_admin_token(x_admin_token: str = Header(None)) -> None:
+    if not Config.admin_token:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled")
+    if not hmac.compare_digest(x_admin_token or "", Config.admin_token):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+
+def log_reload_failure(reload: asyncio.Future) -> None:
+    if not reload.cancelled() and reload.exception() is not None:
+        logger.error(f"Reload failed: {reload.exception()!r}")
+
+
+@app.post("/admin/reload", dependencies=[Depends(check_admin_token)])
+async def admin_reload(wait: bool = False):
+    global _reload
+    if search_executor.kind == "process":
+        raise HTTPException(status_code=409, detail="Reloading needs the thread search executor")
+    if is_reloading() or _reload is not None and not _reload.done():
+        raise HTTPException(status_code=409, detail="A reload is already running")
+    _reload = asyncio.get_running_loop().run_in_executor(None, reload_search_state)
+    _reload.add_done_callback(log_reload_failure)
+    if not wait:
+        return JSONResponse(status_code=202, content={"status": "reloading"})
+    state = await _reload
+    return {"status": "reloaded", "generation": state.generation, "movies": len(state.documents)}
 
 
 @app.get("/status")
@@ -0,0 +1,211 @@
+import threading
+import time
+
+from bisect import bisect_left
+from contextlib import nullcontext
+from contextvars import ContextVar
+from typing import Callable
+
+from app.config import Config
+
+
+# Latency buckets in seconds, from 100µs to 10s
+LATENCY_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 10,
+)
+
+# Stage -> seconds of the current request, read by TimingMiddleware for Server-Timing
+_request_timings: ContextVar[dict[str, float]] = ContextVar("request_timings", default=None)
+_noop = nullcontext()
+
+
+def format_labels(names: tuple[str, ...], values: tuple, **extra) -> str:
+    pairs = [*zip(names, values), *extra.items()]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in pairs) + "}"
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount: float = 1) -> None:
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def samples(self) -> list[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return [f"{self.name}{format_labels(self.labels, key)} {value}" for key, value in values]
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self,
+                 name: str,
+                 help: str,
+                 labels: tuple[str, ...] = (),
+                 buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        # labels -> [count per bucket (+Inf last), sum]
+        self._series: dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values) -> None:
+        bucket = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][bucket] += 1
+            series[1] += value
+
+    def samples(self) -> list[str]:
+        with self._lock:
+            series = [(key, list(counts), total) for key, (counts, total) in self._series.items()]
+        lines = []
+        for key, counts, total in series:
+            cumulative = 0
+            for bound, count in zip([*self.buckets, "+Inf"], counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{format_labels(self.labels, key, le=bound)} "
+                             f"{cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(self.labels, key)} {total}")
+            lines.append(f"{self.name}_count{format_labels(self.labels, key)} {cumulative}")
+        return lines
+
+
+class Gauge:
+    """Value read when the metrics are rendered, func returns a number or labels -> number.
+
+    kind="counter" exposes a total counted elsewhere, such as the cache hits.
+    """
+
+    def __init__(self,
+                 name: str,
+                 help: str,
+                 func: Callable[[], float | dict[tuple, float]],
+                 labels: tuple[str, ...] = (),
+                 kind: str = "gauge"):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.func = func
+        self.kind = kind
+
+    def samples(self) -> list[str]:
+        values = self.func()
+        if not isinstance(values, dict):
+            values = {(): values}
+        return [
+            f"{self.name}{format_labels(self.labels, key)} {value}"
+            for key, value in values.items() if value is not None
+        ]
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: dict[str, Counter | Histogram | Gauge] = {}
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        """Metrics in the Prometheus text exposition format."""
+        lines = []
+        for metric in self.metrics.values():
+            lines += [f"# HELP {metric.name} {metric.help}", f"# TYPE {metric.name} {metric.kind}"]
+            lines += metric.samples()
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+stage_seconds = registry.register(Histogram(
+    "search_stage_seconds", "Time spent in each stage of a search", labels=("stage",)
+))
+request_seconds = registry.register(Histogram(
+    "http_request_duration_seconds", "Latency of the requests", labels=("route", "status")
+))
+engine_queries = registry.register(Counter(
+    "search_engine_queries_total", "Queries scored by the search engine", labels=("kind",)
+))
+
+
+class _Stage:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self.start
+        stage_seconds.observe(elapsed, self.name)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings[self.name] = timings.get(self.name, 0.0) + elapsed
+
+
+def stage(name: str):
+    """Context manager timing a stage of the current request, a no-op when metrics are off."""
+    if not Config.metrics_enabled:
+        return _noop
+    return _Stage(name)
+
+
+def count_queries(kind: str, amount: int = 1) -> None:
+    if Config.metrics_enabled:
+        engine_queries.inc(kind, amount=amount)
+
+
+def server_timing(timings: dict[str, float], total: float) -> str:
+    entries = [f"{name};dur={seconds * 1000:.3f}" for name, seconds in timings.items()]
+    entries.append(f"total;dur={total * 1000:.3f}")
+    return ", ".join(entries)
+
+
+class TimingMiddleware:
+    """Records the latency of every request and sends its stage timings as Server-Timing."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        start = time.perf_counter()
+        timings = {}
+        token = _request_timings.set(timings)
+        status = [500]
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+                header = server_timing(timings, time.perf_counter() - start)
+                message["headers"] = [
+                    *message.get("headers", []), (b"server-timing", header.encode())
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _request_timings.reset(token)
+            route = scope.get("route")
+            request_seconds.observe(
+                time.perf_counter() - start, route.path if route else "unmatched", status[0]
+            )
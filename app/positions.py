@@ -0,0 +1,49 @@
+import numpy as np
+
+
+def encode_positions(positions: np.ndarray, lengths: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Delta-encode consecutive sorted position lists.
+
+    `positions` holds the position lists one after the other, `lengths` the size
+    of each list. Every list keeps its first position and the gaps after it,
+    packed in the smallest unsigned dtype that fits them.
+    """
+    ptr = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=ptr[1:])
+    deltas = np.diff(positions, prepend=0)
+    starts = ptr[:-1][lengths > 0]
+    deltas[starts] = positions[starts]
+    dtype = np.min_scalar_type(int(deltas.max())) if len(deltas) else np.uint8
+    return ptr, deltas.astype(dtype)
+
+
+def decode_positions(ptr: np.ndarray, deltas: np.ndarray, i: int) -> np.ndarray:
+    return np.cumsum(deltas[ptr[i]:ptr[i + 1]], dtype=np.int64)
+
+
+def gallop_intersect(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    # Binary searches of the shorter sorted array into the longer one
+    if len(a) > len(b):
+        a, b = b, a
+    if len(a) == 0:
+        return a
+    found = np.minimum(np.searchsorted(b, a), len(b) - 1)
+    return a[b[found] == a]
+
+
+def has_phrase(term_positions: list[np.ndarray]) -> bool:
+    # True when the terms occur at consecutive positions somewhere
+    starts = term_positions[0]
+    for offset, positions in enumerate(term_positions[1:], start=1):
+        starts = gallop_intersect(starts + offset, positions) - offset
+        if len(starts) == 0:
+            return False
+    return True
+
+
+def min_distance(a: np.ndarray, b: np.ndarray) -> int:
+    # Smallest |x - y| between two non-empty sorted position arrays
+    found = np.searchsorted(a, b)
+    after = np.abs(a[np.minimum(found, len(a) - 1)] - b)
+    before = np.abs(a[np.maximum(found - 1, 0)] - b)
+    return int(min(after.min(), before.min()))
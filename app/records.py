@@ -0,0 +1,182 @@
+import json
+import numpy as np
+
+from dataclasses import dataclass
+from datetime import datetime
+
+from pandas import DataFrame, Series, to_datetime, to_numeric
+
+from app.constants import IMAGES_PATH_GITHUB
+
+
+# Ordinal (days since 0001-01-01) of the numpy epoch
+EPOCH_ORDINAL = 719163
+
+
+def processing_movie_record(movie_record: Series) -> dict:
+    release_year = movie_record["release_date"].year
+    image_name = (movie_record["movie_id"] + "." + movie_record["image_format"])
+    image_path = f"{IMAGES_PATH_GITHUB}/{image_name}"
+    movie_record_info = {
+        "title": movie_record["title"],
+        "release_date": movie_record["release_date"],
+        "release_year": release_year,
+        "running_time": movie_record["running_time_minutes"],
+        "genre": movie_record["genre"],
+        "tags": movie_record["tags"],
+        "summary": movie_record["movie_summary"],
+        "budget": movie_record["budget"],
+        "box_office": movie_record["box_office"],
+        "profit": movie_record["profit"],
+        "image_path": image_path,
+    }
+    return movie_record_info
+
+
+def json_default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def encode_json(value) -> bytes:
+    # Same encoding as starlette's JSONResponse
+    return json.dumps(
+        value,
+        default=json_default,
+        ensure_ascii=False,
+        allow_nan=False,
+        separators=(",", ":"),
+    ).encode("utf-8")
+
+
+class PackedBytes:
+    """Byte strings concatenated in one buffer and sliced out by offsets.
+
+    Reading them only touches the reference count of the buffer, so the pages
+    of a store preloaded before forking stay shared between the workers.
+    """
+
+    def __init__(self, values: list[bytes]):
+        self.buffer = b"".join(values)
+        self.offsets = np.zeros(len(values) + 1, dtype=np.int64)
+        np.cumsum([len(value) for value in values], out=self.offsets[1:])
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, row: int) -> bytes:
+        return self.buffer[self.offsets[row]:self.offsets[row + 1]]
+
+    def take(self, rows: np.ndarray) -> list[bytes]:
+        buffer = self.buffer
+        starts = self.offsets[rows].tolist()
+        stops = self.offsets[rows + 1].tolist()
+        return [buffer[start:stop] for start, stop in zip(starts, stops)]
+
+
+@dataclass
+class RankedMovies:
+    """Rows of the movies of a response in order, with their relevancy.
+
+    Without relevancy the movies are dated, their relevancy is the release ordinal.
+    """
+    rows: np.ndarray
+    relevancy: np.ndarray = None
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    @property
+    def nbytes(self) -> int:
+        return self.rows.nbytes + (0 if self.relevancy is None else self.relevancy.nbytes)
+
+    def page(self, start: int, stop: int) -> "RankedMovies":
+        if self.relevancy is None:
+            return RankedMovies(self.rows[start:stop])
+        return RankedMovies(self.rows[start:stop], self.relevancy[start:stop])
+
+
+class RecordStore:
+    """Movie payloads pre-encoded to JSON, aligned with the rows of the movies DataFrame.
+
+    Each payload is stored without its closing brace so the per-request
+    relevancy can be appended, and a response is the concatenation of the
+    payloads of the ranked rows. Sorting uses numeric columns, with
+    relevancy ties broken by the release date.
+    """
+
+    # Columns of the movies DataFrame read by the store
+    COLUMNS = ["url", "movie_id", "image_format", "title", "release_date", "running_time_minutes",
+               "genre", "tags", "movie_summary", "budget", "box_office", "profit"]
+
+    def __init__(self, documents: DataFrame):
+        self.n_rows = len(documents)
+        self.row_of_url = {url: row for row, url in enumerate(documents["url"])}
+        payloads = [
+            encode_json(record)[:-1] + b',"relevancy":'
+            for record in documents.apply(processing_movie_record, axis=1)
+        ]
+        self.payloads = PackedBytes(payloads)
+        release_dates = to_datetime(documents["release_date"], errors="coerce")
+        release_days = release_dates.values.astype("datetime64[D]").astype(np.float64)
+        release_days[release_dates.isna().values] = np.nan
+        self.release_ordinals = release_days + EPOCH_ORDINAL
+        self.columns = {
+            "release_date": self.release_ordinals,
+            "budget": to_numeric(documents["budget"], errors="coerce").to_numpy(np.float64),
+            "box_office": to_numeric(documents["box_office"], errors="coerce").to_numpy(np.float64),
+            "profit": to_numeric(documents["profit"], errors="coerce").to_numpy(np.float64),
+        }
+        # Without a query the relevancy of a movie is its release ordinal
+        self.dated_payloads = PackedBytes([
+            payload + encode_json(None if np.isnan(ordinal) else int(ordinal)) + b"}"
+            for payload, ordinal in zip(payloads, self.release_ordinals)
+        ])
+        self.all_ranked = RankedMovies(np.arange(self.n_rows))
+        self.all_movies = self.response(self.all_ranked.rows)
+        # Encoding -> compressed all_movies, filled by the response layer
+        self.compressed_all_movies: dict[str, bytes] = {}
+
+    def relevancy(self, rows: np.ndarray, results: list[tuple[str, float]]) -> np.ndarray:
+        """Scores of the rows, 0 for the rows missing from the results."""
+        relevancy = np.zeros(len(rows), dtype=np.float64)
+        position = {row: i for i, row in enumerate(rows.tolist())}
+        for url, score in results:
+            i = position.get(self.row_of_url.get(url))
+            if i is not None:
+                relevancy[i] = score
+        return relevancy
+
+    def order(self, rows: np.ndarray, relevancy: np.ndarray,
+              sort_by: str = None, sort_order: str = "descending") -> np.ndarray:
+        """Stable permutation of the rows sorted by a column, NaN values last."""
+        if sort_by is None:
+            return np.arange(len(rows))
+        if sort_by == "relevancy":
+            keys = (self.release_ordinals[rows], relevancy)
+        else:
+            keys = (self.columns[sort_by][rows],)
+        if sort_order == "descending":
+            keys = tuple(-key for key in keys)
+        return np.lexsort(keys)
+
+    def records(self, rows: np.ndarray, relevancy: np.ndarray = None) -> list[bytes]:
+        """JSON objects of the movies of the rows, dated by release when relevancy is None."""
+        if relevancy is None:
+            return self.dated_payloads.take(rows)
+        return [
+            payload + encode_json(score) + b"}"
+            for payload, score in zip(self.payloads.take(rows), relevancy.tolist())
+        ]
+
+    def response(self, rows: np.ndarray, relevancy: np.ndarray = None) -> bytes:
+        """JSON array of the movies of the rows."""
+        return b"[" + b",".join(self.records(rows, relevancy)) + b"]"
+
+    def render(self, ranked: RankedMovies) -> bytes:
+        if ranked is self.all_ranked:
+            return self.all_movies
+        return self.response(ranked.rows, ranked.relevancy)
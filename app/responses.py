@@ -0,0 +1,107 @@
+import base64
+import gzip
+import hashlib
+import json
+import numpy as np
+
+from fastapi import HTTPException, Response
+from fastapi.responses import StreamingResponse
+
+from app.records import RankedMovies, RecordStore
+
+try:
+    import brotli
+except ImportError:  # optional, responses are gzipped instead
+    brotli = None
+
+
+NOT_FOUND = b'[{"result":"Not found"}]'
+# Smaller bodies are not worth compressing, same threshold as the gzip middleware
+MINIMUM_COMPRESSED_SIZE = 1000
+
+
+def encode_cursor(generation: int, offset: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps([generation, offset]).encode()).decode()
+
+
+def decode_cursor(cursor: str, generation: int) -> int:
+    """Offset of a cursor, a cursor of another index generation is rejected."""
+    try:
+        value = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except ValueError:
+        value = None
+    if not isinstance(value, list) or len(value) != 2:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    cursor_generation, offset = value
+    if cursor_generation != generation or not isinstance(offset, int) or offset < 0:
+        raise HTTPException(status_code=410, detail="Cursor expired, restart the search")
+    return offset
+
+
+def content_encoding(accept_encoding: str) -> str:
+    encodings = {encoding.split(";")[0].strip() for encoding in accept_encoding.split(",")}
+    if brotli is not None and "br" in encodings:
+        return "br"
+    if "gzip" in encodings:
+        return "gzip"
+    return "identity"
+
+
+def strong_etag(generation: int, request_key: tuple, encoding: str) -> str:
+    # Strong validators differ between the encodings of a representation
+    digest = hashlib.sha256(repr((generation, request_key)).encode()).hexdigest()[:32]
+    return f'"{digest}-{encoding}"'
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    # If-None-Match uses the weak comparison
+    tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return "*" in tags or etag.removeprefix("W/") in tags
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=5)
+    return gzip.compress(body, compresslevel=6)
+
+
+def encoded_body(record_store: RecordStore,
+                 ranked: RankedMovies,
+                 encoding: str) -> tuple[bytes, str]:
+    """Body of the response and its encoding, identity when it is too small to compress."""
+    body = NOT_FOUND if ranked is None else record_store.render(ranked)
+    if encoding == "identity" or len(body) < MINIMUM_COMPRESSED_SIZE:
+        return body, "identity"
+    if ranked is not record_store.all_ranked:
+        return compress(body, encoding), encoding
+    # The unfiltered list of all movies is compressed once per encoding
+    if encoding not in record_store.compressed_all_movies:
+        record_store.compressed_all_movies[encoding] = compress(body, encoding)
+    return record_store.compressed_all_movies[encoding], encoding
+
+
+def ndjson_chunks(record_store: RecordStore, ranked: RankedMovies, chunk_size: int = 256):
+    # Records are encoded chunk by chunk while the response is sent
+    for start in range(0, len(ranked), chunk_size):
+        page = ranked.page(start, start + chunk_size)
+        yield b"".join(record + b"\n" for record in record_store.records(page.rows, page.relevancy))
+
+
+def movies_response(record_store: RecordStore,
+                    ranked: RankedMovies,
+                    headers: dict[str, str],
+                    encoding: str,
+                    ndjson: bool = False) -> Response:
+    headers = {**headers, "Vary": "Accept-Encoding"}
+    if ndjson:
+        return StreamingResponse(
+            ndjson_chunks(record_store, ranked or RankedMovies(np.empty(0, dtype=np.int64))),
+            media_type="application/x-ndjson",
+            headers=headers,
+        )
+    body, body_encoding = encoded_body(record_store, ranked, encoding)
+    if body_encoding != "identity":
+        headers["Content-Encoding"] = body_encoding
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -1,11 +1,56 @@
-import spacy
+import json
+import logging
+import numpy as np
+import re
+import shutil
+import threading
+import time
 
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
 from enum import Enum
+from functools import lru_cache
+from heapq import nlargest
+from itertools import count, repeat
 from math import log
+from pathlib import Path
 from string import punctuation
 
-from nltk.stem.snowball import SnowballStemmer
+
+from app.fuzzy import allowed_distance, WordCorrector
+from app.positions import (
+    decode_positions,
+    encode_positions,
+    gallop_intersect,
+    has_phrase,
+    min_distance,
+)
+
+
+logger = logging.getLogger(__name__)
+
+# spaCy components that lemmatization does not need
+UNUSED_PIPES = ["parser", "ner"]
+
+# Bump when the snapshot layout or the analysis/scoring of the index changes
+SNAPSHOT_VERSION = 3
+SNAPSHOT_ARRAYS = ["indptr", "doc_ids", "term_freqs", "doc_lengths", "doc_norms", "max_impacts"]
+SNAPSHOT_POSITION_ARRAYS = ["positions_ptr", "positions"]
+
+# Below this many documents bulk_index runs in process, starting workers that each
+# load their own analyzer (spaCy) would take longer than the indexing
+MIN_PARALLEL_DOCUMENTS = 2000
+
+# Quoted phrases of a query, matched when positional postings are enabled
+PHRASE_PATTERN = re.compile(r'"([^"]+)"')
+
+# Index generations, unique across engines so caches can tell any two indexes apart
+_generations = count(1)
+
+
+def next_generation() -> int:
+    return next(_generations)
 
 
 def remove_stopwords(input_string: str, nlp) -> str:
@@ -17,10 +62,28 @@ def remove_stopwords(input_string: str, nlp) -> str:
     return filtered_text
 
 
+# spaCy and nltk take about a second to import, they are imported on first use
+
+@lru_cache(maxsize=None)
+def get_stemmer():
+    from nltk.stem.snowball import SnowballStemmer
+    return SnowballStemmer("english", ignore_stopwords=False)
+
+
+@lru_cache(maxsize=None)
+def get_stop_words() -> frozenset[str]:
+    from spacy.lang.en.stop_words import STOP_WORDS
+    return frozenset(STOP_WORDS)
+
+
+def load_nlp(exclude: list[str] = ()):
+    import spacy
+    return spacy.load("en_core_web_sm", exclude=list(exclude))
+
+
 def stemming(input_string: str) -> str:
-    stemmer = SnowballStemmer("english", ignore_stopwords=False)
     words = input_string.split()  # alternative approach - from nltk.tokenize import word_tokenize
-    stemmed_words = [stemmer.stem(word) for word in words]
+    stemmed_words = [get_stemmer().stem(word) for word in words]
     filtered_text = " ".join(stemmed_words)
     return filtered_text
 
@@ -51,91 +114,941 @@ def normalize_string(input_string: str) -> str:
     return string_without_double_spaces.lower()
 
 
+def split_correction(keyword: str) -> tuple[str, int]:
+    """Term and edit distance of a query keyword, "term~distance" for a fuzzy correction."""
+    term, _, distance = keyword.partition("~")
+    return normalize_string(term), int(distance or 0)
+
+
 class TextProcessing(str, Enum):
     Lemmatizer = "lemmatizer"
     Stemmer = "stemmer"
 
 
+def is_whole_word(token) -> bool:
+    # True when the spaCy token is a whole whitespace separated word of its doc
+    starts_word = token.i == 0 or bool(token.nbor(-1).whitespace_)
+    ends_word = bool(token.whitespace_) or token.i == len(token.doc) - 1
+    return starts_word and ends_word
+
+
+class Analyzer:
+    """Text processing shared by indexing and querying.
+
+    Indexing records the processed form of every word it sees, so analyzing a
+    query is a table lookup. spaCy or the stemmer only run on words that were
+    never indexed, memoized in a bounded LRU cache. The spaCy model is loaded
+    the first time it is needed unless nlp is given.
+    """
+
+    def __init__(self,
+                 text_processing: TextProcessing = None,
+                 stopwords: bool = False,
+                 nlp=None,
+                 cache_size: int = 4096):
+        self.text_processing = text_processing
+        self._nlp = nlp
+        self._nlp_lock = threading.Lock()
+        self.stop_words = get_stop_words() if stopwords else frozenset()
+        self.table: dict[str, str] = {}
+        self._process_unknown_word = lru_cache(maxsize=cache_size)(self._process_word)
+
+    @property
+    def nlp(self):
+        if self._nlp is None and self.text_processing is TextProcessing.Lemmatizer:
+            with self._nlp_lock:
+                if self._nlp is None:
+                    self._nlp = load_nlp()
+        return self._nlp
+
+    def load_models(self) -> None:
+        """Load the stemmer or spaCy model now instead of for the first unknown word."""
+        if self.text_processing is TextProcessing.Stemmer:
+            get_stemmer()
+        self.nlp
+
+    def words(self, text: str) -> list[str]:
+        return [word for word in normalize_string(text).split() if word not in self.stop_words]
+
+    def _process_word(self, word: str) -> str:
+        if self.text_processing is TextProcessing.Stemmer:
+            return get_stemmer().stem(word)
+        if self.text_processing is TextProcessing.Lemmatizer:
+            return lemmatizing(input_string=word, nlp=self.nlp)
+        return word
+
+    def analyze(self, text: str) -> list[str]:
+        tokens = []
+        for word in self.words(text):
+            processed = self.table.get(word)
+            if processed is None:
+                processed = self._process_unknown_word(word)
+            tokens.extend(processed.split(" "))
+        return tokens
+
+    def analyze_corrected(self,
+                          text: str,
+                          vocabulary: dict[str, int],
+                          corrector: WordCorrector) -> list[str]:
+        """Tokens of the text, those of a word with terms missing from the vocabulary
+        replaced by the "term~distance" tokens of its correction."""
+        tokens = []
+        for word in self.words(text):
+            word_tokens = self.analyze(word)
+            if any(token not in vocabulary for token in word_tokens):
+                corrected, distance = corrector.correct(word)
+                if corrected is not None:
+                    word_tokens = [f"{token}~{distance}" for token in self.analyze(corrected)]
+            tokens.extend(word_tokens)
+        return tokens
+
+    def corrector(self, document_frequencies: dict[str, int], max_distance: int) -> WordCorrector:
+        """Corrector to the words of the table whose terms are all indexed, or to the terms
+        themselves without stemming or lemmatization."""
+        table = self.table or {term: term for term in document_frequencies}
+        words, frequencies = [], []
+        for word, processed in table.items():
+            term_frequencies = [document_frequencies.get(term) for term in processed.split(" ")]
+            if None not in term_frequencies:
+                words.append(word)
+                frequencies.append(max(term_frequencies))
+        return WordCorrector(words, frequencies, max_distance)
+
+    def analyze_documents(self,
+                          contents: list[str],
+                          batch_size: int = 256) -> tuple[list[list[str]], dict[str, str]]:
+        """Tokens of every document and the word table learned from them."""
+        texts = [" ".join(self.words(content)) for content in contents]
+        if self.text_processing is TextProcessing.Lemmatizer:
+            tokens, table = self._lemmatize_documents(texts, batch_size)
+        elif self.text_processing is TextProcessing.Stemmer:
+            table = {}
+            tokens = []
+            stem = get_stemmer().stem
+            for words in (text.split(" ") for text in texts):
+                for word in words:
+                    if word not in table:
+                        table[word] = stem(word)
+                tokens.append([table[word] for word in words])
+        else:
+            return [text.split(" ") for text in texts], {}
+        self.table.update(table)
+        return tokens, table
+
+    def _lemmatize_documents(self,
+                             texts: list[str],
+                             batch_size: int) -> tuple[list[list[str]], dict[str, str]]:
+        table = {}
+        tokens = []
+        disabled = [pipe for pipe in UNUSED_PIPES if pipe in self.nlp.pipe_names]
+        with self.nlp.select_pipes(disable=disabled):
+            for doc in self.nlp.pipe(texts, batch_size=batch_size):
+                tokens.append(" ".join(token.lemma_ for token in doc).split(" "))
+                for token in doc:
+                    if is_whole_word(token):
+                        table.setdefault(token.text, token.lemma_)
+        return tokens, table
+
+
+_worker_analyzer = None
+
+
+def _init_index_worker(text_processing: TextProcessing, stopwords: bool) -> None:
+    global _worker_analyzer
+    nlp = None
+    if text_processing is TextProcessing.Lemmatizer:
+        nlp = load_nlp(exclude=UNUSED_PIPES)
+    _worker_analyzer = Analyzer(text_processing=text_processing, stopwords=stopwords, nlp=nlp)
+
+
+def build_partial_index(
+    documents: list[tuple[str, str]],
+    batch_size: int = 256,
+    analyzer: Analyzer = None,
+    positions: bool = False,
+) -> tuple[dict, list[tuple[str, int]], dict[str, str], dict]:
+    # Postings, token lengths, analyzer table and (optionally) token positions
+    # of a chunk of documents
+    analyzer = analyzer or _worker_analyzer
+    contents = [content for _, content in documents]
+    partial_index: dict[str, dict[str, int]] = {}
+    partial_positions: dict[str, dict[str, list[int]]] = {}
+    doc_lengths = []
+    tokens, table = analyzer.analyze_documents(contents, batch_size)
+    for (url, _), words in zip(documents, tokens):
+        for position, word in enumerate(words):
+            postings = partial_index.setdefault(word, {})
+            postings[url] = postings.get(url, 0) + 1
+            if positions:
+                partial_positions.setdefault(word, {}).setdefault(url, []).append(position)
+        doc_lengths.append((url, len(words)))
+    return partial_index, doc_lengths, table, partial_positions
+
+
+@dataclass
+class CompiledIndex:
+    # Term and document ids with CSR-style posting arrays:
+    # the postings of term_id are doc_ids[indptr[term_id]:indptr[term_id + 1]]
+    vocabulary: dict[str, int]
+    urls: np.ndarray
+    indptr: np.ndarray
+    doc_ids: np.ndarray
+    term_freqs: np.ndarray
+    doc_lengths: np.ndarray
+    # Optional delta-encoded token positions of every posting, see app/positions.py
+    positions_ptr: np.ndarray = None
+    positions: np.ndarray = None
+
+    @property
+    def number_of_documents(self) -> int:
+        return len(self.urls)
+
+    def postings(self, term_id: int) -> tuple[np.ndarray, np.ndarray]:
+        start, end = self.indptr[term_id], self.indptr[term_id + 1]
+        return self.doc_ids[start:end], self.term_freqs[start:end]
+
+    def term_positions(self, term_id: int, docs: np.ndarray) -> list[np.ndarray]:
+        # Positions of the term in each of `docs`, which must all contain it
+        posting_ids = self.indptr[term_id] + np.searchsorted(self.postings(term_id)[0], docs)
+        return [decode_positions(self.positions_ptr, self.positions, i) for i in posting_ids]
+
+
+class CorpusStatistics:
+    """BM25 corpus statistics, kept up to date by SearchEngine.index().
+
+    Document lengths are counted in tokens. The idf values and the per-document
+    length normalizers k1 * (1 - b + b * dl / avdl) are memoized and only
+    recomputed after the corpus changed.
+    """
+
+    def __init__(self, k1: float, b: float):
+        self.k1 = k1
+        self.b = b
+        self.doc_lengths: dict[str, int] = {}
+        self.total_tokens = 0
+        self._idf: dict[str, float] = {}
+        self._norms: dict[str, float] = None
+        # (number of documents, total tokens, document frequencies) of the whole
+        # corpus when this index is only a shard of it
+        self._global: tuple[int, int, dict[str, int]] = None
+
+    @property
+    def number_of_documents(self) -> int:
+        return len(self.doc_lengths)
+
+    @property
+    def avdl(self) -> float:
+        if self._global is not None:
+            return self._global[1] / self._global[0]
+        return self.total_tokens / self.number_of_documents
+
+    def add_document(self, url: str, n_tokens: int) -> None:
+        self.doc_lengths[url] = self.doc_lengths.get(url, 0) + n_tokens
+        self.total_tokens += n_tokens
+        self._global = None
+        self._idf.clear()
+        self._norms = None
+
+    def set_global(self,
+                   number_of_documents: int,
+                   total_tokens: int,
+                   document_frequencies: dict[str, int]) -> None:
+        self._global = (number_of_documents, total_tokens, document_frequencies)
+        self._idf.clear()
+        self._norms = None
+
+    def idf(self, term: str, n_kw: int) -> float:
+        idf_score = self._idf.get(term)
+        if idf_score is None:
+            N = self.number_of_documents
+            if self._global is not None:
+                N, _, document_frequencies = self._global
+                n_kw = document_frequencies.get(term, n_kw)
+            idf_score = log((N - n_kw + 0.5) / (n_kw + 0.5) + 1)
+            self._idf[term] = idf_score
+        return idf_score
+
+    def norm(self, url: str) -> float:
+        if self._norms is None:
+            avdl = self.avdl
+            self._norms = {
+                url: self.k1 * (1 - self.b + self.b * dl / avdl)
+                for url, dl in self.doc_lengths.items()
+            }
+        return self._norms[url]
+
+    def norms(self, urls: list[str]) -> np.ndarray:
+        lengths = np.array([self.doc_lengths[url] for url in urls], dtype=np.int64)
+        return self.k1 * (1 - self.b + self.b * lengths / self.avdl)
+
+
 class SearchEngine:
     def __init__(self,
                  k1: float = 1.5,
                  b: float = 0.75,
                  stopwords: bool = False,
-                 text_processing: TextProcessing = None):
+                 text_processing: TextProcessing = None,
+                 positions: bool = False,
+                 proximity_boost: float = 0.0,
+                 proximity_window: int = 5,
+                 fuzzy_distance: int = 0,
+                 fuzzy_penalty: float = 0.5):
 
         self._index: dict[str, dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        # Changes whenever the indexed documents or their scoring change
+        self.generation = next_generation()
+        self._positions: dict[str, dict[str, list[int]]] = defaultdict(dict)
         self._documents: dict[str, str] = {}
         self.k1 = k1
         self.b = b
+        # Positional postings enable "quoted phrase" queries and, with a positive
+        # proximity_boost, add it for every pair of consecutive query terms found
+        # within proximity_window tokens of each other
+        self.positions = positions
+        self.proximity_boost = proximity_boost
+        self.proximity_window = proximity_window
+        # Query words whose terms are missing from the compiled vocabulary are replaced by
+        # the closest indexed word within fuzzy_distance edits, before they are stemmed or
+        # lemmatized, their score multiplied by fuzzy_penalty per edit
+        self.fuzzy_distance = fuzzy_distance
+        self.fuzzy_penalty = fuzzy_penalty
+        # Built on the first misspelled word rather than with every compiled index
+        self._fuzzy: WordCorrector = None
+        self._fuzzy_lock = threading.Lock()
+        self.statistics = CorpusStatistics(k1=k1, b=b)
         self.stopwords = stopwords
         self.text_processing = text_processing
-        self.nlp = {TextProcessing.Lemmatizer:
-                    spacy.load("en_core_web_sm")}.get(text_processing)
+        self.analyzer = Analyzer(text_processing=text_processing, stopwords=stopwords)
+        self._compiled: CompiledIndex = None
+        # Directory of the snapshot the compiled index was saved to or loaded from
+        self.snapshot: Path = None
+        # False for an engine loaded from a snapshot until it is indexed into
+        self._postings_loaded = True
+        # Score and seen buffers of the compiled mode, one pair per searching thread,
+        # reused between queries with only the touched entries reset
+        self._buffers = threading.local()
+        self._doc_norms: np.ndarray = None
+        # Per term upper bound of the BM25 term frequency component, used for pruning
+        self._max_impacts: np.ndarray = None
 
     @property
     def posts(self) -> list[str]:
-        return list(self._documents.keys())
+        return list(self.statistics.doc_lengths.keys())
 
     @property
     def number_of_documents(self) -> int:
-        return len(self._documents)
+        return self.statistics.number_of_documents
 
     @property
     def avdl(self) -> float:
-        # todo: refactor this. it can be slow to compute it every time. compute it once and cache it
-        return sum(len(d) for d in self._documents.values()) / len(self._documents)
+        return self.statistics.avdl
 
     def idf(self, kw: str) -> float:
-        N = self.number_of_documents
-        n_kw = len(self.get_urls(kw))
-        return log((N - n_kw + 0.5) / (n_kw + 0.5) + 1)
+        return self.statistics.idf(normalize_string(kw), len(self.get_urls(kw)))
 
     def bm25(self, kw: str) -> dict[str, float]:
         result = {}
         idf_score = self.idf(kw)
-        avdl = self.avdl
         for url, freq in self.get_urls(kw).items():
             numerator = freq * (self.k1 + 1)
-            denominator = freq + self.k1 * (
-                1 - self.b + self.b * len(self._documents[url]) / avdl
-            )
+            denominator = freq + self.statistics.norm(url)
             result[url] = idf_score * numerator / denominator
         return result
 
+    def query_keywords(self, query: str) -> list[str]:
+        """Analyzed query, a misspelled word replaced by the "term~distance" keywords of
+        its correction."""
+        if not self.fuzzy_distance or self._compiled is None:
+            return self.analyzer.analyze(query)
+        return self.analyzer.analyze_corrected(query, self._compiled.vocabulary,
+                                               self._corrector())
+
     def search(self, query: str) -> dict[str, float]:
-        normalize_query = normalize_string(query)
-        if self.text_processing is TextProcessing.Stemmer:
-            _query = stemming(input_string=normalize_query)
-        elif self.text_processing is TextProcessing.Lemmatizer:
-            _query = lemmatizing(input_string=normalize_query, nlp=self.nlp)
+        keywords = self.query_keywords(query)
+        if self._compiled is not None:
+            url_scores = self._search_compiled(keywords)
         else:
-            _query = normalize_query
-        keywords = _query.split(" ")
-        url_scores: dict[str, float] = {}
-        for kw in keywords:
-            kw_urls_score = self.bm25(kw)
-            url_scores = update_url_scores(url_scores, kw_urls_score)
+            url_scores: dict[str, float] = {}
+            for kw in keywords:
+                kw_urls_score = self.bm25(kw)
+                url_scores = update_url_scores(url_scores, kw_urls_score)
+        if self._uses_positions(query):
+            url_scores = self._apply_positions(query, keywords, url_scores)
+        return url_scores
+
+    def _uses_positions(self, query: str) -> bool:
+        return self.positions and (self.proximity_boost > 0 or '"' in query)
+
+    def _apply_positions(self,
+                         query: str,
+                         keywords: list[str],
+                         url_scores: dict[str, float]) -> dict[str, float]:
+        index = self._compiled or self.compile()
+        for phrase in PHRASE_PATTERN.findall(query):
+            phrase_urls = set(index.urls[self._phrase_documents(phrase)].tolist())
+            url_scores = {url: score for url, score in url_scores.items() if url in phrase_urls}
+        if self.proximity_boost > 0:
+            for url, boost in self._proximity_boosts(keywords).items():
+                if url in url_scores:
+                    url_scores[url] += boost
+        return url_scores
+
+    def _phrase_documents(self, phrase: str) -> np.ndarray:
+        index = self._compiled
+        vocabulary = index.vocabulary
+        term_ids = [vocabulary.get(split_correction(kw)[0]) for kw in self.query_keywords(phrase)]
+        if not term_ids or None in term_ids:
+            return np.empty(0, dtype=np.int32)
+        docs = index.postings(term_ids[0])[0]
+        for term_id in term_ids[1:]:
+            docs = gallop_intersect(docs, index.postings(term_id)[0])
+        term_positions = [index.term_positions(term_id, docs) for term_id in term_ids]
+        matches = [has_phrase(doc_positions) for doc_positions in zip(*term_positions)]
+        return docs[np.array(matches, dtype=bool)]
+
+    def _proximity_boosts(self, keywords: list[str]) -> dict[str, float]:
+        index = self._compiled
+        term_ids = [index.vocabulary.get(split_correction(kw)[0]) for kw in keywords]
+        boosts: dict[str, float] = {}
+        for a, b in zip(term_ids, term_ids[1:]):
+            if a is None or b is None or a == b:
+                continue
+            docs = gallop_intersect(index.postings(a)[0], index.postings(b)[0])
+            pairs = zip(docs.tolist(), index.term_positions(a, docs), index.term_positions(b, docs))
+            for doc, a_positions, b_positions in pairs:
+                if min_distance(a_positions, b_positions) <= self.proximity_window:
+                    url = index.urls[doc]
+                    boosts[url] = boosts.get(url, 0.0) + self.proximity_boost
+        return boosts
+
+    @property
+    def is_compiled(self) -> bool:
+        return self._compiled is not None
+
+    def compile(self) -> CompiledIndex:
+        if not self._postings_loaded:
+            self._load_postings()
+        urls = self.posts
+        doc_id = {url: i for i, url in enumerate(urls)}
+        vocabulary: dict[str, int] = {}
+        lengths, doc_ids, term_freqs = [], [], []
+        for term, postings in self._index.items():
+            if not postings:
+                continue
+            vocabulary[term] = len(vocabulary)
+            lengths.append(len(postings))
+            doc_ids.extend(doc_id[url] for url in postings)
+            term_freqs.extend(postings.values())
+        indptr = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=indptr[1:])
+        doc_ids = np.array(doc_ids, dtype=np.int32)
+        term_freqs = np.array(term_freqs, dtype=np.int32)
+        # Postings are kept sorted by doc id inside each term
+        term_ids = np.repeat(np.arange(len(vocabulary), dtype=np.int32), lengths)
+        order = np.lexsort((doc_ids, term_ids))
+        positions_ptr, positions = (
+            self._compile_positions(vocabulary, order) if self.positions else (None, None)
+        )
+        self._compiled = CompiledIndex(
+            vocabulary=vocabulary,
+            urls=np.array(urls, dtype=object),
+            indptr=indptr,
+            doc_ids=doc_ids[order],
+            term_freqs=term_freqs[order],
+            doc_lengths=np.array(
+                [self.statistics.doc_lengths[url] for url in urls], dtype=np.int64
+            ),
+            positions_ptr=positions_ptr,
+            positions=positions,
+        )
+        self._set_compiled(self._compiled)
+        return self._compiled
+
+    def _compile_positions(self,
+                           vocabulary: dict[str, int],
+                           order: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        # Position lists in the posting order of compile(), then delta-encoded
+        position_lists = [
+            self._positions[term][url] for term in vocabulary for url in self._index[term]
+        ]
+        order = order.tolist()
+        lengths = np.array([len(position_lists[i]) for i in order], dtype=np.int64)
+        flat = np.fromiter(
+            (position for i in order for position in position_lists[i]),
+            dtype=np.int64,
+            count=int(lengths.sum()),
+        )
+        return encode_positions(flat, lengths)
+
+    def _set_compiled(self,
+                      index: CompiledIndex,
+                      doc_norms: np.ndarray = None,
+                      max_impacts: np.ndarray = None) -> None:
+        self._compiled = index
+        if index.number_of_documents and doc_norms is None:
+            doc_norms = self.statistics.norms(index.urls)
+            impacts = index.term_freqs * (self.k1 + 1) / (
+                index.term_freqs + doc_norms[index.doc_ids]
+            )
+            max_impacts = np.maximum.reduceat(impacts, index.indptr[:-1])
+        self._doc_norms = doc_norms
+        self._max_impacts = max_impacts
+        self._fuzzy = None
+
+    def _corrector(self) -> WordCorrector:
+        with self._fuzzy_lock:
+            if self._fuzzy is None:
+                self._fuzzy = self.analyzer.corrector(self.document_frequencies(),
+                                                      self.fuzzy_distance)
+            return self._fuzzy
+
+    @property
+    def fingerprint(self) -> dict:
+        # Everything that changes the content of a snapshot besides the dataset
+        return {
+            "version": SNAPSHOT_VERSION,
+            "text_processing": self.text_processing and self.text_processing.value,
+            "stopwords": self.stopwords,
+            "k1": self.k1,
+            "b": self.b,
+            "positions": self.positions,
+        }
+
+    def save(self, path: str, dataset_hash: str) -> Path:
+        """Write a snapshot of the compiled index to path/dataset_hash."""
+        index = self._compiled or self.compile()
+        directory = Path(path) / dataset_hash
+        tmp_directory = directory.with_name(f"{dataset_hash}.tmp")
+        shutil.rmtree(tmp_directory, ignore_errors=True)
+        tmp_directory.mkdir(parents=True)
+        arrays = {
+            "indptr": index.indptr,
+            "doc_ids": index.doc_ids,
+            "term_freqs": index.term_freqs,
+            "doc_lengths": index.doc_lengths,
+            "doc_norms": self._doc_norms,
+            "max_impacts": self._max_impacts,
+        }
+        if self.positions:
+            arrays["positions_ptr"] = index.positions_ptr
+            arrays["positions"] = index.positions
+        for name, array in arrays.items():
+            np.save(tmp_directory / f"{name}.npy", array)
+        with open(tmp_directory / "terms.json", "w") as f:
+            json.dump({
+                "vocabulary": list(index.vocabulary),
+                "urls": index.urls.tolist(),
+                "analyzer": self.analyzer.table,
+            }, f)
+        # The manifest is written last, a snapshot without it is never loaded
+        with open(tmp_directory / "manifest.json", "w") as f:
+            json.dump({"fingerprint": self.fingerprint, "dataset_hash": dataset_hash}, f)
+        shutil.rmtree(directory, ignore_errors=True)
+        tmp_directory.rename(directory)
+        self.snapshot = directory
+        return directory
+
+    @classmethod
+    def load(cls, path: str, dataset_hash: str, **kwargs) -> "SearchEngine":
+        """Load a snapshot saved by save(), or None if it is missing or stale.
+
+        The posting arrays are memory-mapped read-only, so processes loading the
+        same snapshot share its pages. kwargs are the SearchEngine arguments
+        and must match the fingerprint of the snapshot.
+        """
+        directory = Path(path) / dataset_hash
+        engine = cls(**kwargs)
+        try:
+            with open(directory / "manifest.json") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if manifest["fingerprint"] != engine.fingerprint:
+            return None
+        with open(directory / "terms.json") as f:
+            terms = json.load(f)
+        array_names = SNAPSHOT_ARRAYS + (SNAPSHOT_POSITION_ARRAYS if engine.positions else [])
+        arrays = {
+            name: np.load(directory / f"{name}.npy", mmap_mode="r")
+            for name in array_names
+        }
+        index = CompiledIndex(
+            vocabulary={term: term_id for term_id, term in enumerate(terms["vocabulary"])},
+            urls=np.array(terms["urls"], dtype=object),
+            indptr=arrays["indptr"],
+            doc_ids=arrays["doc_ids"],
+            term_freqs=arrays["term_freqs"],
+            doc_lengths=arrays["doc_lengths"],
+            positions_ptr=arrays.get("positions_ptr"),
+            positions=arrays.get("positions"),
+        )
+        engine.statistics.doc_lengths = dict(zip(terms["urls"], index.doc_lengths.tolist()))
+        engine.statistics.total_tokens = int(index.doc_lengths.sum())
+        engine.analyzer.table = terms["analyzer"]
+        engine._set_compiled(index, arrays["doc_norms"], arrays["max_impacts"])
+        engine._postings_loaded = False
+        engine.snapshot = directory
+        return engine
+
+    def _load_postings(self) -> None:
+        # Rebuild the dict postings of an engine loaded from a snapshot
+        index = self._compiled
+        for term, term_id in index.vocabulary.items():
+            docs, freqs = index.postings(term_id)
+            urls = index.urls[docs].tolist()
+            self._index[term].update(zip(urls, freqs.tolist()))
+            if self.positions:
+                term_positions = index.term_positions(term_id, docs)
+                self._positions[term].update(
+                    (url, positions.tolist()) for url, positions in zip(urls, term_positions)
+                )
+        self._postings_loaded = True
+
+    def _search_buffers(self) -> tuple[np.ndarray, np.ndarray]:
+        n_documents = self._compiled.number_of_documents
+        buffers = getattr(self._buffers, "arrays", None)
+        if buffers is None or len(buffers[0]) != n_documents:
+            buffers = (np.zeros(n_documents, dtype=np.float64), np.zeros(n_documents, dtype=bool))
+            self._buffers.arrays = buffers
+        return buffers
+
+    def _search_compiled(self, keywords: list[str]) -> dict[str, float]:
+        index = self._compiled
+        if index.number_of_documents == 0:
+            return {}
+        norms = self._doc_norms
+        scores, _ = self._search_buffers()
+        touched = []
+        for _, term_id, idf_score in self._query_terms(keywords):
+            docs, freqs = index.postings(term_id)
+            scores[docs] += idf_score * (freqs * (self.k1 + 1)) / (freqs + norms[docs])
+            touched.append(docs)
+        if not touched:
+            return {}
+        # Same ordering as the dict merge: by first matching keyword, then by doc id
+        touched = np.concatenate(touched)
+        unique_docs, first_seen = np.unique(touched, return_index=True)
+        ranked_docs = unique_docs[np.argsort(first_seen, kind="stable")]
+        url_scores = dict(zip(index.urls[ranked_docs].tolist(), scores[ranked_docs].tolist()))
+        scores[ranked_docs] = 0.0
         return url_scores
 
+    def search_topk(self, query: str, k: int) -> list[tuple[str, float]]:
+        """Return the same k best (url, score) pairs as sorting search() output.
+
+        Uses MaxScore pruning on the compiled index: query terms are scored
+        from the highest to the lowest impact bound, until the bounds of the
+        remaining terms cannot lift an unseen document into the top k. Only the
+        surviving candidates are scored on the remaining terms.
+        """
+        if self._compiled is None or self._uses_positions(query):
+            url_scores = self.search(query)
+            return nlargest(k, url_scores.items(), key=lambda item: item[1])
+        docs, scores, _ = self.rank_keywords(self.query_keywords(query), k)
+        return list(zip(self._compiled.urls[docs].tolist(), scores.tolist()))
+
+    def rank_keywords(self,
+                      keywords: list[str],
+                      k: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Doc ids, scores and first matching keyword position of the k best documents.
+
+        Requires the compiled index. Documents are ordered by score, then by the
+        position of their first matching keyword, then by doc id.
+        """
+        terms = self._query_terms(keywords)
+        if k <= 0 or not terms or self._compiled.number_of_documents == 0:
+            empty = np.empty(0, dtype=np.int64)
+            return empty, np.empty(0, dtype=np.float64), empty
+        candidates = self._maxscore_candidates(terms, k)
+        return self._rank_candidates(candidates, terms, k)
+
+    def search_many(self,
+                    queries: list[str],
+                    k: int,
+                    max_postings: int = 4096,
+                    max_chunk_scores: int = 1 << 22) -> list[list[tuple[str, float]]]:
+        """search_topk of every query, scoring the short queries of the batch together.
+
+        Queries whose terms have at most max_postings postings in total are
+        scored as one sparse query-term x term-doc product: the BM25
+        components of the postings of every distinct term are computed once
+        and summed into dense (query, document) score matrices of at most
+        max_chunk_scores entries with a single bincount. Longer queries go
+        through MaxScore one by one, which prunes most of their postings.
+        """
+        if self._compiled is None or any(self._uses_positions(query) for query in queries):
+            return [self.search_topk(query, k) for query in queries]
+        if k <= 0:
+            return [[] for _ in queries]
+        index = self._compiled
+        terms = {query: self._query_terms(self.query_keywords(query)) for query in set(queries)}
+        results = {}
+        batched = []
+        for query, query_terms in terms.items():
+            n_postings = sum(int(index.indptr[term_id + 1] - index.indptr[term_id])
+                             for _, term_id, _ in query_terms)
+            if n_postings <= max_postings:
+                batched.append(query)
+            else:
+                candidates = self._maxscore_candidates(query_terms, k)
+                docs, scores, _ = self._rank_candidates(candidates, query_terms, k)
+                results[query] = list(zip(index.urls[docs].tolist(), scores.tolist()))
+        chunk_size = max(1, max_chunk_scores // max(1, index.number_of_documents))
+        for start in range(0, len(batched), chunk_size):
+            chunk = batched[start:start + chunk_size]
+            results.update(zip(chunk, self._rank_many([terms[query] for query in chunk], k)))
+        return [results[query] for query in queries]
+
+    def _rank_many(self, queries_terms: list[list[tuple[int, int, float]]], k: int) -> list[list]:
+        index = self._compiled
+        n_queries, n_documents = len(queries_terms), index.number_of_documents
+        pairs = [
+            (query, position, term_id, idf)
+            for query, query_terms in enumerate(queries_terms)
+            for position, term_id, idf in query_terms
+        ]
+        if not pairs:
+            return [[] for _ in queries_terms]
+        pair_queries, pair_positions, pair_terms, pair_idfs = map(np.array, zip(*pairs))
+        # BM25 term frequency components of the postings of the distinct terms
+        terms, pair_term = np.unique(pair_terms, return_inverse=True)
+        lengths = index.indptr[terms + 1] - index.indptr[terms]
+        term_starts = np.cumsum(lengths) - lengths
+        postings = np.repeat(index.indptr[terms] - term_starts, lengths)
+        postings += np.arange(lengths.sum())
+        docs = index.doc_ids[postings]
+        freqs = index.term_freqs[postings]
+        numerators = freqs * (self.k1 + 1)
+        denominators = freqs + self._doc_norms[docs]
+        # One entry per (query keyword, posting), in keyword order within a query
+        pair_lengths = lengths[pair_term]
+        entry_pairs = np.repeat(np.arange(len(pairs)), pair_lengths)
+        pair_starts = np.cumsum(pair_lengths) - pair_lengths
+        entries = np.arange(len(entry_pairs)) - pair_starts[entry_pairs]
+        entries += term_starts[pair_term[entry_pairs]]
+        keys = pair_queries[entry_pairs] * n_documents + docs[entries]
+        weights = pair_idfs[entry_pairs] * numerators[entries] / denominators[entries]
+        scores = np.bincount(keys, weights=weights, minlength=n_queries * n_documents)
+        scores = scores.reshape(n_queries, n_documents)
+        return self._topk_rows(scores, keys, pair_positions[entry_pairs], k)
+
+    def _topk_rows(self,
+                   scores: np.ndarray,
+                   keys: np.ndarray,
+                   positions: np.ndarray,
+                   k: int) -> list[list[tuple]]:
+        # Top k of every row of the score matrix, ties broken like rank_keywords
+        n_queries, n_documents = scores.shape
+        kth = min(k, n_documents) - 1
+        thresholds = -np.partition(-scores, kth, axis=1)[:, kth]
+        # Matching documents have a positive score
+        thresholds = np.maximum(thresholds, np.finfo(np.float64).tiny)
+        candidates = np.flatnonzero((scores >= thresholds[:, None]).ravel())
+        candidate_mask = np.zeros(scores.size, dtype=bool)
+        candidate_mask[candidates] = True
+        is_candidate = candidate_mask[keys]
+        first_seen = np.full(len(candidates), positions.max() + 1, dtype=np.int64)
+        np.minimum.at(
+            first_seen, np.searchsorted(candidates, keys[is_candidate]), positions[is_candidate]
+        )
+        candidate_queries, candidate_docs = np.divmod(candidates, n_documents)
+        candidate_scores = scores.ravel()[candidates]
+        ranking = np.lexsort((candidate_docs, first_seen, -candidate_scores, candidate_queries))
+        bounds = np.searchsorted(candidate_queries[ranking], np.arange(n_queries + 1))
+        results = []
+        for query_start, query_end in zip(bounds[:-1], bounds[1:]):
+            top = ranking[query_start:min(query_end, query_start + k)]
+            results.append(list(zip(
+                self._compiled.urls[candidate_docs[top]].tolist(),
+                candidate_scores[top].tolist(),
+            )))
+        return results
+
+    def use_global_statistics(self,
+                              number_of_documents: int,
+                              total_tokens: int,
+                              document_frequencies: dict[str, int]) -> None:
+        """Score with the statistics of a corpus this index is a shard of."""
+        self.statistics.set_global(number_of_documents, total_tokens, document_frequencies)
+        self.generation = next_generation()
+        if self._compiled is not None:
+            self._set_compiled(self._compiled)
+
+    def bm25_weights(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """indptr, doc ids and BM25 score of the postings of the compiled index."""
+        index = self._compiled or self.compile()
+        lengths = np.diff(index.indptr)
+        idfs = np.array([
+            self.statistics.idf(term, n_kw)
+            for term, n_kw in zip(index.vocabulary, lengths.tolist())
+        ], dtype=np.float32)
+        freqs = index.term_freqs
+        impacts = freqs * (self.k1 + 1) / (freqs + self._doc_norms[index.doc_ids])
+        return index.indptr, index.doc_ids, (np.repeat(idfs, lengths) * impacts).astype(np.float32)
+
+    def query_terms(self, query: str) -> list[tuple[int, float]]:
+        """Term ids and idf of the analyzed query, fuzzy corrections included."""
+        return [(term_id, idf) for _, term_id, idf in self._query_terms(self.query_keywords(query))]
+
+    def urls_of(self, doc_ids: np.ndarray) -> list[str]:
+        return self._compiled.urls[doc_ids].tolist()
+
+    def document_frequencies(self) -> dict[str, int]:
+        index = self._compiled or self.compile()
+        return dict(zip(index.vocabulary, np.diff(index.indptr).tolist()))
+
+    def _query_terms(self, keywords: list[str]) -> list[tuple[int, int, float]]:
+        # (keyword position, term id, idf) of the keywords present in the index,
+        # the idf of a fuzzy correction penalized
+        index = self._compiled
+        terms = []
+        for position, kw in enumerate(keywords):
+            term, distance = split_correction(kw)
+            term_id = index.vocabulary.get(term)
+            if term_id is not None:
+                n_kw = int(index.indptr[term_id + 1] - index.indptr[term_id])
+                idf = self.statistics.idf(term, n_kw) * self.fuzzy_penalty ** distance
+                terms.append((position, term_id, idf))
+        return terms
+
+    def correct(self, word: str) -> tuple[str, int]:
+        """Indexed word closest to word and its edit distance, (None, 0) if none.
+
+        Words are compared before stemming or lemmatization. Among the closest
+        words the one whose terms are in the most documents wins.
+        """
+        if self._compiled is None or allowed_distance(word, self.fuzzy_distance) == 0:
+            return None, 0
+        return self._corrector().correct(word)
+
+    def _maxscore_candidates(self, terms: list[tuple[int, int, float]], k: int) -> np.ndarray:
+        index = self._compiled
+        # Slightly inflated bounds so rounding never prunes a true top-k document
+        bounds = [idf * self._max_impacts[term_id] * (1 + 1e-9) for _, term_id, idf in terms]
+        order = sorted(range(len(terms)), key=lambda i: bounds[i], reverse=True)
+        threshold = -np.inf
+        scores, seen_mask = self._search_buffers()
+        touched = []
+        for step, i in enumerate(order):
+            remaining = sum(bounds[j] for j in order[step:])
+            if remaining < threshold:
+                break
+            _, term_id, idf = terms[i]
+            docs, freqs = index.postings(term_id)
+            scores[docs] += idf * (freqs * (self.k1 + 1)) / (freqs + self._doc_norms[docs])
+            touched.append(docs[~seen_mask[docs]])
+            seen_mask[docs] = True
+            remaining = sum(bounds[j] for j in order[step + 1:])
+            seen = np.concatenate(touched)
+            if len(seen) >= k:
+                threshold = np.partition(scores[seen], len(seen) - k)[len(seen) - k]
+        candidates = seen[scores[seen] + remaining >= threshold]
+        scores[seen] = 0.0
+        seen_mask[seen] = False
+        return candidates
+
+    def _rank_candidates(
+        self,
+        candidates: np.ndarray,
+        terms: list[tuple[int, int, float]],
+        k: int,
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        # Exact scores in keyword order, ties broken like the search() dict order
+        index = self._compiled
+        final = np.zeros(len(candidates), dtype=np.float64)
+        first_seen = np.full(len(candidates), len(terms), dtype=np.int64)
+        for position, term_id, idf in terms:
+            docs, freqs = index.postings(term_id)
+            found = np.minimum(np.searchsorted(docs, candidates), len(docs) - 1)
+            hit = docs[found] == candidates
+            hit_freqs = freqs[found[hit]]
+            final[hit] += idf * (hit_freqs * (self.k1 + 1)) / (
+                hit_freqs + self._doc_norms[candidates[hit]]
+            )
+            first_seen[hit] = np.minimum(first_seen[hit], position)
+        ranking = np.lexsort((candidates, first_seen, -final))[:k]
+        return candidates[ranking], final[ranking], first_seen[ranking]
+
     def index(self, url: str, content: str) -> None:
-        self._documents[url] = content
-        normalized_content = normalize_string(content)
-        if self.stopwords:
-            _content = remove_stopwords(input_string=normalized_content, nlp=self.nlp)
-        if self.text_processing is TextProcessing.Stemmer:
-            _content = stemming(input_string=normalized_content)
-        elif self.text_processing is TextProcessing.Lemmatizer:
-            _content = lemmatizing(input_string=normalized_content, nlp=self.nlp)
+        documents = [(url, content)]
+        partial = build_partial_index(documents, analyzer=self.analyzer, positions=self.positions)
+        self._merge_partial_index(documents, *partial)
+
+    def bulk_index(self,
+                   documents: list[tuple[str, str]],
+                   workers: int = 1,
+                   batch_size: int = 256) -> float:
+        """Index documents in batches, fanned out over `workers` processes.
+
+        Every chunk of documents is turned into a partial index, the partial
+        indexes are merged in document order. Returns the documents/sec rate.
+        """
+        start = time.perf_counter()
+        documents = list(documents)
+        chunk_size = max(batch_size, -(-len(documents) // (workers * 4)))
+        chunks = [documents[i:i + chunk_size] for i in range(0, len(documents), chunk_size)]
+        workers = min(workers, len(chunks))
+        if len(documents) < MIN_PARALLEL_DOCUMENTS:
+            workers = 1
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers,
+                                     initializer=_init_index_worker,
+                                     initargs=(self.text_processing, self.stopwords)) as executor:
+                partials = list(executor.map(build_partial_index, chunks, repeat(batch_size),
+                                             repeat(None), repeat(self.positions)))
         else:
-            _content = normalized_content
-        words = _content.split(" ")
-        for word in words:
-            self._index[word][url] += 1
+            partials = (
+                build_partial_index(chunk, batch_size, self.analyzer, self.positions)
+                for chunk in chunks
+            )
+        for chunk, partial in zip(chunks, partials):
+            self._merge_partial_index(chunk, *partial)
+        elapsed = time.perf_counter() - start
+        documents_per_second = len(documents) / elapsed if elapsed else 0.0
+        logger.info(f"Indexed {len(documents)} documents in {elapsed:.2f}s "
+                    f"({documents_per_second:.0f} documents/sec, {workers} workers)")
+        return documents_per_second
 
-    def bulk_index(self, documents: list[tuple[str, str]]):
+    def _merge_partial_index(self,
+                             documents: list[tuple[str, str]],
+                             partial_index: dict[str, dict[str, int]],
+                             doc_lengths: list[tuple[str, int]],
+                             analyzer_table: dict[str, str],
+                             partial_positions: dict[str, dict[str, list[int]]]) -> None:
+        if not self._postings_loaded:
+            self._load_postings()
+        self._compiled = None
+        self.snapshot = None
+        self.generation = next_generation()
+        self.analyzer.table.update(analyzer_table)
+        for term, term_positions in partial_positions.items():
+            for url, positions in term_positions.items():
+                # Positions continue after the tokens of an already indexed document
+                offset = self.statistics.doc_lengths.get(url, 0)
+                self._positions[term].setdefault(url, []).extend(p + offset for p in positions)
         for url, content in documents:
-            self.index(url, content)
+            self._documents[url] = content
+        for term, postings in partial_index.items():
+            term_postings = self._index[term]
+            for url, freq in postings.items():
+                term_postings[url] += freq
+        for url, n_tokens in doc_lengths:
+            self.statistics.add_document(url, n_tokens)
 
     def get_urls(self, keyword: str) -> dict[str, int]:
+        if not self._postings_loaded:
+            self._load_postings()
         keyword = normalize_string(keyword)
         return self._index[keyword]
+
+    def release_postings(self) -> None:
+        """Free the dict postings of a compiled engine, searches only need the arrays.
+
+        They are rebuilt from the compiled index when documents are indexed again.
+        """
+        if self._compiled is None:
+            raise ValueError("Only a compiled engine can release its postings")
+        self._index.clear()
+        self._positions.clear()
+        self._documents.clear()
+        self._postings_loaded = False
@@ -0,0 +1,105 @@
+import argparse
+import gc
+import logging
+import os
+import signal
+import socket
+import time
+import uvicorn
+
+
+logger = logging.getLogger(__name__)
+
+
+def bind_socket(host: str, port: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    return sock
+
+
+def preload_search_state() -> None:
+    """Build the search state in the parent, before the workers are forked.
+
+    Forked workers share its pages copy-on-write. Freezing moves every object
+    alive now out of the collector's reach, so collections in the workers do
+    not write to the shared pages.
+    """
+    from app.config import Config
+    from app.utils import load_search_state
+
+    if Config.search_shards > 1:
+        # Shard pipes cannot be shared, every worker starts its own shards after the fork
+        logger.info("Not preloading the search state of a sharded engine")
+        return
+    start = time.perf_counter()
+    load_search_state()
+    gc.collect()
+    gc.freeze()
+    logger.info(f"Preloaded the search state in {time.perf_counter() - start:.2f}s, "
+                f"{gc.get_freeze_count()} objects frozen")
+
+
+def run_worker(sock: socket.socket) -> None:
+    from app.main import app
+
+    gc.enable()
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    uvicorn.Server(uvicorn.Config(app, log_level="info")).run(sockets=[sock])
+
+
+def fork_worker(sock: socket.socket) -> int:
+    pid = os.fork()
+    if pid == 0:
+        try:
+            run_worker(sock)
+        finally:
+            os._exit(0)
+    return pid
+
+
+def serve(host: str, port: int, workers: int, preload: bool = True) -> None:
+    """Prefork server: the workers accept on a socket bound once by the parent."""
+    # Disabled until the fork, so the objects allocated meanwhile are not collected and moved
+    gc.disable()
+    sock = bind_socket(host, port)
+    import app.main  # noqa: F401 (imported once, the workers share the modules)
+    if preload:
+        preload_search_state()
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(pids):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    pids = {fork_worker(sock) for _ in range(workers)}
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    logger.info(f"Serving on http://{host}:{port} with {workers} workers")
+    while pids:
+        pid, status = os.wait()
+        pids.discard(pid)
+        if not stopping:
+            logger.warning(f"Worker {pid} exited with status {status}, restarting it")
+            time.sleep(1)
+            pids.add(fork_worker(sock))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the app with forked workers")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", 8000)))
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--no-preload", action="store_true",
+                        help="every worker builds its own search state")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    serve(args.host, args.port, args.workers, preload=not args.no_preload)
@@ -0,0 +1,204 @@
+import multiprocessing
+import numpy as np
+import os
+import threading
+import weakref
+
+from app.fuzzy import WordCorrector
+from app.search_engine import Analyzer, next_generation, SearchEngine
+
+
+class _Shard:
+    # Index shard living in a worker process, driven by ShardedSearchEngine
+    def __init__(self, engine_kwargs: dict):
+        self.engine = SearchEngine(**engine_kwargs)
+        self.global_ids = np.empty(0, dtype=np.int64)
+
+    def bulk_index(self, documents: list[tuple[str, str]], global_ids: list[int],
+                   batch_size: int) -> None:
+        self.engine.bulk_index(documents, batch_size=batch_size)
+        self.engine.compile()
+        self.global_ids = np.concatenate([self.global_ids, np.array(global_ids, dtype=np.int64)])
+
+    def statistics(self) -> tuple[int, int, dict[str, int], dict[str, str]]:
+        engine = self.engine
+        return (engine.statistics.number_of_documents, engine.statistics.total_tokens,
+                engine.document_frequencies(), engine.analyzer.table)
+
+    def use_global_statistics(self, number_of_documents: int, total_tokens: int,
+                              document_frequencies: dict[str, int]) -> None:
+        self.engine.use_global_statistics(number_of_documents, total_tokens,
+                                          document_frequencies)
+
+    def rank_keywords(self, keywords: list[str], k: int) -> list[tuple]:
+        docs, scores, first_seen = self.engine.rank_keywords(keywords, k)
+        urls = self.engine._compiled.urls[docs].tolist()
+        return list(zip(scores.tolist(), first_seen.tolist(),
+                        self.global_ids[docs].tolist(), urls))
+
+
+def _shard_worker(connection, engine_kwargs: dict) -> None:
+    shard = _Shard(engine_kwargs)
+    while True:
+        command, args = connection.recv()
+        if command is None:
+            break
+        try:
+            connection.send((True, getattr(shard, command)(*args)))
+        except Exception as e:
+            connection.send((False, e))
+
+
+def _close_shards(pid: int, connections: list, processes: list) -> None:
+    if os.getpid() != pid:
+        # A forked copy of the engine, the shards belong to the process that started them
+        return
+    for connection in connections:
+        try:
+            connection.send((None, ()))
+        except OSError:
+            # The shard process is already gone
+            pass
+        connection.close()
+    for process in processes:
+        process.join()
+
+
+def _receive(lock: threading.Lock, connection) -> tuple:
+    try:
+        return connection.recv()
+    except Exception as e:
+        # The shard process is gone or its reply cannot be unpickled
+        return False, e
+    finally:
+        lock.release()
+
+
+class ShardedSearchEngine:
+    """SearchEngine partitioned over worker processes, one index shard each.
+
+    Documents are dealt round-robin to the shards. After indexing, the
+    coordinator sums the shard statistics (documents, tokens, document
+    frequencies) and sends them back, so every shard scores with the idf and
+    avdl of the whole corpus. A query is analyzed once, broadcast to all
+    shards and their top-k lists are merged with the tie-breaking of
+    SearchEngine.search_topk, which makes the results identical to a single
+    engine over the same documents. Misspelled words are corrected by the
+    coordinator, from the words and document frequencies of all shards.
+    Phrase and proximity queries are not supported. The shard processes stop
+    on close(), or once the engine is no longer referenced. Only the process
+    that started them queries the shards, a forked process starts its own.
+    """
+
+    def __init__(self, n_shards: int = 2, **engine_kwargs):
+        engine_kwargs["positions"] = False
+        self.analyzer = Analyzer(text_processing=engine_kwargs.get("text_processing"),
+                                 stopwords=engine_kwargs.get("stopwords", False))
+        self.fuzzy_distance = engine_kwargs.get("fuzzy_distance", 0)
+        self.number_of_documents = 0
+        self._document_frequencies: dict[str, int] = {}
+        self._corrector: WordCorrector = None
+        self._corrector_lock = threading.Lock()
+        self.generation = next_generation()
+        self._pid = os.getpid()
+        self._locks = [threading.Lock() for _ in range(n_shards)]
+        self._connections = []
+        self._processes = []
+        for _ in range(n_shards):
+            parent_connection, child_connection = multiprocessing.Pipe()
+            process = multiprocessing.Process(
+                target=_shard_worker, args=(child_connection, engine_kwargs), daemon=True
+            )
+            process.start()
+            child_connection.close()
+            self._connections.append(parent_connection)
+            self._processes.append(process)
+        # Does not reference the engine, so it runs when the engine is collected
+        self._finalizer = weakref.finalize(
+            self, _close_shards, self._pid, self._connections, self._processes
+        )
+
+    @property
+    def n_shards(self) -> int:
+        return len(self._connections)
+
+    @property
+    def forked(self) -> bool:
+        """True in a process forked after the shards were started, which cannot query them."""
+        return os.getpid() != self._pid
+
+    def _scatter_gather(self, command: str, shard_args: list[tuple]) -> list:
+        if self.forked:
+            raise RuntimeError("The shards were started by another process")
+        # The shards are locked in order and each released once it replied, so the next
+        # query is sent to a shard while this one still waits on the others
+        sent = []
+        try:
+            for lock, connection, args in zip(self._locks, self._connections, shard_args):
+                lock.acquire()
+                try:
+                    connection.send((command, args))
+                except BaseException:
+                    lock.release()
+                    raise
+                sent.append((lock, connection))
+        finally:
+            # Every command sent is answered, so no reply is left for a later query
+            replies = [_receive(lock, connection) for lock, connection in sent]
+        for ok, result in replies:
+            if not ok:
+                raise result
+        return [result for _, result in replies]
+
+    def bulk_index(self, documents: list[tuple[str, str]], batch_size: int = 256) -> None:
+        documents = list(documents)
+        global_ids = range(self.number_of_documents, self.number_of_documents + len(documents))
+        self._scatter_gather("bulk_index", [
+            (documents[shard::self.n_shards], list(global_ids[shard::self.n_shards]), batch_size)
+            for shard in range(self.n_shards)
+        ])
+        self.number_of_documents += len(documents)
+        self._share_statistics()
+        self.generation = next_generation()
+
+    def _share_statistics(self) -> None:
+        shard_statistics = self._scatter_gather("statistics", [()] * self.n_shards)
+        total_tokens = 0
+        document_frequencies: dict[str, int] = {}
+        for _, shard_tokens, shard_frequencies, analyzer_table in shard_statistics:
+            total_tokens += shard_tokens
+            for term, frequency in shard_frequencies.items():
+                document_frequencies[term] = document_frequencies.get(term, 0) + frequency
+            self.analyzer.table.update(analyzer_table)
+        self._document_frequencies = document_frequencies
+        self._corrector = None
+        global_statistics = (self.number_of_documents, total_tokens, document_frequencies)
+        self._scatter_gather("use_global_statistics", [global_statistics] * self.n_shards)
+
+    def query_keywords(self, query: str) -> list[str]:
+        if not self.fuzzy_distance:
+            return self.analyzer.analyze(query)
+        with self._corrector_lock:
+            if self._corrector is None:
+                self._corrector = self.analyzer.corrector(self._document_frequencies,
+                                                          self.fuzzy_distance)
+            corrector = self._corrector
+        return self.analyzer.analyze_corrected(query, self._document_frequencies, corrector)
+
+    def document_frequencies(self) -> dict[str, int]:
+        return self._document_frequencies
+
+    def search_topk(self, query: str, k: int) -> list[tuple[str, float]]:
+        keywords = self.query_keywords(query)
+        shard_results = self._scatter_gather("rank_keywords", [(keywords, k)] * self.n_shards)
+        merged = sorted(
+            (entry for results in shard_results for entry in results),
+            key=lambda entry: (-entry[0], entry[1], entry[2]),
+        )
+        return [(url, score) for score, _, _, url in merged[:k]]
+
+    def search_many(self, queries: list[str], k: int) -> list[list[tuple[str, float]]]:
+        return [self.search_topk(query, k) for query in queries]
+
+    def close(self) -> None:
+        self._finalizer()
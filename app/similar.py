@@ -0,0 +1,294 @@
+import numpy as np
+
+from pathlib import Path
+
+from pandas import DataFrame, factorize, Series
+
+from app.dataset import load_arrays, save_arrays
+from app.dense import top_rows, transpose_csr
+from app.records import RankedMovies
+from app.search_engine import SearchEngine
+
+
+# Upper bound on the feature products expanded at once by SimilarityIndex.update
+MAX_PRODUCTS = 1 << 24
+# Upper bound on the cells of a block of similarity scores
+MAX_CELLS = 1 << 20
+# Features of at most this many movies are never skipped, so small catalogs are exact
+MIN_DF_CUTOFF = 1000
+
+
+def expand_ranges(starts: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    """Concatenation of the ranges start, start + 1, ..., start + length - 1."""
+    offsets = np.cumsum(lengths) - lengths
+    return np.repeat(starts - offsets, lengths) + np.arange(lengths.sum())
+
+
+def to_csr(rows: np.ndarray,
+           columns: np.ndarray,
+           values: np.ndarray,
+           n_rows: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    order = np.lexsort((columns, rows))
+    indptr = np.zeros(n_rows + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=n_rows), out=indptr[1:])
+    return indptr, columns[order].astype(np.int32), values[order].astype(np.float32)
+
+
+def unit_rows(rows: np.ndarray, values: np.ndarray, n_rows: int, weight: float) -> np.ndarray:
+    """Values scaled so each row has a norm of sqrt(weight), and so a dot product of weight."""
+    norms = np.sqrt(np.bincount(rows, weights=values ** 2, minlength=n_rows))
+    return values / norms[rows] * np.sqrt(weight)
+
+
+def list_features(column: Series) -> tuple[np.ndarray, np.ndarray, np.ndarray, int]:
+    """Rows, value ids and idf of the values of a column of lists, empty values excluded."""
+    rows = np.repeat(np.arange(len(column)), [len(values) for values in column])
+    codes, uniques = factorize(
+        np.array([value for values in column for value in values], dtype=object)
+    )
+    keys = np.unique(rows.astype(np.int64) * max(len(uniques), 1) + codes)
+    rows, codes = np.divmod(keys, max(len(uniques), 1))
+    present = uniques[codes] != ""
+    rows, codes = rows[present], codes[present]
+    idf = np.log(1 + len(column) / np.maximum(np.bincount(codes, minlength=len(uniques)), 1))
+    return rows, codes, idf[codes], len(uniques)
+
+
+def movie_features(documents: DataFrame,
+                   search_engine: SearchEngine,
+                   plot_weight: float,
+                   tag_weight: float,
+                   genre_weight: float) -> tuple[tuple[np.ndarray, np.ndarray, np.ndarray], int]:
+    """CSR of the movies, rows aligned with the documents, and its number of features.
+
+    The features are the BM25 weights of the plot terms followed by the idf
+    of the tags and of the genres. Each of the three parts is scaled to a
+    norm of sqrt(weight), so the dot product of two movies is the weighted
+    sum of their plot, tags and genres cosine similarities.
+    """
+    n_rows = len(documents)
+    row_of_url = {url: row for row, url in enumerate(documents["url"])}
+    term_indptr, doc_ids, weights = search_engine.bm25_weights()
+    urls = search_engine.urls_of(np.arange(search_engine.number_of_documents))
+    row_of_doc = np.array([row_of_url.get(url, -1) for url in urls], dtype=np.int64)
+    n_terms = len(term_indptr) - 1
+    plot_rows = row_of_doc[doc_ids]
+    indexed = plot_rows >= 0
+    parts = [(
+        plot_rows[indexed],
+        np.repeat(np.arange(n_terms), np.diff(term_indptr))[indexed],
+        weights[indexed],
+        n_terms,
+        plot_weight,
+    )]
+    parts += [(*list_features(documents[column]), weight)
+              for column, weight in [("tags", tag_weight), ("genre", genre_weight)]]
+    rows, columns, values = [], [], []
+    n_features = 0
+    for part_rows, part_columns, part_values, part_features, weight in parts:
+        rows.append(part_rows)
+        columns.append(part_columns + n_features)
+        values.append(unit_rows(part_rows, part_values, n_rows, weight))
+        n_features += part_features
+    csr = to_csr(np.concatenate(rows), np.concatenate(columns), np.concatenate(values), n_rows)
+    return csr, n_features
+
+
+def best_neighbors(ids: np.ndarray,
+                   scores: np.ndarray,
+                   n_neighbors: int) -> tuple[np.ndarray, np.ndarray]:
+    """n_neighbors best candidates of each row, padded with id -1 past the positive scores."""
+    top = top_rows(scores.T, n_neighbors).T
+    top_scores = np.take_along_axis(scores, top, axis=1)
+    positive = top_scores > 0
+    best_ids = np.full((len(scores), n_neighbors), -1, dtype=np.int32)
+    best_scores = np.zeros((len(scores), n_neighbors), dtype=np.float16)
+    best_ids[:, :top.shape[1]] = np.where(positive, np.take_along_axis(ids, top, axis=1), -1)
+    best_scores[:, :top.shape[1]] = np.where(positive, top_scores, 0)
+    return best_ids, best_scores
+
+
+class SimilarityIndex:
+    """The n_neighbors most similar rows of every row of a sparse feature matrix.
+
+    Similarities are dot products of the rows, computed for a block of rows
+    at once by expanding the postings of their features in the feature-major
+    matrix and summing the products per (row, other row) cell. Features of
+    more than max_df of the rows (and MIN_DF_CUTOFF rows) are skipped, they
+    add little to a similarity and most of its cost. Neighbor lists are int32
+    row ids and float16 scores, -1 padded.
+    """
+
+    def __init__(self, ids: np.ndarray, scores: np.ndarray, max_df: float = 0.05):
+        self.ids = ids
+        self.scores = scores
+        self.max_df = max_df
+
+    @classmethod
+    def build(cls,
+              features: tuple[np.ndarray, np.ndarray, np.ndarray],
+              n_features: int,
+              n_neighbors: int = 10,
+              max_df: float = 0.05) -> "SimilarityIndex":
+        index = cls(
+            np.empty((0, n_neighbors), dtype=np.int32),
+            np.empty((0, n_neighbors), dtype=np.float16),
+            max_df,
+        )
+        index.update(features, n_features)
+        return index
+
+    @property
+    def n_neighbors(self) -> int:
+        return self.ids.shape[1]
+
+    def update(self,
+               features: tuple[np.ndarray, np.ndarray, np.ndarray],
+               n_features: int) -> None:
+        """Index the rows of features past the already indexed ones.
+
+        The rows already indexed keep their neighbor lists, merged with the
+        new rows, so their scores are the ones of the features they were
+        computed with.
+        """
+        n_rows, n_indexed = len(features[0]) - 1, len(self)
+        features, by_feature = kept_features(features, n_features, self.max_df)
+        # Products expanded for the rows before each row
+        expanded = np.zeros(len(features[1]) + 1, dtype=np.int64)
+        np.cumsum(np.diff(by_feature[0])[features[1]], out=expanded[1:])
+        work = expanded[features[0]]
+        new_ids, new_scores = [], []
+        start = n_indexed
+        while start < n_rows:
+            stop = int(np.searchsorted(work, work[start] + MAX_PRODUCTS, side="right")) - 1
+            stop = max(min(stop, start + max(1, MAX_CELLS // n_rows), n_rows), start + 1)
+            block = block_scores(features, by_feature, start, stop, n_rows)
+            # A movie is not its own neighbor
+            block[np.arange(stop - start), np.arange(start, stop)] = -np.inf
+            block_ids = np.broadcast_to(np.arange(n_rows, dtype=np.int32), block.shape)
+            top_ids, top_scores = best_neighbors(block_ids, block, self.n_neighbors)
+            new_ids.append(top_ids)
+            new_scores.append(top_scores)
+            if n_indexed:
+                self._merge(block[:, :n_indexed].T, start)
+            start = stop
+        self.ids = np.concatenate([self.ids, *new_ids])
+        self.scores = np.concatenate([self.scores, *new_scores])
+
+    def _merge(self, scores: np.ndarray, start: int) -> None:
+        # scores of the indexed rows (rows) with the new rows start, start + 1, ... (columns)
+        ids = np.concatenate([
+            self.ids,
+            np.broadcast_to(np.arange(start, start + scores.shape[1], dtype=np.int32),
+                            scores.shape),
+        ], axis=1)
+        candidates = np.concatenate([self.scores.astype(np.float64), scores], axis=1)
+        self.ids, self.scores = best_neighbors(ids, candidates, self.n_neighbors)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def nbytes(self) -> int:
+        return self.ids.nbytes + self.scores.nbytes
+
+    def neighbors(self, row: int, n: int = None) -> tuple[np.ndarray, np.ndarray]:
+        ids, scores = self.ids[row, :n], self.scores[row, :n]
+        found = ids >= 0
+        return ids[found], scores[found]
+
+
+def kept_features(features: tuple[np.ndarray, np.ndarray, np.ndarray],
+                  n_features: int,
+                  max_df: float) -> tuple[tuple, tuple]:
+    """Row-major and feature-major CSR of the features of at most max_df of the rows."""
+    indptr, columns, values = features
+    feature_df = np.bincount(columns, minlength=n_features)
+    cutoff = max(max_df * (len(indptr) - 1), MIN_DF_CUTOFF)
+    kept = feature_df[columns] <= cutoff
+    rows = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))[kept]
+    features = to_csr(rows, columns[kept], values[kept], len(indptr) - 1)
+    return features, transpose_csr(*features, n_columns=n_features)
+
+
+def block_scores(features: tuple, by_feature: tuple,
+                 start: int, stop: int, n_rows: int) -> np.ndarray:
+    """Dot products of the rows start to stop with every row."""
+    indptr, columns, values = features
+    feature_indptr, feature_rows, feature_values = by_feature
+    first, last = indptr[start], indptr[stop]
+    block_columns = columns[first:last]
+    lengths = feature_indptr[block_columns + 1] - feature_indptr[block_columns]
+    positions = expand_ranges(feature_indptr[block_columns], lengths)
+    block_rows = np.repeat(np.arange(stop - start), np.diff(indptr[start:stop + 1]))
+    cells = np.repeat(block_rows, lengths) * n_rows + feature_rows[positions]
+    products = np.repeat(values[first:last], lengths) * feature_values[positions]
+    scores = np.bincount(cells, weights=products, minlength=(stop - start) * n_rows)
+    return scores.reshape(stop - start, n_rows)
+
+
+class SimilarMovies:
+    """Precomputed "more like this" movies of every movie of the documents."""
+
+    # Columns of the movies DataFrame read by build()
+    COLUMNS = ["movie_id", "url", "tags", "genre"]
+
+    def __init__(self,
+                 movie_ids: list[str],
+                 index: SimilarityIndex,
+                 weights: tuple[float, float, float] = (0.6, 0.3, 0.1)):
+        self.row_of_movie = {movie_id: row for row, movie_id in enumerate(movie_ids)}
+        self.index = index
+        self.weights = weights
+
+    @classmethod
+    def build(cls,
+              documents: DataFrame,
+              search_engine: SearchEngine,
+              n_neighbors: int = 10,
+              plot_weight: float = 0.6,
+              tag_weight: float = 0.3,
+              genre_weight: float = 0.1,
+              max_df: float = 0.05) -> "SimilarMovies":
+        features = movie_features(documents, search_engine, plot_weight, tag_weight, genre_weight)
+        index = SimilarityIndex.build(*features, n_neighbors=n_neighbors, max_df=max_df)
+        return cls(list(documents["movie_id"]), index, (plot_weight, tag_weight, genre_weight))
+
+    def save(self, directory: Path, parameters: dict) -> Path:
+        """Write the neighbors to directory, with the parameters they were built with."""
+        return save_arrays(directory, {"ids": self.index.ids, "scores": self.index.scores},
+                           parameters)
+
+    @classmethod
+    def load(cls,
+             directory: Path,
+             parameters: dict,
+             movie_ids: list[str],
+             weights: tuple[float, float, float] = (0.6, 0.3, 0.1)) -> "SimilarMovies":
+        """Memory-mapped neighbors saved by save() with the same parameters, or None.
+
+        The parameters must identify the movies, whose ids are movie_ids.
+        """
+        arrays = load_arrays(directory, parameters)
+        if arrays is None:
+            return None
+        return cls(movie_ids, SimilarityIndex(arrays["ids"], arrays["scores"]), weights)
+
+    @property
+    def nbytes(self) -> int:
+        return self.index.nbytes
+
+    def add(self, documents: DataFrame, search_engine: SearchEngine) -> None:
+        """Index the movies appended to the documents since the last call.
+
+        The search engine has to be compiled with the plots of all the documents.
+        """
+        for row, movie_id in enumerate(documents["movie_id"][len(self.index):], len(self.index)):
+            self.row_of_movie[movie_id] = row
+        self.index.update(*movie_features(documents, search_engine, *self.weights))
+
+    def similar(self, movie_id: str, n: int = None) -> RankedMovies:
+        """Most similar movies first, with their similarity as relevancy. KeyError for an
+        unknown movie."""
+        rows, scores = self.index.neighbors(self.row_of_movie[movie_id], n)
+        return RankedMovies(rows.astype(np.int64), scores.astype(np.float64))
@@ -4,6 +4,7 @@ const carousel = document.getElementById("carousel");
 const tagContainer = document.querySelector(".tag-container");
 const showMoreButton = document.querySelector(".plus-circle");
 const filtersRow = document.getElementById("filtersRow");
+const suggestions = document.getElementById("suggestions");
 
 let selectedTag = null;  // Track selected tag
 let allTags = [];        // Store all tags from backend
@@ -15,6 +16,7 @@ let nResultsLimit = null;
 let dateFilterValue = "all_years"; 
 let openMenu = null; 
 let fetchedMovies = []; 
+let lastSearch = null;   // Query and is_tag of the last fetch, refetched when a control changes
 
 // Initialize Swiper carousel
 const swiper = new Swiper(".swiper-container", {
@@ -108,12 +110,7 @@ function sortBy(field) {
     currentSortingOption = field;
     updateActiveSortOption(); // Mark selected option as active
     applyFiltersAndDisplay(); // Apply filters and display
-
-    if (selectedTag) {
-        fetchMoviesByTag(selectedTag.textContent);
-    } else {
-        searchMovie();
-    }
+    refetchMovies();
 }
 
 // Set sort order (ascending or descending)
@@ -121,11 +118,7 @@ function setSortOrder(order) {
     currentSortOrder = order;
     updateActiveSortOrder(); // Mark selected order as active
     applyFiltersAndDisplay(); // Apply filters and display
-    if (selectedTag) {
-        fetchMoviesByTag(selectedTag.textContent);
-    } else {
-        searchMovie();
-    }
+    refetchMovies();
 }
 
 // Helper function to mark the active sort option
@@ -156,12 +149,7 @@ function setDateFilter(value) {
     updateActiveDateOption(); // Mark selected option as active
     toggleDateMenu();
     applyFiltersAndDisplay(); // Apply filters and display
-
-    if (selectedTag) {
-        fetchMoviesByTag(selectedTag.textContent);
-    } else {
-        searchMovie();
-    }
+    refetchMovies();
 }
 
 // Helper function to mark the active date option
@@ -181,6 +169,7 @@ function setResultsLimit(value) {
     updateActiveResultsOption();
     toggleResultsMenu();
     applyFiltersAndDisplay(); // Apply filters, sort, limit, and display
+    refetchMovies();
 }
 // Helper function to mark the active results option
 function updateActiveResultsOption() {
@@ -289,14 +278,29 @@ async function fetchMoviesByTag(tag) {
     await fetchMovies({ query: tag, is_tag: true });
 }
 
+// Fetch the last search again with the current sort, date filter and limit,
+// show all and tag results included
+async function refetchMovies() {
+    if (lastSearch) {
+        await fetchMovies(lastSearch);
+    }
+}
+
 // Unified fetch function to interact with /search_relevancy endpoint
 async function fetchMovies({ query = "", is_tag = false } = {}) {
+    lastSearch = { query: query, is_tag: is_tag };
     try {
         // Construct query parameters
         const params = new URLSearchParams({
             query: query,
-            is_tag: is_tag
+            is_tag: is_tag,
+            sort_by: currentSortingOption,
+            sort_order: currentSortOrder
         });
+        // Filter and limit on the server, so only the displayed movies are sent
+        const minReleaseDate = minReleaseDateFilter();
+        if (minReleaseDate) params.append("min_release_date", minReleaseDate);
+        if (nResultsLimit) params.append("limit", nResultsLimit);
 
         const endpoint = `/search_disney_movie?${params.toString()}`;
         const response = await fetch(endpoint);
@@ -437,6 +441,21 @@ function displayMovies(movies) {
 }
 
 
+// Minimum release date (YYYY-MM-DD) of the selected date filter, null for all years
+function minReleaseDateFilter() {
+    const today = new Date();
+    let minDate = null;
+    if (dateFilterValue === "past_year") {
+        minDate = new Date(today.getFullYear() - 1, today.getMonth(), today.getDate());
+    } else if (dateFilterValue === "past_decade") {
+        minDate = new Date(today.getFullYear() - 10, today.getMonth(), today.getDate());
+    }
+    if (!minDate) return null;
+    const month = String(minDate.getMonth() + 1).padStart(2, "0");
+    const day = String(minDate.getDate()).padStart(2, "0");
+    return `${minDate.getFullYear()}-${month}-${day}`;
+}
+
 // Filter movies based on the selected date filter
 function filterMoviesByDate(movies) {
     const today = new Date();
@@ -480,6 +499,33 @@ function sortMovies(movies) {
     });
 }
 
+// Suggest completions while typing
+let suggestTimer = null;
+searchText.addEventListener("input", () => {
+    clearTimeout(suggestTimer);
+    suggestTimer = setTimeout(fetchSuggestions, 50);
+});
+
+async function fetchSuggestions() {
+    const prefix = searchText.value.trim();
+    if (prefix === "") {
+        suggestions.replaceChildren();
+        return;
+    }
+    try {
+        const response = await fetch(`/suggest?prefix=${encodeURIComponent(prefix)}`);
+        const data = await response.json();
+        const texts = [...new Set([...data.titles, ...data.tags, ...data.words])];
+        suggestions.replaceChildren(...texts.map((text) => {
+            const option = document.createElement("option");
+            option.value = text;
+            return option;
+        }));
+    } catch (error) {
+        console.error("Error fetching suggestions:", error);
+    }
+}
+
 // Trigger search on Enter key press
 searchText.addEventListener("keypress", (event) => {
     if (event.key === "Enter"){
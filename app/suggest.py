@@ -0,0 +1,144 @@
+import numpy as np
+
+from bisect import bisect_left
+from typing import Callable
+
+from pandas import DataFrame, to_numeric
+
+from app.records import PackedBytes
+
+
+# Greater than every byte of UTF-8 text, prefix + END bounds the keys starting with prefix
+END = b"\xff"
+
+
+def normalize_prefix(text: str) -> str:
+    return " ".join(text.lower().split())
+
+
+def word_suffixes(text: str) -> list[str]:
+    """Keys of a title, so "lion" completes "The Lion King"."""
+    words = normalize_prefix(text).split(" ")
+    return [" ".join(words[i:]) for i in range(len(words))]
+
+
+class PrefixIndex:
+    """Completions of a prefix, ranked by the score of their entry.
+
+    The keys are sorted in one buffer, the keys starting with a prefix are the
+    range between two binary searches. Each key points to its entry, an entry
+    can have several keys. The top entries of every prefix shared by more than
+    max_scan keys are computed at build, so a lookup ranks at most max_scan keys.
+    """
+
+    def __init__(self,
+                 texts: list[str],
+                 scores: list[float],
+                 keys_of: Callable[[str], list[str]] = None,
+                 limit: int = 10,
+                 max_scan: int = 256):
+        keys_of = keys_of or (lambda text: [normalize_prefix(text)])
+        pairs = sorted({
+            (key.encode(), entry) for entry, text in enumerate(texts) for key in keys_of(text)
+        })
+        self.limit = limit
+        self.max_scan = max_scan
+        self.texts = PackedBytes([text.encode() for text in texts])
+        self.keys = PackedBytes([key for key, _ in pairs])
+        self.entries = np.array([entry for _, entry in pairs], dtype=np.int32)
+        self.key_scores = np.asarray(scores, dtype=np.float32)[self.entries]
+        self.top = self._precompute()
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    @property
+    def nbytes(self) -> int:
+        packed = [self.texts, self.keys]
+        return (
+            sum(len(p.buffer) + p.offsets.nbytes for p in packed)
+            + self.entries.nbytes + self.key_scores.nbytes
+            + sum(len(prefix) + top.nbytes for prefix, top in self.top.items())
+        )
+
+    def _rank(self, start: int, stop: int, n: int) -> np.ndarray:
+        order = np.argsort(-self.key_scores[start:stop], kind="stable")
+        entries = self.entries[start:stop][order]
+        # Best key of each entry only
+        _, first = np.unique(entries, return_index=True)
+        return entries[np.sort(first)[:n]]
+
+    def _precompute(self) -> dict[bytes, np.ndarray]:
+        # Prefixes one byte longer at each pass, within the ranges that were too large
+        top = {b"": self._rank(0, len(self.keys), self.limit)}
+        ranges = [(0, len(self.keys))] if len(self.keys) > self.max_scan else []
+        length = 1
+        while ranges:
+            large = []
+            for start, stop in ranges:
+                while start < stop:
+                    key = self.keys[start]
+                    if len(key) < length:
+                        start += 1
+                        continue
+                    end = bisect_left(self.keys, key[:length] + END, start, stop)
+                    if end - start > self.max_scan:
+                        top[key[:length]] = self._rank(start, end, self.limit)
+                        large.append((start, end))
+                    start = end
+            ranges = large
+            length += 1
+        return top
+
+    def complete(self, prefix: str, n: int = None) -> list[str]:
+        n = min(n or self.limit, self.limit)
+        key = normalize_prefix(prefix).encode()
+        top = self.top.get(key)
+        if top is None:
+            start = bisect_left(self.keys, key)
+            top = self._rank(start, bisect_left(self.keys, key + END, start), n)
+        return [text.decode() for text in self.texts.take(top[:n])]
+
+
+class Suggester:
+    """Completions of the search box: movie titles, tags and indexed words.
+
+    Titles rank by box office, tags by their number of movies and words by the
+    document frequency of their indexed term.
+    """
+
+    # Columns of the movies DataFrame read by the suggester
+    COLUMNS = ["title", "box_office", "tags"]
+
+    def __init__(self, documents: DataFrame, search_engine, limit: int = 10):
+        box_office = to_numeric(documents["box_office"], errors="coerce").fillna(0)
+        titles = box_office.groupby(documents["title"].to_numpy()).max()
+        titles = titles[titles.index != ""]
+        self.titles = PrefixIndex(
+            titles.index.to_list(), titles.to_list(), keys_of=word_suffixes, limit=limit
+        )
+        tags = documents["tags"].explode().value_counts()
+        tags = tags[tags.index != ""]
+        self.tags = PrefixIndex(tags.index.to_list(), tags.to_list(), limit=limit)
+
+        frequencies = search_engine.document_frequencies()
+        words = {}
+        for word, terms in search_engine.analyzer.table.items():
+            frequency = max(frequencies.get(term, 0) for term in terms.split(" "))
+            if frequency and len(word) > 1:
+                words[word] = frequency
+        self.words = PrefixIndex(list(words), list(words.values()), limit=limit)
+
+    @property
+    def nbytes(self) -> int:
+        return self.titles.nbytes + self.tags.nbytes + self.words.nbytes
+
+    def suggest(self, prefix: str, n: int = None) -> dict[str, list[str]]:
+        # Words complete the last word of the prefix
+        head, _, last = normalize_prefix(prefix).rpartition(" ")
+        head = f"{head} " if head else ""
+        return {
+            "titles": self.titles.complete(prefix, n),
+            "tags": self.tags.complete(prefix, n),
+            "words": [head + word for word in self.words.complete(last, n)] if last else [],
+        }
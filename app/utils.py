@@ -1,20 +1,72 @@
 
-from pandas import (
-    DataFrame,
-    merge,
-    read_csv,
-    Series,
-    to_datetime,
-)
+import gc
+import hashlib
+import logging
+import numpy as np
+import threading
+import time
+
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable
+
+from pandas import DataFrame, read_csv
 
 from app.config import Config
-from app.constants import IMAGES_PATH_GITHUB
-from app.search_engine import SearchEngine
-from data.constants import DATASET_GITHUB
+from app.cache import MISSING, ResponseCache
+from app.dataset import load_dataset, save_dataset
+from app.dense import DenseIndex, reciprocal_rank_fusion
+from app.facets import FacetIndex, MovieFilters, TagSampler
+from app.metrics import count_queries, stage
+from app.records import RankedMovies, RecordStore
+from app.search_engine import PHRASE_PATTERN, SearchEngine
+from app.sharding import ShardedSearchEngine
+from app.similar import SimilarMovies
+from app.suggest import Suggester
+
+
+logger = logging.getLogger(__name__)
+
+# Columns read by the search engine, facets, records, suggester, tag sampler and
+# similar movies, the only ones loaded from the dataset cache
+INDEX_COLUMNS = ["url", "description"]
+DOCUMENT_COLUMNS = list(dict.fromkeys(
+    INDEX_COLUMNS + FacetIndex.COLUMNS + RecordStore.COLUMNS + Suggester.COLUMNS + ["tags"]
+    + SimilarMovies.COLUMNS
+))
+
+_state = None
+# Held while a search state is built, so at most two states (serving and next) exist
+_state_lock = threading.Lock()
+_response_cache = ResponseCache(
+    max_entries=Config.response_cache_entries,
+    max_bytes=Config.response_cache_bytes,
+    ttl=Config.response_cache_ttl,
+)
+
 
+@dataclass(frozen=True)
+class SearchState:
+    """Documents and everything built from them, swapped as a whole on reload."""
+    documents: DataFrame
+    search_engine: SearchEngine
+    facet_index: FacetIndex
+    record_store: RecordStore
+    suggester: Suggester
+    tag_sampler: TagSampler
+    # None when dense retrieval or similar movies are disabled
+    dense_index: DenseIndex = None
+    similar_movies: SimilarMovies = None
+    build_seconds: float = None
 
-_documents = None
-_search_engine = None
+    @property
+    def generation(self) -> int:
+        return self.search_engine.generation
+
+    @property
+    def inherited(self) -> bool:
+        """Forked from another process with shards only that process can query."""
+        return isinstance(self.search_engine, ShardedSearchEngine) and self.search_engine.forked
 
 
 def list_parser(stringified_list: str) -> list:
@@ -22,27 +74,245 @@ def list_parser(stringified_list: str) -> list:
     return [item.strip() for item in lst]
 
 
+def read_documents(path: str = None) -> DataFrame:
+    documents = read_csv(
+        path or Config.dataset_path,
+        parse_dates=["release_date"],
+    ).fillna("").sort_values(by="release_date", ascending=False)
+    documents = documents[documents["description"] != ""]
+    for column in ["tags", "genre"]:
+        documents[column] = documents[column].apply(list_parser)
+    return documents
+
+
+def load_documents(refresh: bool = False) -> DataFrame:
+    """Documents from the local dataset cache, read from the dataset source
+    when refresh is set or the cache is missing, stale or corrupt.
+
+    Only the DOCUMENT_COLUMNS are loaded from the cache.
+    """
+    documents = None
+    if not refresh:
+        documents = load_dataset(Config.dataset_cache_dir, Config.dataset_path,
+                                 columns=DOCUMENT_COLUMNS)
+        if documents is None:
+            logger.info(f"Dataset cache missing or stale, reading {Config.dataset_path}")
+    if documents is None:
+        documents = read_documents()
+        try:
+            save_dataset(documents, Config.dataset_cache_dir, Config.dataset_path)
+        except OSError as e:
+            logger.warning(f"Could not save the dataset cache: {e}")
+    return documents
+
+
+def build_search_state(documents: DataFrame = None,
+                       search_engine: SearchEngine = None,
+                       refresh: bool = False) -> SearchState:
+    start = time.perf_counter()
+    documents = load_documents(refresh) if documents is None else documents
+    search_engine = search_engine or build_search_engine(documents)
+    return SearchState(
+        documents=documents,
+        search_engine=search_engine,
+        facet_index=FacetIndex(documents),
+        record_store=RecordStore(documents),
+        suggester=Suggester(documents, search_engine, limit=Config.suggest_limit),
+        tag_sampler=TagSampler(documents["tags"]),
+        dense_index=build_dense_index(search_engine),
+        similar_movies=build_similar_movies(documents, search_engine),
+        build_seconds=time.perf_counter() - start,
+    )
+
+
+def get_search_state() -> SearchState:
+    global _state
+    if _state is None or _state.inherited:
+        with _state_lock:
+            if _state is None or _state.inherited:
+                _state = build_search_state()
+    return _state
+
+
+def set_search_state(state: SearchState) -> None:
+    global _state
+    _state = state
+
+
+def reload_search_state() -> SearchState:
+    """Build a new state from the dataset source and swap it in.
+
+    Requests that already hold the previous state finish with it, the shard
+    processes of a sharded engine stop once it is no longer referenced.
+    """
+    global _state
+    with _state_lock:
+        start = time.perf_counter()
+        state = build_search_state(refresh=True)
+        _state = state
+        logger.info(f"Reloaded {len(state.documents)} movies in "
+                    f"{time.perf_counter() - start:.2f}s, generation {state.generation}")
+    # The previous state is mostly reference cycle free, collect what is not
+    gc.collect()
+    return state
+
+
+def close_search_state() -> None:
+    """Stop the shard processes of the current state, which is dropped."""
+    global _state
+    with _state_lock:
+        state, _state = _state, None
+    if state is not None and isinstance(state.search_engine, ShardedSearchEngine):
+        state.search_engine.close()
+
+
+def is_reloading() -> bool:
+    return _state_lock.locked()
+
+
 def get_documents() -> DataFrame:
-    global _documents
-    if _documents is None:
-        _documents = read_csv(
-            DATASET_GITHUB,
-            parse_dates=["release_date"],
-        ).fillna("").sort_values(by="release_date", ascending=False)
-        _documents = _documents[_documents["description"] != ""]
-        for column in ["tags", "genre"]:
-            _documents[column] = _documents[column].apply(list_parser)
-    return _documents
+    return get_search_state().documents
 
 
 def get_search_engine() -> SearchEngine:
-    global _search_engine
-    if _search_engine is None:
-        documents = get_documents()
-        _search_engine = SearchEngine(text_processing=Config.text_processing)
-        content = list(documents[["url", "description"]].values)
-        _search_engine.bulk_index(content)
-    return _search_engine
+    return get_search_state().search_engine
+
+
+def get_facet_index() -> FacetIndex:
+    return get_search_state().facet_index
+
+
+def get_record_store() -> RecordStore:
+    return get_search_state().record_store
+
+
+def get_suggester() -> Suggester:
+    return get_search_state().suggester
+
+
+def get_response_cache() -> ResponseCache:
+    return _response_cache
+
+
+def load_search_state() -> None:
+    state = get_search_state()
+    if not Config.lazy_loading:
+        state.search_engine.analyzer.load_models()
+
+
+def dataset_hash(content: list) -> str:
+    digest = hashlib.sha256()
+    for row in content:
+        digest.update("".join(f"{value}\0" for value in row).encode())
+    return digest.hexdigest()[:16]
+
+
+def build_search_engine(documents: DataFrame) -> SearchEngine:
+    content = list(documents[INDEX_COLUMNS].values)
+    if Config.search_shards > 1:
+        search_engine = ShardedSearchEngine(
+            Config.search_shards,
+            text_processing=Config.text_processing,
+            fuzzy_distance=Config.fuzzy_distance,
+            fuzzy_penalty=Config.fuzzy_penalty,
+        )
+        search_engine.bulk_index(content, batch_size=Config.index_batch_size)
+        return search_engine
+    content_hash = dataset_hash(content)
+    engine_kwargs = {
+        "text_processing": Config.text_processing,
+        "fuzzy_distance": Config.fuzzy_distance,
+        "fuzzy_penalty": Config.fuzzy_penalty,
+    }
+    search_engine = SearchEngine.load(Config.index_snapshot_dir, content_hash, **engine_kwargs)
+    if search_engine is None:
+        search_engine = SearchEngine(**engine_kwargs)
+        search_engine.bulk_index(
+            content,
+            workers=Config.index_workers,
+            batch_size=Config.index_batch_size,
+        )
+        search_engine.compile()
+        try:
+            search_engine.save(Config.index_snapshot_dir, content_hash)
+        except OSError as e:
+            logger.warning(f"Could not save the index snapshot: {e}")
+        search_engine.release_postings()
+    return search_engine
+
+
+def load_or_build(cls, directory: Path, parameters: dict, build: Callable, **kwargs):
+    """cls loaded from directory, or built and saved there, if it was saved with the same
+    parameters. Without a directory it is always built."""
+    loaded = cls.load(directory, parameters, **kwargs) if directory else None
+    if loaded is not None:
+        return loaded
+    built = build()
+    if directory:
+        try:
+            built.save(directory, parameters)
+        except OSError as e:
+            logger.warning(f"Could not save {directory}: {e}")
+    return built
+
+
+def build_dense_index(search_engine: SearchEngine) -> DenseIndex:
+    if not Config.dense_dims:
+        return None
+    if not isinstance(search_engine, SearchEngine):
+        logger.warning("Dense retrieval is not supported with search_shards > 1, disabled")
+        return None
+    parameters = {
+        "engine": search_engine.fingerprint,
+        "dims": Config.dense_dims,
+        "quantize": Config.dense_quantize,
+        "n_lists": Config.dense_lists,
+    }
+    # Saved with the index snapshot, so it is only built along with it
+    return load_or_build(
+        DenseIndex,
+        search_engine.snapshot and search_engine.snapshot / "dense",
+        parameters,
+        lambda: DenseIndex.build(
+            search_engine.bm25_weights(),
+            search_engine.number_of_documents,
+            dims=Config.dense_dims,
+            quantize=Config.dense_quantize,
+            n_lists=Config.dense_lists,
+            n_probe=Config.dense_probe,
+        ),
+        n_probe=Config.dense_probe,
+    )
+
+
+def build_similar_movies(documents: DataFrame, search_engine: SearchEngine) -> SimilarMovies:
+    if not Config.similar_neighbors:
+        return None
+    if not isinstance(search_engine, SearchEngine):
+        logger.warning("Similar movies are not supported with search_shards > 1, disabled")
+        return None
+    weights = (Config.similar_plot_weight, Config.similar_tag_weight, Config.similar_genre_weight)
+    parameters = {
+        "engine": search_engine.fingerprint,
+        "movies": dataset_hash(documents[SimilarMovies.COLUMNS].values),
+        "n_neighbors": Config.similar_neighbors,
+        "weights": list(weights),
+    }
+    return load_or_build(
+        SimilarMovies,
+        search_engine.snapshot and search_engine.snapshot / "similar",
+        parameters,
+        lambda: SimilarMovies.build(
+            documents,
+            search_engine,
+            n_neighbors=Config.similar_neighbors,
+            plot_weight=Config.similar_plot_weight,
+            tag_weight=Config.similar_tag_weight,
+            genre_weight=Config.similar_genre_weight,
+        ),
+        movie_ids=list(documents["movie_id"]),
+        weights=weights,
+    )
 
 
 def topk_documents(query_results: dict, k: int) -> list[tuple]:
@@ -54,10 +324,36 @@ def topk_documents(query_results: dict, k: int) -> list[tuple]:
     return documents[:k]
 
 
-def fetch_query_results(query: str, k: int, score_filter: bool) -> list[tuple]:
-    engine = get_search_engine()
-    query_results = engine.search(query)
-    results = topk_documents(query_results, k=k)
+def dense_results(query: str,
+                  k: int,
+                  engine: SearchEngine,
+                  dense_index: DenseIndex) -> list[tuple]:
+    terms = engine.query_terms(query)
+    if not terms:
+        return []
+    term_ids, weights = zip(*terms)
+    ids, scores = dense_index.search(dense_index.embed(list(term_ids), list(weights))[None], k)
+    matching = scores[0] >= Config.dense_min_similarity
+    return list(zip(engine.urls_of(ids[0][matching]), scores[0][matching].tolist()))
+
+
+def fetch_query_results(query: str,
+                        k: int,
+                        score_filter: bool,
+                        engine: SearchEngine = None,
+                        retrieval: str = "bm25",
+                        dense_index: DenseIndex = None) -> list[tuple]:
+    """Top k (url, score) of BM25, of the dense index, or of both fused by reciprocal rank."""
+    if engine is None:
+        state = get_search_state()
+        engine, dense_index = state.search_engine, state.dense_index
+    count_queries("search")
+    results = [] if retrieval == "dense" else engine.search_topk(query, k=k)
+    if retrieval != "bm25":
+        semantic = dense_results(query, k, engine, dense_index)
+        results = semantic if retrieval == "dense" else reciprocal_rank_fusion(
+            [[url for url, _ in results], [url for url, _ in semantic]], k, Config.rrf_k
+        )
     if score_filter:
         max_score = None if len(results) == 0 else results[0][1]
         results = [
@@ -67,68 +363,97 @@ def fetch_query_results(query: str, k: int, score_filter: bool) -> list[tuple]:
     return results
 
 
-def processing_movie_record(movie_record: Series) -> dict:
-    release_year = movie_record["release_date"].year
-    image_name = (movie_record["movie_id"] + "." + movie_record["image_format"])
-    image_path = f"{IMAGES_PATH_GITHUB}/{image_name}"
-    movie_record_info = {
-        "title": movie_record["title"],
-        "release_date": movie_record["release_date"],
-        "release_year": release_year,
-        "running_time": movie_record["running_time_minutes"],
-        "genre": movie_record["genre"],
-        "tags": movie_record["tags"],
-        "summary": movie_record["movie_summary"],
-        "budget": movie_record["budget"],
-        "box_office": movie_record["box_office"],
-        "profit": movie_record["profit"],
-        "image_path": image_path,
-        "relevancy": movie_record["relevancy"],
-    }
-    return movie_record_info
+def fetch_batch_results(queries: list[str], k: int) -> list[list[tuple]]:
+    count_queries("batch", len(queries))
+    with stage("search"):
+        return get_search_engine().search_many(queries, k=k)
 
 
 def common_tags(tags_n_occurences: int) -> list:
-    documents = get_documents()
-    tags_frequency = documents["tags"].explode().value_counts()
-    tags_frequency = tags_frequency.sample(
-        n=len(tags_frequency),
-        weights=tags_frequency.values ** 2,
-    )
-    rel_tags = tags_frequency[(tags_frequency >= tags_n_occurences)].index
-    rel_tags = rel_tags[rel_tags != ""].to_list()
-    return rel_tags
+    return get_search_state().tag_sampler.sample(tags_n_occurences)
+
 
+def response_cache_key(query: str,
+                       is_tag: bool,
+                       k: int,
+                       filters: MovieFilters,
+                       state: SearchState,
+                       retrieval: str = "bm25") -> tuple:
+    tag = query.lower()
+    return (
+        tuple(state.search_engine.query_keywords(query)),
+        tuple(PHRASE_PATTERN.findall(query)),
+        tag if tag in state.facet_index.tags else None,
+        is_tag,
+        k,
+        filters.key(),
+        retrieval,
+    )
 
-def days_since_1ad(date: str) -> int:
-    return to_datetime(date).toordinal()
 
+def response_search_movie(query: str,
+                          is_tag: bool,
+                          k: int = Config.k,
+                          filters: MovieFilters = None,
+                          state: SearchState = None,
+                          retrieval: str = "bm25") -> RankedMovies:
+    # A request works on a single state, even when a reload swaps it meanwhile
+    state = state or get_search_state()
+    filters = filters or MovieFilters()
+    # Precomputed at load, the default page of the frontend
+    if not query and not is_tag and filters.is_empty(show_all=True):
+        return state.record_store.all_ranked
+    with stage("analyze"):
+        key = response_cache_key(query, is_tag, k, filters, state, retrieval)
+    with stage("cache"):
+        ranked = _response_cache.get(key, state.generation)
+    if ranked is MISSING:
+        ranked = rank_movies(query, is_tag, k, filters, state, retrieval)
+        _response_cache.put(key, ranked, state.generation, size=ranked.nbytes if ranked else 0)
+    return ranked
 
-def response_search_movie(query: str, is_tag: bool, k: int = Config.k) -> list[dict]:
-    documents = get_documents()
-    # Show all movies
-    if not query and not is_tag:
-        relevant_movies = documents.copy()
-        relevant_movies["relevancy"] = relevant_movies["release_date"].apply(days_since_1ad)
-        relevant_movies = relevant_movies.sort_values(by="release_date", ascending=False)
 
+def rank_movies(query: str,
+                is_tag: bool,
+                k: int,
+                filters: MovieFilters,
+                state: SearchState,
+                retrieval: str = "bm25") -> RankedMovies:
+    facet_index = state.facet_index
+    record_store = state.record_store
+    with stage("filter"):
+        selection = facet_index.select(filters)
+    show_all = not query and not is_tag
+    if show_all:
+        rows = np.arange(facet_index.n_rows) if selection is None else facet_index.rows(selection)
+        relevancy = record_store.release_ordinals[rows]
     else:
         # Fetch query results (If it is by tag the query is the tag)
-        results = fetch_query_results(query=query, k=k, score_filter=Config.score_filter)
-        results = DataFrame(data=results, columns=["url", "relevancy"])
-        relevant_movies = merge(left=documents, right=results, how="left", on="url")
-
-        relevant_movies["relevancy"] = relevant_movies["relevancy"].astype(float).fillna(0)
-        # Breaking ties with release_date
-        relevant_movies["relevancy"] = (
-            relevant_movies["relevancy"].round(10).astype(str) +
-            relevant_movies["release_date"].apply(days_since_1ad).astype(str)
-        ).astype(float)
-        # Applying filters
-        tag_filter = relevant_movies["tags"].apply(lambda tags: query.lower() in tags)
-        search_filter = relevant_movies["url"].isin(results["url"])
-        relevant_movies = relevant_movies[tag_filter | search_filter]
-
-    if relevant_movies.empty:
+        with stage("search"):
+            results = fetch_query_results(
+                query=query,
+                k=k,
+                score_filter=Config.score_filter,
+                engine=state.search_engine,
+                retrieval=retrieval,
+                dense_index=state.dense_index,
+            )
+        # Search results and movies tagged with the query, restricted to the filters
+        with stage("filter"):
+            candidates = (
+                facet_index.urls(url for url, _ in results) | facet_index.tag(query.lower())
+            )
+            if selection is not None:
+                candidates &= selection
+            rows = facet_index.rows(candidates)
+            relevancy = record_store.relevancy(rows, results)
+
+    with stage("sort"):
+        order = record_store.order(rows, relevancy, filters.sort_by, filters.sort_order)
+    if filters.limit:
+        order = order[:filters.limit]
+    if len(order) == 0:
         return None
-    return relevant_movies.apply(processing_movie_record, axis=1).to_list()
+    if show_all:
+        return RankedMovies(rows[order])
+    return RankedMovies(rows[order], relevancy[order])
@@ -0,0 +1,56 @@
+import logging
+import os
+import threading
+
+from typing import Callable
+
+
+logger = logging.getLogger(__name__)
+
+
+class FileWatcher:
+    """Calls on_change from a daemon thread when a file's mtime or size changes.
+
+    The file is polled every interval seconds. A change is reported once the
+    file stayed the same for a whole interval, so a file still being written
+    is not picked up half way.
+    """
+
+    def __init__(self, path: str, on_change: Callable[[], None], interval: float = 5.0):
+        self.path = path
+        self.on_change = on_change
+        self.interval = interval
+        self._current = None
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="file-watcher", daemon=True)
+
+    def _signature(self) -> tuple[float, int]:
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _run(self) -> None:
+        current, pending = self._current, None
+        while not self._stopped.wait(self.interval):
+            signature = self._signature()
+            if signature is None or signature == current:
+                pending = None
+            elif signature != pending:
+                pending = signature
+            else:
+                current, pending = signature, None
+                try:
+                    self.on_change()
+                except Exception:
+                    logger.exception(f"Reload after a change of {self.path} failed")
+
+    def start(self) -> None:
+        # Changes made once start() returns are reported
+        self._current = self._signature()
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self._thread.join()
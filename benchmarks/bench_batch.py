@@ -0,0 +1,34 @@
+import argparse
+import time
+
+from app.search_engine import SearchEngine, TextProcessing
+from benchmarks.corpus import synthetic_documents, synthetic_queries
+
+
+def main():
+    parser = argparse.ArgumentParser(description="search_many vs looped search_topk throughput")
+    parser.add_argument("--documents", type=int, nargs="+", default=[500, 2_000, 20_000, 100_000])
+    parser.add_argument("--queries", type=int, default=2_000)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    for n_documents in args.documents:
+        documents = synthetic_documents(n_documents, vocabulary_size=min(50_000, n_documents * 5))
+        engine = SearchEngine(text_processing=TextProcessing.Stemmer)
+        engine.bulk_index(documents)
+        engine.compile()
+        queries = synthetic_queries(documents, args.queries)
+
+        start = time.perf_counter()
+        expected = [engine.search_topk(query, args.k) for query in queries]
+        looped = len(queries) / (time.perf_counter() - start)
+        start = time.perf_counter()
+        results = engine.search_many(queries, args.k)
+        batched = len(queries) / (time.perf_counter() - start)
+        assert results == expected
+        print(f"{n_documents:>7} documents: search_topk loop {looped:7.0f} queries/sec, "
+              f"search_many {batched:7.0f} queries/sec, speedup x{batched / looped:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,24 @@
+import argparse
+
+from app.search_engine import SearchEngine, TextProcessing
+from benchmarks.corpus import synthetic_documents
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SearchEngine.bulk_index build throughput")
+    parser.add_argument("--documents", type=int, default=20_000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--text-processing", type=TextProcessing, default=None)
+    args = parser.parse_args()
+
+    documents = synthetic_documents(args.documents)
+    print(f"documents: {args.documents}, text processing: {args.text_processing}")
+    for workers in args.workers:
+        engine = SearchEngine(text_processing=args.text_processing)
+        rate = engine.bulk_index(documents, workers=workers, batch_size=args.batch_size)
+        print(f"{workers:>2} workers: {rate:10.0f} documents/sec")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+import argparse
+import time
+import tracemalloc
+
+from app.search_engine import SearchEngine
+from benchmarks.corpus import synthetic_documents, synthetic_queries
+
+
+def measure(engine: SearchEngine, queries: list[str]) -> tuple[float, float]:
+    start = time.perf_counter()
+    for query in queries:
+        engine.search(query)
+    latency_ms = (time.perf_counter() - start) / len(queries) * 1000
+
+    tracemalloc.start()
+    peaks = []
+    for query in queries:
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        engine.search(query)
+        peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+    tracemalloc.stop()
+    return latency_ms, sum(peaks) / len(peaks) / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Dict vs compiled SearchEngine benchmark")
+    parser.add_argument("--documents", type=int, default=200_000)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    documents = synthetic_documents(args.documents)
+    queries = synthetic_queries(documents, args.queries)
+    engine = SearchEngine()
+    engine.bulk_index(documents)
+
+    dict_latency, dict_memory = measure(engine, queries)
+    engine.compile()
+    compiled_latency, compiled_memory = measure(engine, queries)
+
+    print(f"documents: {args.documents}, queries: {args.queries}")
+    print(f"dict:     {dict_latency:8.2f} ms/query, {dict_memory:10.1f} KiB peak/query")
+    print(f"compiled: {compiled_latency:8.2f} ms/query, {compiled_memory:10.1f} KiB peak/query")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+import argparse
+import asyncio
+import time
+
+import httpx
+import numpy as np
+
+import app.main as app_main
+import app.utils as utils
+from app.executor import SearchExecutor
+from app.search_engine import SearchEngine, TextProcessing
+from benchmarks.corpus import synthetic_movies, synthetic_queries
+
+
+async def client(http: httpx.AsyncClient, queries: list[str], latencies: dict) -> None:
+    for i, query in enumerate(queries):
+        # Every fourth request is a health check, which must not wait for searches
+        if i % 4 == 3:
+            endpoint, params = "/health", {}
+        else:
+            endpoint, params = "/search_disney_movie", {"query": query, "is_tag": False}
+        start = time.perf_counter()
+        response = await http.get(endpoint, params=params)
+        latencies.setdefault((endpoint, response.status_code), []).append(
+            time.perf_counter() - start
+        )
+
+
+async def load_test(queries: list[str], concurrency: int) -> dict:
+    latencies = {}
+    transport = httpx.ASGITransport(app=app_main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as http:
+        await asyncio.gather(*[
+            client(http, queries[i::concurrency], latencies) for i in range(concurrency)
+        ])
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Search endpoint latency under concurrency")
+    parser.add_argument("--movies", type=int, default=20_000)
+    parser.add_argument("--requests", type=int, default=800)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    documents = synthetic_movies(args.movies)
+    engine = SearchEngine(text_processing=TextProcessing.Stemmer)
+    engine.bulk_index(list(documents[["url", "description"]].values))
+    engine.compile()
+    utils.set_search_state(utils.build_search_state(documents, engine))
+    content = list(documents[["url", "description"]].values)
+
+    print(f"movies: {args.movies}, requests: {args.requests}, concurrency: {args.concurrency}")
+    for kind in ["inline", "thread"]:
+        app_main.search_executor = SearchExecutor(
+            workers=args.workers, max_pending=args.concurrency, kind=kind
+        )
+        # Distinct queries per run so the response cache does not hide the search cost
+        queries = synthetic_queries(content, args.requests, 2, 6, seed=len(kind))
+        start = time.perf_counter()
+        latencies = asyncio.run(load_test(queries, args.concurrency))
+        elapsed = time.perf_counter() - start
+        app_main.search_executor.shutdown()
+        print(f"{kind} executor, {args.requests / elapsed:.0f} requests/sec")
+        for (endpoint, status), values in sorted(latencies.items()):
+            p50, p99 = np.percentile(values, [50, 99]) * 1000
+            print(f"  {endpoint:<20} {status}  n={len(values):<5} "
+                  f"p50 {p50:8.2f} ms  p99 {p99:8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+import argparse
+import tempfile
+import time
+
+from pathlib import Path
+
+from app.dataset import load_dataset, save_dataset
+from app.utils import read_documents
+from benchmarks.corpus import synthetic_movies
+
+
+def timed(func, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CSV dataset vs local columnar cache load time")
+    parser.add_argument("--movies", type=int, default=2_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        csv_path = Path(directory) / "movies.csv"
+        synthetic_movies(args.movies).to_csv(csv_path, index=False)
+        documents = read_documents(csv_path)
+        cache_path = Path(directory) / "dataset"
+        save_dataset(documents, cache_path, str(csv_path))
+
+        csv_time = timed(lambda: read_documents(csv_path), args.repeat)
+        print(f"movies: {args.movies}, local CSV read_documents {csv_time:.1f} ms")
+        for name, columns in [
+            ("all columns", None),
+            ("url and description", ["url", "description"]),
+            ("tags", ["tags"]),
+        ]:
+            cache_time = timed(
+                lambda: load_dataset(cache_path, str(csv_path), columns), args.repeat
+            )
+            print(f"{name:>20}: cache {cache_time:7.1f} ms, speedup x{csv_time / cache_time:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+import argparse
+import time
+
+import numpy as np
+
+from app.dense import DenseIndex, randomized_svd
+from benchmarks.corpus import zipf_cum_weights
+
+
+def synthetic_postings(n_documents: int,
+                       vocabulary_size: int,
+                       terms_per_document: int,
+                       seed: int = 0) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Term-major CSR of BM25-like weights, with Zipf distributed terms."""
+    rng = np.random.default_rng(seed)
+    cum_weights = np.array(zipf_cum_weights(vocabulary_size))
+    terms = np.searchsorted(
+        cum_weights, rng.random(n_documents * terms_per_document) * cum_weights[-1]
+    ).astype(np.int32)
+    docs = np.repeat(np.arange(n_documents, dtype=np.int32), terms_per_document)
+    # One posting per (term, document), sorted by term then document
+    keys = np.unique(terms.astype(np.int64) * n_documents + docs)
+    terms, docs = np.divmod(keys, n_documents)
+    indptr = np.zeros(vocabulary_size + 1, dtype=np.int64)
+    np.cumsum(np.bincount(terms, minlength=vocabulary_size), out=indptr[1:])
+    idf = np.log(n_documents / (np.diff(indptr) + 1) + 1).astype(np.float32)
+    weights = idf[terms] * rng.uniform(0.5, 2.0, len(terms)).astype(np.float32)
+    return indptr, docs.astype(np.int32), weights
+
+
+def latencies(index: DenseIndex, queries: np.ndarray, k: int) -> tuple[float, float]:
+    times = []
+    for query in queries:
+        start = time.perf_counter()
+        index.search(query[None], k)
+        times.append(time.perf_counter() - start)
+    p50, p99 = np.percentile(np.array(times) * 1000, [50, 99])
+    return p50, p99
+
+
+def query_vectors(index: DenseIndex,
+                  term_indptr: np.ndarray,
+                  n_queries: int,
+                  rng: np.random.Generator) -> np.ndarray:
+    """Queries of 1 to 6 terms, drawn by document frequency like the document terms."""
+    queries = []
+    for _ in range(n_queries):
+        positions = rng.integers(term_indptr[-1], size=rng.integers(1, 7))
+        term_ids = np.searchsorted(term_indptr, positions, side="right") - 1
+        queries.append(index.embed(term_ids, np.ones(len(term_ids))))
+    return np.stack(queries)
+
+
+def report(name: str, index: DenseIndex, build: float, queries: np.ndarray, k: int,
+           exact_ids: list[np.ndarray]) -> None:
+    p50, p99 = latencies(index, queries, k)
+    ids = index.search(queries, k)[0]
+    recall = np.mean([len(set(a) & set(b)) / k for a, b in zip(ids, exact_ids)])
+    print(f"  {name:>26}: {index.nbytes / 2**20:8.1f} MB, built in {build:5.1f}s, "
+          f"p50 {p50:7.2f} p99 {p99:7.2f} ms, recall@{k} {recall:.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Dense LSA index build, memory and latency")
+    parser.add_argument("--documents", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--vocabulary", type=int, default=50_000)
+    parser.add_argument("--terms-per-document", type=int, default=40)
+    parser.add_argument("--dims", type=int, default=64)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--probe", type=int, nargs="+", default=[8, 32])
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    for n_documents in args.documents:
+        postings = synthetic_postings(n_documents, args.vocabulary, args.terms_per_document)
+        start = time.perf_counter()
+        vectors, projection = randomized_svd(postings, n_documents, args.dims)
+        svd_seconds = time.perf_counter() - start
+        print(f"{n_documents:>9} documents, {len(postings[1])} postings: "
+              f"SVD of rank {args.dims} in {svd_seconds:.1f}s")
+        queries = query_vectors(DenseIndex(vectors, projection), postings[0], args.queries, rng)
+        del postings
+
+        exact_ids = None
+        for quantize in [False, True]:
+            start = time.perf_counter()
+            index = DenseIndex(vectors, projection, quantize=quantize)
+            build = time.perf_counter() - start
+            if exact_ids is None:
+                exact_ids = index.search(queries, args.k)[0]
+            report(f"exact {'int8' if quantize else 'float32'}", index, build, queries, args.k,
+                   exact_ids)
+        n_lists = int(np.sqrt(n_documents))
+        for quantize in [False, True]:
+            start = time.perf_counter()
+            index = DenseIndex(vectors, projection, quantize=quantize, n_lists=n_lists)
+            build = time.perf_counter() - start
+            for n_probe in args.probe:
+                index.n_probe = n_probe
+                name = f"ivf {n_probe}/{n_lists} {'int8' if quantize else 'float32'}"
+                report(name, index, build, queries, args.k, exact_ids)
+
+
+if __name__ == "__main__":
+    main()
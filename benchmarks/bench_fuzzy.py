@@ -0,0 +1,78 @@
+import argparse
+import random
+import time
+
+from string import ascii_lowercase
+
+import numpy as np
+
+from app.fuzzy import allowed_distance, edit_distance, SymmetricDeleteIndex
+from benchmarks.corpus import synthetic_vocabulary
+
+
+def misspell(word: str, edits: int, rng: random.Random) -> str:
+    for _ in range(edits):
+        i = rng.randrange(len(word))
+        edit = rng.choice(["delete", "insert", "replace", "transpose"])
+        if edit == "delete" and len(word) > 1:
+            word = word[:i] + word[i + 1:]
+        elif edit == "insert":
+            word = word[:i] + rng.choice(ascii_lowercase) + word[i:]
+        elif edit == "transpose" and i + 1 < len(word):
+            word = word[:i] + word[i + 1] + word[i] + word[i + 2:]
+        else:
+            word = word[:i] + rng.choice(ascii_lowercase) + word[i + 1:]
+    return word
+
+
+def scan(terms: list[str], word: str, max_distance: int) -> list[int]:
+    distances = (edit_distance(word, term, max_distance) for term in terms)
+    return [i for i, distance in enumerate(distances) if distance <= max_distance]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fuzzy term lookup as the vocabulary grows")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--queries", type=int, default=1_000)
+    parser.add_argument("--max-distance", type=int, default=2)
+    parser.add_argument("--scan-queries", type=int, default=20,
+                        help="queries of the linear scan baseline, on the smallest vocabulary")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    for size in args.sizes:
+        terms = synthetic_vocabulary(size, seed=args.seed)
+        start = time.perf_counter()
+        index = SymmetricDeleteIndex(terms, max_distance=args.max_distance)
+        build = time.perf_counter() - start
+        targets = rng.sample(range(size), args.queries)
+        # Misspelled with as many edits as the engine corrects for the length of the term
+        words = [
+            misspell(terms[t], rng.randint(1, allowed_distance(terms[t], args.max_distance)), rng)
+            if allowed_distance(terms[t], args.max_distance) else terms[t]
+            for t in targets
+        ]
+
+        latencies = []
+        found = 0
+        for target, word in zip(targets, words):
+            start = time.perf_counter()
+            matches = index.lookup(word, allowed_distance(word, args.max_distance))
+            latencies.append(time.perf_counter() - start)
+            found += any(term_id == target for term_id, _ in matches)
+        p50, p99 = np.percentile(np.array(latencies) * 1e6, [50, 99])
+        print(f"{size:>9} terms: build {build:6.1f}s, {index.nbytes / 2**20:7.1f} MB, "
+              f"lookup p50 {p50:7.1f} p99 {p99:8.1f} µs, "
+              f"misspelled term found {found / len(words):.1%}")
+
+        if size == min(args.sizes) and args.scan_queries:
+            start = time.perf_counter()
+            for word in words[:args.scan_queries]:
+                scan(terms, word, allowed_distance(word, args.max_distance))
+            per_query = (time.perf_counter() - start) / args.scan_queries * 1e6
+            print(f"{'':>9}        linear scan of the vocabulary: {per_query:9.1f} µs per lookup")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from pathlib import Path
+
+import httpx
+import numpy as np
+
+from benchmarks.bench_startup import wait_ready
+from benchmarks.corpus import synthetic_movies, synthetic_query_mix
+
+
+ENDPOINTS = {
+    "search": "/search_disney_movie",
+    "tags": "/fetch_common_tags",
+    "topk": "/get_topk_documents",
+}
+# Metric -> True when the SLO is a lower bound
+SLO_METRICS = {"p50": False, "p95": False, "p99": False, "error_rate": False, "throughput": True}
+
+
+def synthetic_log(dataset: Path, n_requests: int, mix: dict[str, float], seed: int) -> list[dict]:
+    """Requests of the query log, in the order they are replayed."""
+    from app.utils import read_documents
+
+    rng = random.Random(seed)
+    queries = iter(synthetic_query_mix(read_documents(str(dataset)), n_requests, seed=seed))
+    log = []
+    for endpoint in rng.choices(list(mix), weights=list(mix.values()), k=n_requests):
+        _, query, is_tag = next(queries)
+        if endpoint == "search":
+            params = {"query": query, "is_tag": is_tag}
+        elif endpoint == "topk":
+            params = {"query": query, "k": 10}
+        else:
+            params = {"tags_n_occurences": rng.choice([2, 8, 20])}
+        log.append({"endpoint": endpoint, "params": params})
+    return log
+
+
+def read_log(path: Path) -> list[dict]:
+    """JSON lines {"endpoint": ..., "params": {...}}, or plain lines of search queries."""
+    log = []
+    for line in path.read_text().splitlines():
+        if line.startswith("{"):
+            log.append(json.loads(line))
+        elif line.strip():
+            log.append({"endpoint": "search", "params": {"query": line, "is_tag": False}})
+    return log
+
+
+async def send(http: httpx.AsyncClient, request: dict, scheduled: float, results: list) -> None:
+    # Latency counts from the scheduled time, so a slow server cannot hide queued requests
+    try:
+        response = await http.get(ENDPOINTS[request["endpoint"]], params=request["params"])
+        ok = response.status_code < 400
+    except httpx.HTTPError:
+        ok = False
+    results.append((request["endpoint"], time.perf_counter() - scheduled, ok))
+
+
+async def closed_loop(http: httpx.AsyncClient, log: list[dict], concurrency: int) -> list:
+    results = []
+    requests = iter(log)
+
+    async def user():
+        for request in requests:
+            await send(http, request, time.perf_counter(), results)
+
+    await asyncio.gather(*[user() for _ in range(concurrency)])
+    return results
+
+
+async def open_loop(http: httpx.AsyncClient, log: list[dict], rate: float, seed: int) -> list:
+    # Poisson arrivals at the given rate, whether or not earlier requests completed
+    rng = random.Random(seed)
+    results = []
+    tasks = []
+    scheduled = time.perf_counter()
+    for request in log:
+        scheduled += rng.expovariate(rate)
+        await asyncio.sleep(max(0.0, scheduled - time.perf_counter()))
+        tasks.append(asyncio.create_task(send(http, request, scheduled, results)))
+    await asyncio.gather(*tasks)
+    return results
+
+
+def summarize(results: list, elapsed: float) -> dict[str, dict]:
+    by_endpoint = {"all": results}
+    for result in results:
+        by_endpoint.setdefault(result[0], []).append(result)
+    report = {}
+    for endpoint, endpoint_results in by_endpoint.items():
+        latencies = np.array([latency for _, latency, _ in endpoint_results]) * 1000
+        errors = sum(not ok for _, _, ok in endpoint_results)
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        report[endpoint] = {
+            "requests": len(endpoint_results),
+            "throughput": round(len(endpoint_results) / elapsed, 1),
+            "error_rate": round(errors / len(endpoint_results), 4),
+            "p50": round(float(p50), 2),
+            "p95": round(float(p95), 2),
+            "p99": round(float(p99), 2),
+            "max": round(float(latencies.max()), 2),
+        }
+    return report
+
+
+def parse_slo(slo: str) -> tuple[str, str, float]:
+    """[endpoint:]metric=value, such as p99=250 (ms) or search:error_rate=0.01."""
+    target, value = slo.split("=")
+    endpoint, _, metric = target.rpartition(":")
+    if metric not in SLO_METRICS:
+        raise argparse.ArgumentTypeError(f"Unknown SLO metric {metric}")
+    return endpoint or "all", metric, float(value)
+
+
+def check_slos(report: dict, slos: list[tuple[str, str, float]]) -> list[tuple[str, bool]]:
+    checks = []
+    for endpoint, metric, target in slos:
+        value = report.get(endpoint, {}).get(metric)
+        lower_bound = SLO_METRICS[metric]
+        ok = value is not None and (value >= target if lower_bound else value <= target)
+        checks.append((f"{endpoint} {metric} {value} {'>=' if lower_bound else '<='} {target}", ok))
+    return checks
+
+
+def start_server(dataset: Path, directory: str, port: int, workers: int,
+                 text_processing: str) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        "DATASET_PATH": str(dataset),
+        "DATASET_CACHE_DIR": str(Path(directory) / "dataset"),
+        "INDEX_SNAPSHOT_DIR": str(Path(directory) / "snapshots"),
+        "TEXT_PROCESSING": text_processing,
+    }
+    server = subprocess.Popen(
+        [sys.executable, "-m", "app.serve", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(workers)],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True,
+    )
+    try:
+        wait_ready(server, workers)
+    except RuntimeError:
+        server.kill()
+        raise
+    # Keep reading the logs so the workers never block on a full pipe
+    threading.Thread(target=server.stderr.read, daemon=True).start()
+    return server
+
+
+async def drive(port: int, log: list[dict], args) -> tuple[list, float]:
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits,
+                                 timeout=args.timeout) as http:
+        start = time.perf_counter()
+        if args.rate:
+            results = await open_loop(http, log, args.rate, args.seed)
+        else:
+            results = await closed_loop(http, log, args.concurrency)
+        return results, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP load test of the app with SLO checks")
+    parser.add_argument("--dataset", type=Path, help="local dataset CSV, synthetic by default")
+    parser.add_argument("--movies", type=int, default=2_000, help="size of the synthetic dataset")
+    parser.add_argument("--query-log", type=Path, help="requests to replay, synthetic by default")
+    parser.add_argument("--requests", type=int, default=2_000)
+    parser.add_argument("--mix", default="search=80,topk=15,tags=5",
+                        help="share of each endpoint in the synthetic log")
+    parser.add_argument("--concurrency", type=int, default=16,
+                        help="users of the closed loop, connections of the open loop")
+    parser.add_argument("--rate", type=float, help="open loop arrival rate in requests/sec")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--timeout", type=float, default=10.0)
+    parser.add_argument("--text-processing", default="lemmatizer")
+    parser.add_argument("--slo", type=parse_slo, action="append", default=[],
+                        help="[endpoint:]metric=value, such as p99=250 or search:error_rate=0.01")
+    parser.add_argument("--output", type=Path, help="write the report as JSON")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        dataset = args.dataset
+        if dataset is None:
+            dataset = Path(directory) / "movies.csv"
+            synthetic_movies(args.movies, seed=args.seed).to_csv(dataset, index=False)
+        if args.query_log:
+            log = read_log(args.query_log)
+        else:
+            mix = {name: float(share) for name, share in
+                   (item.split("=") for item in args.mix.split(","))}
+            log = synthetic_log(dataset, args.requests, mix, args.seed)
+        server = start_server(dataset, directory, args.port, args.workers, args.text_processing)
+        try:
+            results, elapsed = asyncio.run(drive(args.port, log, args))
+        finally:
+            server.send_signal(signal.SIGTERM)
+            server.wait()
+
+    report = summarize(results, elapsed)
+    mode = f"open loop at {args.rate:g} requests/sec" if args.rate else \
+        f"closed loop with {args.concurrency} users"
+    print(f"{len(results)} requests in {elapsed:.1f}s, {mode}, {args.workers} workers")
+    for endpoint, stats in report.items():
+        print(f"  {endpoint:>6}: {stats['requests']:6} requests, {stats['throughput']:7.1f}/s, "
+              f"errors {stats['error_rate']:6.2%}, p50 {stats['p50']:7.2f} p95 {stats['p95']:7.2f} "
+              f"p99 {stats['p99']:7.2f} max {stats['max']:7.2f} ms")
+    checks = check_slos(report, args.slo)
+    for description, ok in checks:
+        print(f"  SLO {'PASS' if ok else 'FAIL'} {description}")
+    if args.output:
+        args.output.write_text(json.dumps({"report": report, "slos": checks}, indent=2))
+    if not all(ok for _, ok in checks):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+import argparse
+import time
+
+import app.utils as utils
+from app.config import Config
+from app.facets import MovieFilters
+from app.search_engine import SearchEngine, TextProcessing
+from benchmarks.corpus import synthetic_movies, synthetic_queries
+
+
+def timed(queries: list[str], repeat: int) -> float:
+    state = utils.get_search_state()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for query in queries:
+            utils.rank_movies(query, False, Config.k, MovieFilters(), state)
+    return (time.perf_counter() - start) / (repeat * len(queries)) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Overhead of the stage timings on a search")
+    parser.add_argument("--movies", type=int, default=5_000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    documents = synthetic_movies(args.movies)
+    engine = SearchEngine(text_processing=TextProcessing.Stemmer)
+    engine.bulk_index(list(documents[["url", "description"]].values))
+    engine.compile()
+    utils.set_search_state(utils.build_search_state(documents, engine))
+    queries = synthetic_queries(list(documents[["url", "description"]].values), args.queries)
+
+    print(f"movies: {args.movies}, uncached search and ranking time per query")
+    results = {}
+    # Alternated so both modes see the same CPU frequency and cache conditions
+    for enabled in [False, True] * 3:
+        Config.metrics_enabled = enabled
+        results.setdefault(enabled, []).append(timed(queries, args.repeat))
+    off, on = min(results[False]), min(results[True])
+    print(f"metrics off {off:7.1f} µs, on {on:7.1f} µs, overhead {on - off:5.1f} µs")
+
+
+if __name__ == "__main__":
+    main()
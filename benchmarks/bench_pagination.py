@@ -0,0 +1,58 @@
+import argparse
+import asyncio
+import time
+
+import httpx
+
+import app.main as app_main
+import app.utils as utils
+from app.search_engine import SearchEngine, TextProcessing
+from benchmarks.corpus import synthetic_movies
+
+
+REQUESTS = [
+    ("full list", {}, "identity"),
+    ("full list, gzip", {}, "gzip"),
+    ("first page of 50, gzip", {"page_size": 50}, "gzip"),
+    ("ndjson stream, gzip", {"format": "ndjson"}, "gzip"),
+]
+
+
+def install(n_movies: int) -> None:
+    documents = synthetic_movies(n_movies)
+    engine = SearchEngine(text_processing=TextProcessing.Stemmer)
+    engine.bulk_index(list(documents[["url", "description"]].values))
+    engine.compile()
+    utils.set_search_state(utils.build_search_state(documents, engine))
+
+
+async def measure(params: dict, encoding: str, repeat: int) -> tuple[float, int]:
+    transport = httpx.ASGITransport(app=app_main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as http:
+        start = time.perf_counter()
+        for _ in range(repeat):
+            response = await http.get(
+                "/search_disney_movie",
+                params={"query": "", "is_tag": False, **params},
+                headers={"Accept-Encoding": encoding},
+            )
+        elapsed = (time.perf_counter() - start) / repeat
+    return elapsed * 1000, response.num_bytes_downloaded
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Show all movies response time and size")
+    parser.add_argument("--movies", type=int, nargs="+", default=[1_000, 5_000, 20_000])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    for n_movies in args.movies:
+        install(n_movies)
+        print(f"{n_movies} movies (times include decompression by the client)")
+        for name, params, encoding in REQUESTS:
+            ms, size = asyncio.run(measure(params, encoding, args.repeat))
+            print(f"  {name:<24} {ms:8.2f} ms  {size / 1024:9.1f} KiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+import argparse
+import random
+import time
+
+from app.search_engine import SearchEngine
+from benchmarks.corpus import synthetic_documents
+
+
+def phrase_queries(documents: list[tuple[str, str]], n_queries: int, seed: int = 0) -> list[str]:
+    # Two or three consecutive words of a plot, so every phrase has a match
+    rng = random.Random(seed)
+    queries = []
+    for _ in range(n_queries):
+        words = rng.choice(documents)[1].split()
+        length = rng.randint(2, 3)
+        start = rng.randint(0, len(words) - length)
+        queries.append('"' + " ".join(words[start:start + length]) + '"')
+    return queries
+
+
+def latency_ms(engine: SearchEngine, queries: list[str], k: int = 10) -> float:
+    start = time.perf_counter()
+    for query in queries:
+        engine.search_topk(query, k)
+    return (time.perf_counter() - start) / len(queries) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Positional postings size and phrase latency")
+    parser.add_argument("--documents", type=int, default=50_000)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    documents = synthetic_documents(args.documents)
+    queries = phrase_queries(documents, args.queries)
+    engine = SearchEngine(positions=True)
+    engine.bulk_index(documents)
+    index = engine.compile()
+
+    postings_bytes = index.indptr.nbytes + index.doc_ids.nbytes + index.term_freqs.nbytes
+    positions_bytes = index.positions_ptr.nbytes + index.positions.nbytes
+    print(f"documents: {args.documents}, queries: {args.queries}")
+    print(f"postings:  {postings_bytes / 2 ** 20:8.1f} MiB")
+    print(f"positions: {positions_bytes / 2 ** 20:8.1f} MiB "
+          f"(+{positions_bytes / postings_bytes:.0%}, {index.positions.dtype} deltas)")
+    bag_of_words_queries = [query.strip('"') for query in queries]
+    print(f"bag of words query: {latency_ms(engine, bag_of_words_queries):7.2f} ms")
+    print(f"phrase query:       {latency_ms(engine, queries):7.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
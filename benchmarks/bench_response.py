@@ -0,0 +1,72 @@
+import argparse
+import time
+
+from fastapi.encoders import jsonable_encoder
+from pandas import DataFrame, merge, to_datetime
+
+import app.utils as utils
+from app.records import encode_json, processing_movie_record
+from app.search_engine import SearchEngine, TextProcessing
+from benchmarks.corpus import synthetic_movies, synthetic_queries
+
+
+def legacy_response(documents: DataFrame, query: str, k: int) -> bytes:
+    # The DataFrame response path the record store replaced, serialized like FastAPI did
+    if not query:
+        relevant_movies = documents.copy()
+        relevant_movies["relevancy"] = relevant_movies["release_date"].apply(
+            lambda date: to_datetime(date).toordinal()
+        )
+        relevant_movies = relevant_movies.sort_values(by="release_date", ascending=False)
+    else:
+        results = utils.fetch_query_results(query=query, k=k, score_filter=False)
+        results = DataFrame(data=results, columns=["url", "relevancy"])
+        relevant_movies = merge(left=documents, right=results, how="left", on="url")
+        relevant_movies["relevancy"] = relevant_movies["relevancy"].astype(float).fillna(0)
+        relevant_movies["relevancy"] = (
+            relevant_movies["relevancy"].round(10).astype(str) +
+            relevant_movies["release_date"].apply(lambda date: to_datetime(date).toordinal())
+            .astype(str)
+        ).astype(float)
+        tag_filter = relevant_movies["tags"].apply(lambda tags: query.lower() in tags)
+        relevant_movies = relevant_movies[tag_filter | relevant_movies["url"].isin(results["url"])]
+    records = relevant_movies.apply(
+        lambda movie: {**processing_movie_record(movie), "relevancy": movie["relevancy"]},
+        axis=1,
+    ).to_list()
+    return encode_json(jsonable_encoder(records))
+
+
+def timed(func, queries: list[str]) -> float:
+    start = time.process_time()
+    for query in queries:
+        func(query)
+    return (time.process_time() - start) / len(queries) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="DataFrame vs record store response path")
+    parser.add_argument("--movies", type=int, default=2_000)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    documents = synthetic_movies(args.movies)
+    engine = SearchEngine(text_processing=TextProcessing.Stemmer)
+    engine.bulk_index(list(documents[["url", "description"]].values))
+    engine.compile()
+    utils.set_search_state(utils.build_search_state(documents, engine))
+
+    queries = synthetic_queries(list(documents[["url", "description"]].values), args.queries)
+    print(f"movies: {args.movies}, k: {args.k}, CPU time per request")
+    for name, requests in [("show all movies", [""] * 10), (f"k={args.k} search", queries)]:
+        legacy_ms = timed(lambda query: legacy_response(documents, query, args.k), requests)
+        store_ms = timed(
+            lambda query: utils.response_search_movie(query, is_tag=False, k=args.k), requests
+        )
+        print(f"{name:>16}: DataFrame {legacy_ms:8.2f} ms, record store {store_ms:6.2f} ms, "
+              f"speedup x{legacy_ms / store_ms:.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+import argparse
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+from app.search_engine import SearchEngine, TextProcessing
+from app.sharding import ShardedSearchEngine
+from benchmarks.corpus import synthetic_documents, synthetic_queries
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ShardedSearchEngine query throughput")
+    parser.add_argument("--documents", type=int, default=100_000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 4],
+                        help="threads sending the queries to the sharded engine")
+    args = parser.parse_args()
+
+    documents = synthetic_documents(args.documents)
+    queries = synthetic_queries(documents, args.queries)
+    print(f"documents: {args.documents}, queries: {args.queries}, k: {args.k}")
+
+    engine = SearchEngine(text_processing=TextProcessing.Stemmer)
+    engine.bulk_index(documents)
+    engine.compile()
+    start = time.perf_counter()
+    for query in queries:
+        engine.search_topk(query, args.k)
+    print(f"single engine: {len(queries) / (time.perf_counter() - start):8.0f} queries/sec")
+
+    for shards in args.shards:
+        sharded = ShardedSearchEngine(shards, text_processing=TextProcessing.Stemmer)
+        sharded.bulk_index(documents)
+        for clients in args.clients:
+            start = time.perf_counter()
+            with ThreadPoolExecutor(clients) as executor:
+                list(executor.map(lambda query: sharded.search_topk(query, args.k), queries))
+            elapsed = time.perf_counter() - start
+            print(f"{shards:>2} shards, {clients:>2} clients: "
+                  f"{len(queries) / elapsed:8.0f} queries/sec")
+        sharded.close()
+
+
+if __name__ == "__main__":
+    main()
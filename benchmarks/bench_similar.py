@@ -0,0 +1,51 @@
+import argparse
+import time
+
+import numpy as np
+
+from app.search_engine import SearchEngine, TextProcessing
+from app.similar import SimilarMovies
+from benchmarks.corpus import synthetic_movies
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Similar movies build time, memory and updates")
+    parser.add_argument("--movies", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--neighbors", type=int, default=10)
+    parser.add_argument("--max-df", type=float, default=0.05)
+    parser.add_argument("--added", type=float, default=0.01,
+                        help="fraction of the movies added incrementally after the build")
+    parser.add_argument("--lookups", type=int, default=10_000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    for n_movies in args.movies:
+        movies = synthetic_movies(n_movies, seed=args.seed).reset_index(drop=True)
+        n_initial = n_movies - int(n_movies * args.added)
+        engine = SearchEngine(text_processing=TextProcessing.Stemmer, stopwords=True)
+        engine.bulk_index(list(movies[["url", "description"]][:n_initial].values), workers=1)
+        engine.compile()
+        start = time.perf_counter()
+        similar = SimilarMovies.build(movies[:n_initial], engine, n_neighbors=args.neighbors,
+                                      max_df=args.max_df)
+        build = time.perf_counter() - start
+
+        engine.bulk_index(list(movies[["url", "description"]][n_initial:].values), workers=1)
+        engine.compile()
+        start = time.perf_counter()
+        similar.add(movies, engine)
+        update = time.perf_counter() - start
+
+        rng = np.random.default_rng(args.seed)
+        movie_ids = movies["movie_id"].to_numpy()[rng.integers(n_movies, size=args.lookups)]
+        start = time.perf_counter()
+        for movie_id in movie_ids:
+            similar.similar(movie_id)
+        lookup = (time.perf_counter() - start) / args.lookups * 1e6
+        print(f"{n_movies:>7} movies: build {build:6.1f}s, "
+              f"{n_movies - n_initial} added in {update:5.1f}s, "
+              f"{similar.nbytes / 2**20:6.2f} MB of neighbors, lookup {lookup:5.1f} µs")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+from pathlib import Path
+
+import httpx
+
+from benchmarks.corpus import synthetic_movies, synthetic_queries
+
+
+def children(pid: int) -> list[int]:
+    pids = []
+    for entry in Path("/proc").iterdir():
+        try:
+            stat = (entry / "stat").read_text()
+        except (OSError, ValueError):
+            continue
+        # The parent pid is the second field after the parenthesized command name
+        if entry.name.isdigit() and int(stat.rsplit(")", 1)[1].split()[1]) == pid:
+            pids.append(int(entry.name))
+    return pids
+
+
+def memory(pid: int) -> dict[str, int]:
+    """Rss, Pss and private (USS) memory of a process in MiB, from smaps_rollup."""
+    fields = {}
+    for line in Path(f"/proc/{pid}/smaps_rollup").read_text().splitlines()[1:]:
+        name, value = line.split(":", 1)
+        fields[name] = int(value.split()[0]) / 1024
+    return {
+        "rss": fields["Rss"],
+        "pss": fields["Pss"],
+        "uss": fields["Private_Clean"] + fields["Private_Dirty"],
+    }
+
+
+def wait_ready(server: subprocess.Popen, workers: int) -> None:
+    ready = 0
+    for line in server.stderr:
+        if "Application startup complete" in line:
+            ready += 1
+            if ready == workers:
+                return
+    raise RuntimeError("The server exited before its workers were ready")
+
+
+def run(workers: int, preload: bool, port: int, env: dict, queries: list[str]) -> dict:
+    command = [sys.executable, "-m", "app.serve", "--host", "127.0.0.1",
+               "--port", str(port), "--workers", str(workers)]
+    if not preload:
+        command.append("--no-preload")
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True
+    )
+    try:
+        wait_ready(server, workers)
+        startup = time.perf_counter() - start
+        # Serve some traffic so the pages the workers touch are counted
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}") as http:
+            for query in queries:
+                http.get("/search_disney_movie", params={"query": query, "is_tag": False})
+        worker_memory = [memory(pid) for pid in children(server.pid)]
+        parent_memory = memory(server.pid)
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait()
+    n = len(worker_memory)
+    return {
+        "startup": startup,
+        "rss": sum(m["rss"] for m in worker_memory) / n,
+        "pss": sum(m["pss"] for m in worker_memory) / n,
+        "uss": sum(m["uss"] for m in worker_memory) / n,
+        "total_pss": parent_memory["pss"] + sum(m["pss"] for m in worker_memory),
+    }
+
+
+# Environment of each measured configuration, "default" is the Config defaults
+CONFIGS = {
+    "default": {},
+    "bm25": {"DENSE_DIMS": "0", "SIMILAR_NEIGHBORS": "0"},
+}
+
+
+def import_time(env: dict, modules: str) -> float:
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", f"import {modules}"], env=env, check=True)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Startup time and memory per worker")
+    parser.add_argument("--movies", type=int, default=5_000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--text-processing", default="lemmatizer")
+    parser.add_argument("--configs", nargs="+", choices=list(CONFIGS), default=list(CONFIGS))
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        movies = synthetic_movies(args.movies)
+        movies.to_csv(Path(directory) / "movies.csv", index=False)
+        queries = synthetic_queries(list(movies[["url", "description"]].values), args.queries)
+        env = {
+            **os.environ,
+            "DATASET_PATH": str(Path(directory) / "movies.csv"),
+            "DATASET_CACHE_DIR": str(Path(directory) / "dataset"),
+            "TEXT_PROCESSING": args.text_processing,
+        }
+        print(f"import app.main: {import_time(env, 'app.main'):.2f}s, with spaCy and nltk: "
+              f"{import_time(env, 'app.main, spacy, nltk.stem.snowball'):.2f}s")
+
+        print(f"movies: {args.movies}, memory per worker in MiB after {args.queries} searches")
+        for config in args.configs:
+            config_env = {
+                **env,
+                **CONFIGS[config],
+                "INDEX_SNAPSHOT_DIR": str(Path(directory) / f"snapshots-{config}"),
+            }
+            # A first run fills the dataset cache and the snapshots, as on a deployed server
+            first = run(1, True, args.port, config_env, [])
+            print(f"{config}: first start, snapshots built, in {first['startup']:5.2f}s")
+            for workers in args.workers:
+                for preload in [False, True]:
+                    result = run(workers, preload, args.port, config_env, queries)
+                    mode = "preloaded" if preload else "per worker"
+                    print(f"{config}, {workers} workers, {mode:>10}: "
+                          f"ready in {result['startup']:5.2f}s, "
+                          f"rss {result['rss']:6.1f}, pss {result['pss']:6.1f}, "
+                          f"uss {result['uss']:6.1f}, total pss {result['total_pss']:7.1f}")
+
+
+if __name__ == "__main__":
+    main()
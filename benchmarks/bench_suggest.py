@@ -0,0 +1,53 @@
+import argparse
+import random
+import time
+
+import numpy as np
+
+from app.search_engine import SearchEngine, TextProcessing
+from app.suggest import Suggester
+from benchmarks.corpus import synthetic_movies
+
+
+def prefixes(movies, n: int, seed: int) -> list[str]:
+    """Prefixes of 1 to 8 characters of the titles and the words of the plots."""
+    rng = random.Random(seed)
+    titles = movies["title"].to_list()
+    descriptions = movies["description"].to_list()
+    texts = []
+    for _ in range(n):
+        words = rng.choice(descriptions).split()
+        texts.append(rng.choice([rng.choice(titles), rng.choice(words)]))
+    return [text[:rng.randint(1, 8)] for text in texts]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Autocomplete latency and memory")
+    parser.add_argument("--movies", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--prefixes", type=int, default=5_000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    for n_movies in args.movies:
+        movies = synthetic_movies(n_movies, seed=args.seed)
+        engine = SearchEngine(text_processing=TextProcessing.Stemmer, stopwords=True)
+        engine.bulk_index(list(movies[["url", "description"]].values), workers=1)
+        engine.compile()
+        start = time.perf_counter()
+        suggester = Suggester(movies, engine)
+        build = time.perf_counter() - start
+
+        latencies = []
+        for prefix in prefixes(movies, args.prefixes, args.seed):
+            start = time.perf_counter()
+            suggester.suggest(prefix)
+            latencies.append(time.perf_counter() - start)
+        p50, p99, maximum = np.percentile(np.array(latencies) * 1e6, [50, 99, 100])
+        print(f"{n_movies:>7} movies: build {build:5.2f}s, "
+              f"{suggester.nbytes / 2**20:6.2f} MB for {len(suggester.titles)} titles, "
+              f"{len(suggester.tags)} tags, {len(suggester.words)} words, "
+              f"suggest p50 {p50:6.1f} p99 {p99:6.1f} max {maximum:6.1f} µs")
+
+
+if __name__ == "__main__":
+    main()
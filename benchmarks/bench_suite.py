@@ -0,0 +1,155 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+from pathlib import Path
+
+import numpy as np
+
+import app.utils as utils
+from app.config import Config
+from app.facets import MovieFilters
+from app.search_engine import SearchEngine, TextProcessing
+from benchmarks.corpus import synthetic_movies, synthetic_query_mix
+
+
+BASELINES = Path(__file__).with_name("baselines.json")
+PERCENTILES = [50, 95, 99]
+# Metric -> True when higher is better
+DIRECTIONS = {
+    "build_documents_per_second": True,
+    "index_megabytes": False,
+    "rss_megabytes": False,
+    "latency_ms": False,
+}
+
+
+def rss_megabytes() -> float:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+
+def index_megabytes(engine: SearchEngine) -> float:
+    index = engine._compiled
+    arrays = [index.indptr, index.doc_ids, index.term_freqs, index.doc_lengths,
+              engine._doc_norms, engine._max_impacts]
+    return sum(array.nbytes for array in arrays) / 2**20
+
+
+def latency_percentiles(latencies: list[float]) -> dict[str, float]:
+    values = np.percentile(np.array(latencies) * 1000, PERCENTILES)
+    return {f"p{p}": round(float(value), 4) for p, value in zip(PERCENTILES, values)}
+
+
+def run_size(n_documents: int, n_queries: int, seed: int) -> dict:
+    movies = synthetic_movies(n_documents, seed=seed,
+                              vocabulary_size=min(200_000, max(5_000, n_documents // 5)))
+    rss_before = rss_megabytes()
+    engine = SearchEngine(text_processing=TextProcessing.Stemmer)
+    engine.analyzer.load_models()
+    start = time.perf_counter()
+    engine.bulk_index(list(movies[["url", "description"]].values), workers=1)
+    engine.compile()
+    build_seconds = time.perf_counter() - start
+    engine.release_postings()
+    state = utils.build_search_state(movies, engine)
+    rss = rss_megabytes() - rss_before
+
+    # Uncached requests: search, filters, sorting and JSON rendering of each response
+    latencies = {}
+    for kind, query, is_tag in synthetic_query_mix(movies, n_queries, seed=seed):
+        start = time.perf_counter()
+        ranked = utils.rank_movies(query, is_tag, Config.k, MovieFilters(), state)
+        if ranked is not None:
+            state.record_store.render(ranked)
+        latencies.setdefault(kind, []).append(time.perf_counter() - start)
+    latencies["all"] = [latency for kind in list(latencies) for latency in latencies[kind]]
+    return {
+        "build_documents_per_second": round(n_documents / build_seconds, 1),
+        "index_megabytes": round(index_megabytes(engine), 3),
+        "rss_megabytes": round(rss, 1),
+        "latency_ms": {kind: latency_percentiles(values) for kind, values in latencies.items()},
+    }
+
+
+def flatten(results: dict, prefix: str = "") -> dict[str, float]:
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{prefix}{key}."))
+        else:
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+
+def regressions(results: dict, baselines: dict, tolerance: float) -> list[str]:
+    """Metrics worse than their baseline by more than tolerance (a fraction)."""
+    failures = []
+    for size, metrics in results.items():
+        baseline = flatten(baselines.get(size, {}))
+        for name, value in flatten(metrics).items():
+            if name not in baseline:
+                continue
+            higher_is_better = DIRECTIONS[name.split(".")[0]]
+            expected = baseline[name]
+            if higher_is_better and value < expected * (1 - tolerance):
+                failures.append(f"{size} documents, {name}: {value} < baseline {expected}")
+            elif not higher_is_better and value > expected * (1 + tolerance):
+                failures.append(f"{size} documents, {name}: {value} > baseline {expected}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Engine benchmark suite with regression gates")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[500, 5_000, 50_000],
+                        help="corpus sizes, up to 1M documents")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, help="write the results as JSON")
+    parser.add_argument("--baselines", type=Path, default=BASELINES)
+    parser.add_argument("--tolerance", type=float, default=0.5,
+                        help="allowed regression, as a fraction of the baseline")
+    parser.add_argument("--update-baselines", action="store_true")
+    args = parser.parse_args()
+
+    results = {}
+    for size in args.sizes:
+        results[str(size)] = result = run_size(size, args.queries, args.seed)
+        latency = result["latency_ms"]["all"]
+        print(f"{size:>9} documents: build {result['build_documents_per_second']:9.0f} docs/s, "
+              f"index {result['index_megabytes']:8.1f} MB, rss {result['rss_megabytes']:7.1f} MB, "
+              f"latency p50 {latency['p50']:.2f} p95 {latency['p95']:.2f} "
+              f"p99 {latency['p99']:.2f} ms")
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "queries": args.queries,
+            "seed": args.seed,
+        },
+        "results": results,
+    }
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2))
+
+    if args.update_baselines:
+        baselines = json.loads(args.baselines.read_text()) if args.baselines.exists() else {}
+        args.baselines.write_text(json.dumps({**baselines, **results}, indent=2) + "\n")
+        print(f"Baselines updated in {args.baselines}")
+        return
+    if not args.baselines.exists():
+        return
+    failures = regressions(results, json.loads(args.baselines.read_text()), args.tolerance)
+    for failure in failures:
+        print(f"REGRESSION {failure}")
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+import argparse
+import time
+
+from app.search_engine import SearchEngine
+from app.utils import topk_documents
+from benchmarks.corpus import synthetic_documents, synthetic_queries
+
+
+def timed(func, queries: list[str]) -> tuple[float, list]:
+    start = time.perf_counter()
+    results = [func(query) for query in queries]
+    return (time.perf_counter() - start) / len(queries) * 1000, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Full score-and-sort vs MaxScore top-k")
+    parser.add_argument("--documents", type=int, default=100_000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    documents = synthetic_documents(args.documents)
+    engine = SearchEngine()
+    engine.bulk_index(documents)
+    engine.compile()
+
+    print(f"documents: {args.documents}, k: {args.k}")
+    for min_words, max_words in [(1, 2), (3, 5), (8, 12)]:
+        queries = synthetic_queries(documents, args.queries, min_words, max_words)
+        full_ms, expected = timed(lambda q: topk_documents(engine.search(q), args.k), queries)
+        topk_ms, results = timed(lambda q: engine.search_topk(q, args.k), queries)
+        assert results == expected
+        print(f"{min_words:>2}-{max_words:<2} words: search + sort {full_ms:7.2f} ms, "
+              f"search_topk {topk_ms:7.2f} ms, speedup x{full_ms / topk_ms:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+import random
+
+from datetime import date
+from itertools import accumulate
+from string import ascii_lowercase
+
+from pandas import DataFrame, to_datetime
+
+
+def synthetic_vocabulary(size: int, seed: int = 0) -> list[str]:
+    rng = random.Random(seed)
+    words = set()
+    while len(words) < size:
+        length = rng.randint(3, 10)
+        words.add("".join(rng.choices(ascii_lowercase, k=length)))
+    return sorted(words)
+
+
+def synthetic_documents(n_documents: int,
+                        vocabulary_size: int = 50_000,
+                        min_words: int = 40,
+                        max_words: int = 160,
+                        seed: int = 0) -> list[tuple[str, str]]:
+    # Zipf-like word frequencies, similar to natural language plots
+    rng = random.Random(seed)
+    vocabulary = synthetic_vocabulary(vocabulary_size, seed=seed)
+    cum_weights = zipf_cum_weights(vocabulary_size)
+    documents = []
+    for i in range(n_documents):
+        n_words = rng.randint(min_words, max_words)
+        words = rng.choices(vocabulary, cum_weights=cum_weights, k=n_words)
+        documents.append((f"movie_{i}", " ".join(words)))
+    return documents
+
+
+def zipf_cum_weights(size: int) -> list[float]:
+    # Cumulated once, rng.choices would otherwise sum the weights on every call
+    return list(accumulate(1 / rank for rank in range(1, size + 1)))
+
+
+def synthetic_queries(documents: list[tuple[str, str]],
+                      n_queries: int,
+                      min_words: int = 1,
+                      max_words: int = 6,
+                      seed: int = 0) -> list[str]:
+    # Queries are sampled from the plots, so every query has matching documents
+    rng = random.Random(seed)
+    queries = []
+    for _ in range(n_queries):
+        words = rng.choice(documents)[1].split()
+        n_words = min(len(words), rng.randint(min_words, max_words))
+        queries.append(" ".join(rng.sample(words, k=n_words)))
+    return queries
+
+
+def synthetic_movies(n_movies: int, seed: int = 0, vocabulary_size: int = 5_000) -> DataFrame:
+    """Movies with the columns of the dataset after get_documents, newest first.
+
+    Like the Disney plots, description lengths are log-normal (median about
+    90 words, with a long tail), and a few tags such as "princess" are on
+    many movies while most tags are rare (Zipf).
+    """
+    rng = random.Random(seed)
+    vocabulary = synthetic_vocabulary(vocabulary_size, seed=seed)
+    cum_weights = zipf_cum_weights(vocabulary_size)
+    descriptions = [
+        " ".join(rng.choices(vocabulary, cum_weights=cum_weights,
+                             k=min(600, max(20, int(rng.lognormvariate(4.5, 0.6))))))
+        for _ in range(n_movies)
+    ]
+    tags = synthetic_vocabulary(300, seed=seed + 1)
+    tag_weights = zipf_cum_weights(len(tags))
+    genres = ["Adventure", "Comedy", "Drama", "Fantasy", "Musical"]
+    movies = DataFrame({
+        "url": [f"movie_{i}" for i in range(n_movies)],
+        "description": descriptions,
+        "movie_id": [f"movie_{i}" for i in range(n_movies)],
+        "image_format": "jpg",
+        "title": [
+            " ".join(rng.choices(vocabulary, k=rng.randint(1, 4))).title()
+            for _ in range(n_movies)
+        ],
+        "release_date": to_datetime([
+            date(rng.randint(1937, 2024), rng.randint(1, 12), rng.randint(1, 28))
+            for _ in range(n_movies)
+        ]),
+        "running_time_minutes": [rng.randint(60, 180) for _ in range(n_movies)],
+        "genre": [rng.sample(genres, k=rng.randint(1, 3)) for _ in range(n_movies)],
+        "tags": [
+            list(dict.fromkeys(rng.choices(tags, cum_weights=tag_weights, k=rng.randint(3, 8))))
+            for _ in range(n_movies)
+        ],
+        "movie_summary": [description[:200] for description in descriptions],
+        "budget": [rng.randint(1, 300) * 1_000_000 for _ in range(n_movies)],
+        "box_office": [rng.randint(1, 2_000) * 1_000_000 for _ in range(n_movies)],
+    })
+    movies["profit"] = movies["box_office"] - movies["budget"]
+    return movies.sort_values(by="release_date", ascending=False)
+
+
+def synthetic_query_mix(movies: DataFrame, n_queries: int, seed: int = 0) -> list[tuple]:
+    """(kind, query, is_tag) requests like the ones of the frontend.
+
+    Short keyword queries, movie titles, tags (popular tags more often) and
+    long free text queries pasted from a plot.
+    """
+    rng = random.Random(seed)
+    descriptions = movies["description"].tolist()
+    titles = movies["title"].tolist()
+    tags = movies["tags"].explode().tolist()
+    requests = []
+    for kind in rng.choices(["keywords", "title", "tag", "free_text"],
+                            weights=[40, 25, 20, 15], k=n_queries):
+        if kind == "title":
+            requests.append((kind, rng.choice(titles), False))
+        elif kind == "tag":
+            requests.append((kind, rng.choice(tags), True))
+        else:
+            words = rng.choice(descriptions).split()
+            n_words = rng.randint(1, 3) if kind == "keywords" else rng.randint(15, 40)
+            requests.append((kind, " ".join(rng.sample(words, k=min(n_words, len(words)))), False))
+    return requests
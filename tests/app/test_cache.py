@@ -0,0 +1,69 @@
+from app.cache import MISSING, ResponseCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_lru_eviction_by_entries():
+    cache = ResponseCache(max_entries=2)
+    cache.put("a", b"1", generation=1)
+    cache.put("b", b"2", generation=1)
+    assert cache.get("a", generation=1) == b"1"
+    cache.put("c", b"3", generation=1)
+    assert cache.get("b", generation=1) is MISSING
+    assert cache.get("a", generation=1) == b"1"
+    assert cache.get("c", generation=1) == b"3"
+    assert cache.stats()["evictions"] == 1
+
+
+def test_eviction_by_bytes():
+    cache = ResponseCache(max_bytes=10)
+    cache.put("a", b"12345", generation=1)
+    cache.put("b", b"12345", generation=1)
+    cache.put("c", b"123", generation=1)
+    assert cache.get("a", generation=1) is MISSING
+    assert cache.stats()["bytes"] == 8
+    cache.put("too large", b"12345678901", generation=1)
+    assert cache.get("too large", generation=1) is MISSING
+
+
+def test_none_responses_are_cached():
+    cache = ResponseCache()
+    cache.put("not found", None, generation=1)
+    assert cache.get("not found", generation=1) is None
+
+
+def test_ttl():
+    clock = FakeClock()
+    cache = ResponseCache(ttl=10, clock=clock)
+    cache.put("a", b"1", generation=1)
+    clock.now = 9.9
+    assert cache.get("a", generation=1) == b"1"
+    clock.now = 10
+    assert cache.get("a", generation=1) is MISSING
+    assert cache.stats()["entries"] == 0
+
+
+def test_new_generation_clears_the_cache():
+    cache = ResponseCache()
+    cache.put("a", b"1", generation=1)
+    assert cache.get("a", generation=2) is MISSING
+    cache.put("a", b"2", generation=2)
+    assert cache.get("a", generation=2) == b"2"
+    assert cache.stats() == {
+        "entries": 1, "bytes": 1, "hits": 1, "misses": 1, "evictions": 0, "generation": 2,
+    }
+
+
+def test_older_generation_bypasses_the_cache():
+    cache = ResponseCache()
+    cache.put("a", b"2", generation=2)
+    cache.put("a", b"1", generation=1)
+    assert cache.get("a", generation=1) is MISSING
+    assert cache.get("a", generation=2) == b"2"
+    assert cache.stats()["generation"] == 2
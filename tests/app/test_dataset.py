@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+
+from pandas.testing import assert_frame_equal
+
+import app.utils as utils
+
+from app.config import Config
+from app.dataset import load_dataset, save_dataset
+from tests.app.test_records import MOVIES
+
+
+SOURCE = "movies.csv"
+
+
+@pytest.fixture
+def movies():
+    # Sorted and filtered like read_documents, the index is not a range
+    return MOVIES.assign(description=["a", "b", "c", "d"]).sort_values("release_date").iloc[:-1]
+
+
+def test_round_trip(movies, tmp_path):
+    save_dataset(movies, tmp_path / "dataset", SOURCE)
+    loaded = load_dataset(tmp_path / "dataset", SOURCE)
+    assert_frame_equal(loaded, movies)
+    assert loaded["tags"].tolist() == movies["tags"].tolist()
+    assert loaded["profit"].tolist() == ["", 476_000_000, 1_130_000_000]
+
+
+def test_load_selected_columns(movies, tmp_path):
+    save_dataset(movies, tmp_path / "dataset", SOURCE)
+    loaded = load_dataset(tmp_path / "dataset", SOURCE, columns=["genre", "url"])
+    assert loaded.columns.tolist() == ["url", "genre"]
+    assert_frame_equal(loaded, movies[["url", "genre"]])
+    assert load_dataset(tmp_path / "dataset", SOURCE, columns=["unknown"]) is None
+
+
+def test_missing_stale_or_corrupt_cache(movies, tmp_path):
+    directory = save_dataset(movies, tmp_path / "dataset", SOURCE)
+    assert load_dataset(tmp_path / "missing", SOURCE) is None
+    assert load_dataset(directory, "other.csv") is None
+    np.save(directory / "title.data.npy", np.zeros(3, dtype=np.uint8))
+    assert load_dataset(directory, SOURCE) is None
+    assert load_dataset(directory, SOURCE, columns=["url"]) is not None
+
+
+def test_cache_is_stale_when_the_source_file_changes(movies, tmp_path):
+    source = tmp_path / "movies.csv"
+    source.write_text("movies")
+    directory = save_dataset(movies, tmp_path / "dataset", str(source))
+    assert load_dataset(directory, str(source)) is not None
+    source.write_text("more movies")
+    assert load_dataset(directory, str(source)) is None
+
+
+def test_load_documents_reads_the_source_once(movies, tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, "dataset_cache_dir", str(tmp_path / "dataset"))
+    reads = []
+    monkeypatch.setattr(utils, "read_documents", lambda: reads.append(1) or movies)
+    assert_frame_equal(utils.load_documents(), movies)
+    assert_frame_equal(utils.load_documents(), movies)
+    assert len(reads) == 1
+    utils.load_documents(refresh=True)
+    assert len(reads) == 2
+
+
+def test_load_documents_reads_only_the_used_columns(movies, tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, "dataset_cache_dir", str(tmp_path / "dataset"))
+    monkeypatch.setattr(utils, "read_documents", lambda: movies.assign(unused=0))
+    utils.load_documents()
+    assert utils.load_documents().columns.tolist() == movies.columns.tolist()
+    assert set(utils.DOCUMENT_COLUMNS) == set(movies.columns)
@@ -0,0 +1,151 @@
+import numpy as np
+import pytest
+
+from app.dense import (
+    csr_matmul,
+    DenseIndex,
+    randomized_svd,
+    reciprocal_rank_fusion,
+    transpose_csr,
+)
+from app.search_engine import SearchEngine, TextProcessing
+from app.utils import fetch_query_results
+
+
+def to_csr(matrix: np.ndarray):
+    rows, columns = np.nonzero(matrix)
+    indptr = np.zeros(len(matrix) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=len(matrix)), out=indptr[1:])
+    return indptr, columns.astype(np.int32), matrix[rows, columns]
+
+
+def random_csr(n_rows: int, n_columns: int, density: float, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    matrix = rng.random((n_rows, n_columns), dtype=np.float32)
+    matrix[rng.random((n_rows, n_columns)) > density] = 0
+    matrix[1] = 0
+    return matrix, to_csr(matrix)
+
+
+def test_csr_matmul(monkeypatch):
+    matrix, csr = random_csr(50, 30, 0.2)
+    dense = np.random.default_rng(1).random((30, 4), dtype=np.float32)
+    expected = matrix @ dense
+    np.testing.assert_allclose(csr_matmul(*csr, dense), expected, rtol=1e-5)
+    # Chunks of a few postings
+    monkeypatch.setattr("app.dense.MAX_PRODUCTS", 20)
+    np.testing.assert_allclose(csr_matmul(*csr, dense), expected, rtol=1e-5)
+
+
+def test_transpose_csr():
+    matrix, csr = random_csr(20, 10, 0.3)
+    transposed = transpose_csr(*csr, n_columns=10)
+    np.testing.assert_allclose(csr_matmul(*transposed, np.eye(20, dtype=np.float32)), matrix.T)
+
+
+def test_randomized_svd_of_a_low_rank_matrix():
+    rng = np.random.default_rng(0)
+    # documents x terms of rank 5, an empty document and an empty term
+    matrix = (rng.random((80, 5)) @ rng.random((5, 40))).astype(np.float32)
+    matrix[3] = 0
+    matrix[:, 1] = 0
+    vectors, projection = randomized_svd(to_csr(matrix.T), n_documents=80, dims=5)
+    np.testing.assert_allclose(
+        np.linalg.norm(vectors, axis=0), np.linalg.svd(matrix, compute_uv=False)[:5], rtol=1e-3
+    )
+    np.testing.assert_allclose(vectors @ projection.T, matrix, atol=1e-3)
+
+
+@pytest.fixture(scope="module")
+def vectors():
+    return np.random.default_rng(0).standard_normal((500, 16)).astype(np.float32)
+
+
+def brute_force(vectors, query, k):
+    normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    return np.argsort(-(normalized @ query), kind="stable")[:k]
+
+
+def test_exact_search(vectors, monkeypatch):
+    monkeypatch.setattr("app.dense.BLOCK_ROWS", 64)
+    index = DenseIndex(vectors, np.eye(16, dtype=np.float32))
+    queries = index.vectors[[3, 10]]
+    ids, scores = index.search(queries, k=5)
+    for query, query_ids, query_scores in zip(queries, ids, scores):
+        np.testing.assert_array_equal(query_ids, brute_force(vectors, query, 5))
+        assert list(query_scores) == sorted(query_scores, reverse=True)
+    assert ids[0][0] == 3 and scores[0][0] == pytest.approx(1.0)
+
+
+def test_quantized_search(vectors):
+    index = DenseIndex(vectors, np.eye(16, dtype=np.float32), quantize=True)
+    assert index.vectors.dtype == np.int8
+    query = vectors[7] / np.linalg.norm(vectors[7])
+    ids, scores = index.search(query[None], k=10)
+    assert ids[0][0] == 7 and scores[0][0] == pytest.approx(1.0, abs=0.02)
+    assert len(set(ids[0]) & set(brute_force(vectors, query, 10))) >= 8
+
+
+def test_ivf_search_probing_every_list_is_exact(vectors):
+    index = DenseIndex(vectors, np.eye(16, dtype=np.float32), n_lists=10, n_probe=10)
+    assert index.list_ptr[-1] == len(vectors)
+    query = vectors[42] / np.linalg.norm(vectors[42])
+    ids, _ = index.search(query[None], k=5)
+    np.testing.assert_array_equal(ids[0], brute_force(vectors, query, 5))
+    index.n_probe = 1
+    ids, _ = index.search(query[None], k=5)
+    assert ids[0][0] == 42
+
+
+@pytest.mark.parametrize("quantize, n_lists", [(False, 0), (True, 10)])
+def test_save_and_load(vectors, tmp_path, quantize, n_lists):
+    index = DenseIndex(vectors, np.eye(16, dtype=np.float32), quantize=quantize, n_lists=n_lists)
+    parameters = {"quantize": quantize, "n_lists": n_lists}
+    index.save(tmp_path / "dense", parameters)
+    loaded = DenseIndex.load(tmp_path / "dense", parameters, n_probe=8)
+    queries = np.eye(16, dtype=np.float32)[:3]
+    for expected, found in zip(index.search(queries, k=5), loaded.search(queries, k=5)):
+        np.testing.assert_array_equal(np.stack(expected), np.stack(found))
+    assert DenseIndex.load(tmp_path / "dense", {**parameters, "n_lists": 5}) is None
+    assert DenseIndex.load(tmp_path / "missing", parameters) is None
+
+
+def test_reciprocal_rank_fusion():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["c", "d", "a"]], k=3, rrf_k=1)
+    assert [url for url, _ in fused] == ["a", "c", "b"]
+    assert fused[0][1] == pytest.approx(1 / 2 + 1 / 4)
+
+
+DOCUMENTS = [
+    ("mermaid", "A young mermaid gives her voice to a sea witch to become human"),
+    ("beauty", "A young woman is held prisoner in a castle by a beast"),
+    ("nemo", "A clownfish crosses the ocean to find his son"),
+    ("moana", "A girl sails across the ocean to save her island"),
+]
+
+
+@pytest.fixture(scope="module")
+def engine():
+    engine = SearchEngine(text_processing=TextProcessing.Stemmer, stopwords=True)
+    engine.bulk_index(DOCUMENTS, workers=1)
+    engine.compile()
+    return engine
+
+
+@pytest.mark.parametrize("retrieval", ["dense", "hybrid"])
+def test_dense_and_hybrid_retrieval(engine, retrieval):
+    dense_index = DenseIndex.build(engine.bm25_weights(), engine.number_of_documents, dims=3)
+    results = fetch_query_results(
+        "ocean fish", k=2, score_filter=False, engine=engine, retrieval=retrieval,
+        dense_index=dense_index,
+    )
+    assert len(results) == 2
+    assert {url for url, _ in results} <= {"nemo", "moana"}
+    assert fetch_query_results("unknown", 2, False, engine, retrieval, dense_index) == []
+
+
+@pytest.mark.parametrize("retrieval", ["dense", "hybrid"])
+def test_unrelated_documents_are_not_returned(engine, retrieval):
+    dense_index = DenseIndex.build(engine.bm25_weights(), engine.number_of_documents, dims=3)
+    results = fetch_query_results("castle beast", 4, False, engine, retrieval, dense_index)
+    assert [url for url, _ in results] == ["beauty"]
@@ -0,0 +1,67 @@
+import asyncio
+import pytest
+import threading
+
+from app.executor import SaturatedError, SearchExecutor
+
+
+class BlockingSearch:
+    def __init__(self):
+        self.calls = 0
+        self.release = threading.Event()
+
+    def __call__(self, query: str) -> str:
+        self.calls += 1
+        self.release.wait(timeout=5)
+        return query.upper()
+
+
+async def run_concurrently(executor: SearchExecutor, search: BlockingSearch, keys: list[str]):
+    tasks = [asyncio.create_task(executor.run(key, search, key)) for key in keys]
+    await asyncio.sleep(0.05)
+    search.release.set()
+    return await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def test_identical_searches_are_coalesced():
+    executor = SearchExecutor(workers=2)
+    search = BlockingSearch()
+    results = asyncio.run(run_concurrently(executor, search, ["a", "a", "a", "b"]))
+    assert results == ["A", "A", "A", "B"]
+    assert search.calls == 2
+    assert executor.stats() == {"pending": 0, "coalesced": 2, "rejected": 0}
+    executor.shutdown()
+
+
+def test_saturated_executor_rejects_searches():
+    executor = SearchExecutor(workers=1, max_pending=2)
+    search = BlockingSearch()
+    results = asyncio.run(run_concurrently(executor, search, ["a", "b", "c", "a"]))
+    assert results[:2] == ["A", "B"]
+    assert isinstance(results[2], SaturatedError)
+    assert results[3] == "A"
+    assert executor.rejected == 1
+    executor.shutdown()
+
+
+def test_inline_executor_runs_on_the_event_loop():
+    executor = SearchExecutor(kind="inline")
+    loop_thread = threading.get_ident()
+
+    async def search():
+        return await executor.run("key", threading.get_ident)
+
+    assert asyncio.run(search()) == loop_thread
+
+
+@pytest.mark.parametrize("kind", ["thread", "inline"])
+def test_exceptions_are_raised_to_the_caller(kind):
+    executor = SearchExecutor(kind=kind)
+
+    async def search():
+        return await executor.run("key", int, "not a number")
+
+    with pytest.raises(ValueError):
+        asyncio.run(search())
+    assert executor.pending == 0
+    executor.shutdown()
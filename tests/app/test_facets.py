@@ -0,0 +1,83 @@
+import pytest
+
+from collections import Counter
+from datetime import date
+
+from pandas import DataFrame, Series, to_datetime
+
+from app.facets import FacetIndex, MovieFilters, TagSampler
+
+
+MOVIES = DataFrame({
+    "url": ["frozen", "moana", "aladdin", "bambi"],
+    "release_date": to_datetime(["2013-11-27", "2016-11-23", "1992-11-25", "1942-08-13"]),
+    "tags": [["princess", "snow"], ["ocean"], ["princess", "magic"], ["forest"]],
+    "genre": [["Musical"], ["Musical", "Adventure"], ["Musical"], ["Drama"]],
+    "budget": [150_000_000, 150_000_000, 28_000_000, 858_000],
+    "box_office": [1_280_000_000, 687_000_000, 504_000_000, 267_000_000],
+    "profit": [1_130_000_000, 537_000_000, 476_000_000, ""],
+})
+
+
+@pytest.fixture(scope="module")
+def facet_index():
+    return FacetIndex(MOVIES)
+
+
+@pytest.mark.parametrize("filters, expected_rows", [
+    (MovieFilters(), None),
+    (MovieFilters(tags=["princess"]), [0, 2]),
+    (MovieFilters(tags=["princess"], genres=["Musical"]), [0, 2]),
+    (MovieFilters(tags=["unknown"]), []),
+    (MovieFilters(genres=["Musical"], min_release_date=date(2000, 1, 1)), [0, 1]),
+    (MovieFilters(max_release_date=date(1992, 11, 25)), [2, 3]),
+    (MovieFilters(min_budget=1_000_000, max_budget=150_000_000), [0, 1, 2]),
+    (MovieFilters(min_box_office=600_000_000), [0, 1]),
+    (MovieFilters(max_profit=500_000_000), [2]),
+])
+def test_select(facet_index, filters, expected_rows):
+    selection = facet_index.select(filters)
+    if expected_rows is None:
+        assert selection is None
+    else:
+        assert facet_index.rows(selection).tolist() == expected_rows
+
+
+def test_urls_and_tag_bitmaps(facet_index):
+    candidates = facet_index.urls(["bambi", "not_indexed"]) | facet_index.tag("princess")
+    assert facet_index.rows(candidates).tolist() == [0, 2, 3]
+
+
+def test_filters_key():
+    assert MovieFilters().is_empty()
+    assert not MovieFilters(limit=3).is_empty()
+    assert MovieFilters(sort_order="ascending").is_empty()
+    assert not MovieFilters(sort_by="relevancy").is_empty()
+    assert MovieFilters(sort_by="relevancy").is_empty(show_all=True)
+    assert not MovieFilters(sort_by="relevancy", sort_order="ascending").is_empty(show_all=True)
+    assert (MovieFilters(tags=["snow", "princess"]).key() ==
+            MovieFilters(tags=["princess", "snow", "snow"]).key())
+    assert MovieFilters(min_budget=1).key() != MovieFilters(max_budget=1).key()
+
+
+TAGS = Series([["princess", "snow", ""], ["princess"], ["princess", "magic"], ["magic"], [""]])
+
+
+@pytest.mark.parametrize("min_count, expected", [
+    (0, {"princess", "magic", "snow"}),
+    (1, {"princess", "magic", "snow"}),
+    (2, {"princess", "magic"}),
+    (3, {"princess"}),
+    (4, set()),
+])
+def test_tag_sampler_eligible_tags(min_count, expected):
+    tags = TagSampler(TAGS, seed=0).sample(min_count)
+    assert len(tags) == len(expected) and set(tags) == expected
+
+
+def test_tag_sampler_orders_heavier_tags_first():
+    sampler = TagSampler(TAGS, seed=0)
+    firsts = Counter(sampler.sample(1)[0] for _ in range(2000))
+    # Weights 9, 4 and 1: a tag is first with probability weight / 14
+    assert firsts["princess"] / 2000 == pytest.approx(9 / 14, abs=0.05)
+    assert firsts["snow"] / 2000 == pytest.approx(1 / 14, abs=0.03)
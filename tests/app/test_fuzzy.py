@@ -0,0 +1,91 @@
+import pytest
+
+from app.fuzzy import SymmetricDeleteIndex, deletes, edit_distance
+from app.search_engine import SearchEngine, TextProcessing
+
+
+DOCUMENTS = [
+    ("aladdin", "Aladdin finds a magic lamp with a genie"),
+    ("pinocchio", "Pinocchio is a wooden puppet who wants to become a real boy"),
+    ("frozen", "Frozen sisters in a kingdom of ice and snow"),
+    ("mermaid", "A little mermaid princess wants to live on land"),
+]
+
+
+def test_deletes():
+    assert deletes("abc", 1) == {"abc", "ab", "ac", "bc"}
+    assert deletes("abc", 2) == {"abc", "ab", "ac", "bc", "a", "b", "c"}
+
+
+@pytest.mark.parametrize("a, b, expected", [
+    ("frozen", "frozen", 0),
+    ("frozzen", "frozen", 1),
+    ("pinochio", "pinocchio", 1),
+    ("mermiad", "mermaid", 1),
+    ("alladin", "aladdin", 2),
+    ("kitten", "sitting", 3),
+    ("abc", "abcdef", 3),
+])
+def test_edit_distance(a, b, expected):
+    assert edit_distance(a, b, 3) == expected
+    assert edit_distance(a, b, 1) == min(expected, 2)
+
+
+@pytest.mark.parametrize("prefix_length", [3, 7, 20])
+def test_lookup_finds_the_terms_within_the_distance(prefix_length):
+    terms = ["aladdin", "alad", "frozen", "froze", "snow", "pinocchio", "princess"]
+    index = SymmetricDeleteIndex(terms, max_distance=2, prefix_length=prefix_length)
+    for word in ["aladin", "frozn", "pinochio", "prinses", "snowy", "zzz"]:
+        expected = sorted(
+            (term_id, edit_distance(word, term, 2)) for term_id, term in enumerate(terms)
+            if edit_distance(word, term, 2) <= 2
+        )
+        assert sorted(index.lookup(word)) == expected
+    assert index.lookup("frozn", max_distance=1) == [(2, 1), (3, 1)]
+    assert index.lookup("frozn")[0][1] == 1
+
+
+@pytest.fixture(scope="module")
+def engine():
+    engine = SearchEngine(text_processing=TextProcessing.Stemmer, stopwords=True, fuzzy_distance=2)
+    engine.bulk_index(DOCUMENTS, workers=1)
+    engine.compile()
+    return engine
+
+
+@pytest.mark.parametrize("query, url, distance", [
+    ("pinochio", "pinocchio", 1),
+    ("frozzen", "frozen", 1),
+    ("alladin", "aladdin", 2),
+])
+def test_misspelled_queries_are_corrected(engine, query, url, distance):
+    exact = dict(engine.search_topk(url, k=1))
+    results = engine.search_topk(query, k=3)
+    assert results == [(url, pytest.approx(exact[url] * engine.fuzzy_penalty ** distance))]
+    assert engine.search(query) == dict(results)
+    assert engine.search_many([query], k=3) == [results]
+
+
+def test_words_are_corrected_before_stemming(engine):
+    # "prinses" stems to "prins", three edits from the "princess" term
+    assert engine.correct("prinses") == ("princess", 2)
+    assert engine.query_keywords("prinses mermaid") == ["princess~2", "mermaid"]
+    assert engine.search_topk("prinses", k=3)[0][0] == "mermaid"
+
+
+def test_short_words_are_not_corrected(engine):
+    # "boy" would be one edit away
+    assert engine.search_topk("bay", k=3) == []
+    assert engine.correct("bay") == (None, 0)
+
+
+def test_exact_terms_are_not_penalized(engine):
+    corrected = engine.search_topk("mermiad princess", k=1)[0][1]
+    assert corrected > engine.search_topk("mermaid", k=1)[0][1]
+
+
+def test_fuzzy_is_off_by_default():
+    engine = SearchEngine(text_processing=TextProcessing.Stemmer)
+    engine.bulk_index(DOCUMENTS, workers=1)
+    engine.compile()
+    assert engine.search_topk("pinochio", k=3) == []
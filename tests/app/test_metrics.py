@@ -0,0 +1,72 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.config import Config
+from app.metrics import (
+    Counter,
+    Gauge,
+    Histogram,
+    Registry,
+    server_timing,
+    stage,
+    stage_seconds,
+    TimingMiddleware,
+)
+
+
+def test_histogram_samples():
+    histogram = Histogram("latency_seconds", "Latency", labels=("stage",), buckets=(0.1, 1))
+    for value in [0.05, 0.1, 0.5, 3]:
+        histogram.observe(value, "search")
+    assert histogram.samples() == [
+        'latency_seconds_bucket{stage="search",le="0.1"} 2',
+        'latency_seconds_bucket{stage="search",le="1"} 3',
+        'latency_seconds_bucket{stage="search",le="+Inf"} 4',
+        'latency_seconds_sum{stage="search"} 3.65',
+        'latency_seconds_count{stage="search"} 4',
+    ]
+
+
+def test_registry_render():
+    registry = Registry()
+    counter = registry.register(Counter("queries_total", "Queries", labels=("kind",)))
+    counter.inc("batch", amount=3)
+    registry.register(Gauge("documents", "Documents", lambda: 42))
+    registry.register(Gauge("hits_total", "Hits", lambda: 7, kind="counter"))
+    assert registry.render() == (
+        "# HELP queries_total Queries\n"
+        "# TYPE queries_total counter\n"
+        'queries_total{kind="batch"} 3\n'
+        "# HELP documents Documents\n"
+        "# TYPE documents gauge\n"
+        "documents 42\n"
+        "# HELP hits_total Hits\n"
+        "# TYPE hits_total counter\n"
+        "hits_total 7\n"
+    )
+
+
+def test_server_timing():
+    assert server_timing({"search": 0.0012}, 0.002) == "search;dur=1.200, total;dur=2.000"
+
+
+def test_disabled_stages_are_not_recorded(monkeypatch):
+    monkeypatch.setattr(Config, "metrics_enabled", False)
+    with stage("disabled stage"):
+        pass
+    assert ("disabled stage",) not in stage_seconds._series
+
+
+def test_timing_middleware(monkeypatch):
+    monkeypatch.setattr(Config, "metrics_enabled", True)
+    app = FastAPI()
+
+    @app.get("/search")
+    def search():
+        with stage("search"):
+            return {"result": []}
+
+    client = TestClient(TimingMiddleware(app))
+    response = client.get("/search")
+    stages = [entry.split(";")[0] for entry in response.headers["server-timing"].split(", ")]
+    assert stages == ["search", "total"]
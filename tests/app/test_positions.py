@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+
+from app.positions import (
+    decode_positions,
+    encode_positions,
+    gallop_intersect,
+    has_phrase,
+    min_distance,
+)
+
+
+def test_encode_decode_positions():
+    position_lists = [[0, 3, 300], [7], [2, 4, 6, 8]]
+    flat = np.array([p for positions in position_lists for p in positions])
+    ptr, deltas = encode_positions(flat, np.array([len(p) for p in position_lists]))
+    assert deltas.dtype == np.uint16
+    for i, positions in enumerate(position_lists):
+        assert decode_positions(ptr, deltas, i).tolist() == positions
+
+
+@pytest.mark.parametrize("a, b, expected", [
+    ([1, 3, 5, 7], [3, 4, 5, 100], [3, 5]),
+    ([2], [1, 2, 3], [2]),
+    ([], [1, 2], []),
+    ([1, 2], [3, 4], []),
+])
+def test_gallop_intersect(a, b, expected):
+    assert gallop_intersect(np.array(a), np.array(b)).tolist() == expected
+
+
+@pytest.mark.parametrize("term_positions, expected", [
+    ([[0, 10], [11], [12, 40]], True),
+    ([[0, 10], [2, 20], [12]], False),
+    ([[5], [6]], True),
+])
+def test_has_phrase(term_positions, expected):
+    assert has_phrase([np.array(positions) for positions in term_positions]) == expected
+
+
+def test_min_distance():
+    assert min_distance(np.array([1, 10, 30]), np.array([18, 27])) == 3
@@ -0,0 +1,84 @@
+import json
+import numpy as np
+import pytest
+
+from pandas import DataFrame, to_datetime
+
+from app.records import PackedBytes, RankedMovies, RecordStore
+
+
+MOVIES = DataFrame({
+    "url": ["frozen", "moana", "aladdin", "bambi"],
+    "movie_id": ["frozen", "moana", "aladdin", "bambi"],
+    "image_format": ["jpg", "png", "jpg", "jpg"],
+    "title": ["Frozen", "Moana", "Aladdin", "Bambi"],
+    "release_date": to_datetime(["2013-11-27", "2016-11-23", "1992-11-25", "1942-08-13"]),
+    "running_time_minutes": [102, 107, 90, 70],
+    "tags": [["princess", "snow"], ["ocean"], ["princess", "magic"], ["forest"]],
+    "genre": [["Musical"], ["Musical", "Adventure"], ["Musical"], ["Drama"]],
+    "movie_summary": ["Sisters", "Sailing", "A lamp", "A fawn"],
+    "budget": [150_000_000, 150_000_000, 28_000_000, 858_000],
+    "box_office": [1_280_000_000, 687_000_000, 504_000_000, 267_000_000],
+    "profit": [1_130_000_000, 537_000_000, 476_000_000, ""],
+})
+
+
+@pytest.fixture(scope="module")
+def record_store():
+    return RecordStore(MOVIES)
+
+
+def test_response_is_the_json_of_the_records(record_store):
+    rows = np.array([1, 3])
+    movies = json.loads(record_store.response(rows, np.array([2.5, 0.0])))
+    assert [movie["title"] for movie in movies] == ["Moana", "Bambi"]
+    assert [movie["relevancy"] for movie in movies] == [2.5, 0.0]
+    assert movies[0]["release_date"] == "2016-11-23T00:00:00"
+    assert movies[0]["release_year"] == 2016
+    assert movies[0]["genre"] == ["Musical", "Adventure"]
+    assert movies[0]["image_path"].endswith("/moana.png")
+    assert movies[1]["profit"] == ""
+
+
+def test_response_without_relevancy_uses_release_ordinal(record_store):
+    movies = json.loads(record_store.response(np.array([0])))
+    assert movies[0]["relevancy"] == to_datetime("2013-11-27").toordinal()
+
+
+def test_relevancy(record_store):
+    rows = np.array([0, 2, 3])
+    relevancy = record_store.relevancy(rows, [("aladdin", 3.0), ("moana", 1.0), ("bambi", 2.0)])
+    assert relevancy.tolist() == [0.0, 3.0, 2.0]
+
+
+@pytest.mark.parametrize("sort_by, sort_order, expected_rows", [
+    (None, "descending", [0, 1, 2, 3]),
+    ("relevancy", "descending", [1, 0, 2, 3]),
+    ("relevancy", "ascending", [3, 2, 0, 1]),
+    ("budget", "descending", [0, 1, 2, 3]),
+    ("profit", "ascending", [2, 1, 0, 3]),
+    ("profit", "descending", [0, 1, 2, 3]),
+    ("release_date", "ascending", [3, 2, 0, 1]),
+])
+def test_order(record_store, sort_by, sort_order, expected_rows):
+    # frozen and moana tie on relevancy, the release date breaks the tie
+    rows = np.arange(4)
+    relevancy = np.array([2.0, 2.0, 1.0, 0.0])
+    order = record_store.order(rows, relevancy, sort_by, sort_order)
+    assert rows[order].tolist() == expected_rows
+
+
+def test_ranked_movies_page(record_store):
+    ranked = RankedMovies(np.array([3, 1, 0]), np.array([3.0, 2.0, 1.0]))
+    page = ranked.page(1, 5)
+    assert page.rows.tolist() == [1, 0]
+    assert page.relevancy.tolist() == [2.0, 1.0]
+    assert len(record_store.all_ranked.page(0, 2)) == 2
+    assert record_store.render(record_store.all_ranked) == record_store.all_movies
+
+
+def test_packed_bytes():
+    packed = PackedBytes([b"ab", b"", b"cde"])
+    assert len(packed) == 3
+    assert packed.take(np.array([2, 0, 1, 2])) == [b"cde", b"ab", b"", b"cde"]
+    assert packed.take(np.empty(0, dtype=np.int64)) == []
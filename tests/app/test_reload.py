@@ -0,0 +1,165 @@
+import numpy as np
+import os
+import threading
+import pytest
+
+from concurrent.futures import ThreadPoolExecutor
+from fastapi.testclient import TestClient
+
+import app.main as app_main
+import app.utils as utils
+
+from app.config import Config
+from app.executor import SearchExecutor
+from app.search_engine import TextProcessing
+from app.watcher import FileWatcher
+from tests.app.test_records import MOVIES
+
+
+DESCRIPTIONS = [
+    "Two sisters and a snow queen",
+    "A girl sails the ocean",
+    "A street thief finds a magic lamp",
+    "A young deer grows up in the forest",
+]
+
+
+def write_dataset(path, n_movies: int) -> None:
+    movies = MOVIES.assign(description=DESCRIPTIONS)
+    movies = movies.head(n_movies).assign(url=lambda movies: movies["url"] + f"-{n_movies}")
+    movies.to_csv(path, index=False)
+
+
+@pytest.fixture
+def dataset(tmp_path, monkeypatch):
+    path = tmp_path / "movies.csv"
+    write_dataset(path, 2)
+    monkeypatch.setattr(Config, "dataset_path", str(path))
+    monkeypatch.setattr(Config, "text_processing", TextProcessing.Stemmer)
+    monkeypatch.setattr(Config, "index_snapshot_dir", str(tmp_path / "snapshots"))
+    monkeypatch.setattr(Config, "dataset_cache_dir", str(tmp_path / "dataset"))
+    monkeypatch.setattr(Config, "admin_token", "secret")
+    # The app shuts its executor down with each client
+    monkeypatch.setattr(app_main, "search_executor", SearchExecutor(workers=2))
+    utils.set_search_state(None)
+    yield path
+    utils.set_search_state(None)
+
+
+def test_dense_and_similar_movies_are_saved_with_the_snapshot(dataset, monkeypatch):
+    state = utils.build_search_state()
+
+    def rebuilt(*args, **kwargs):
+        raise AssertionError("Rebuilt instead of loaded from the snapshot")
+
+    monkeypatch.setattr(utils.DenseIndex, "build", rebuilt)
+    monkeypatch.setattr(utils.SimilarMovies, "build", rebuilt)
+    loaded = utils.build_search_state()
+    np.testing.assert_array_equal(loaded.dense_index.vectors, state.dense_index.vectors)
+    np.testing.assert_array_equal(loaded.similar_movies.index.ids, state.similar_movies.index.ids)
+    # The similar movies also depend on the tags and genres
+    documents = loaded.documents.assign(tags=[["other"]] * len(loaded.documents))
+    with pytest.raises(AssertionError, match="Rebuilt"):
+        utils.build_search_state(documents)
+
+
+def test_shards_of_replaced_states_are_stopped(dataset, monkeypatch):
+    monkeypatch.setattr(Config, "search_shards", 2)
+    with TestClient(app_main.app) as client:
+        processes = utils.get_search_engine()._processes
+        write_dataset(dataset, 3)
+        response = client.post(
+            "/admin/reload", params={"wait": True}, headers={"X-Admin-Token": "secret"}
+        )
+        assert response.status_code == 200
+        for process in processes:
+            process.join(timeout=5)
+        assert not any(process.is_alive() for process in processes)
+        processes = utils.get_search_engine()._processes
+        assert all(process.is_alive() for process in processes)
+    assert not any(process.is_alive() for process in processes)
+
+
+def test_inherited_shards_are_started_again(dataset, monkeypatch):
+    monkeypatch.setattr(Config, "search_shards", 2)
+    with TestClient(app_main.app):
+        engine = utils.get_search_engine()
+        engine._pid = -1
+        assert utils.get_search_engine() is not engine
+        assert all(process.is_alive() for process in engine._processes)
+        engine._pid = os.getpid()
+        engine.close()
+
+
+def test_reload_needs_the_admin_token(dataset, monkeypatch):
+    with TestClient(app_main.app) as client:
+        assert client.post("/admin/reload", headers={"X-Admin-Token": "wrong"}).status_code == 401
+        monkeypatch.setattr(Config, "admin_token", None)
+        assert client.post("/admin/reload", headers={"X-Admin-Token": ""}).status_code == 403
+
+
+def test_reload_while_serving(dataset):
+    with TestClient(app_main.app) as client:
+        generation = utils.get_search_state().generation
+        stop = threading.Event()
+
+        def search() -> list[int]:
+            status_codes = []
+            while not stop.is_set():
+                response = client.get("/search_disney_movie", params={
+                    "query": "a girl", "is_tag": False,
+                })
+                status_codes.append(response.status_code)
+            return status_codes
+
+        with ThreadPoolExecutor(2) as executor:
+            searches = [executor.submit(search) for _ in range(2)]
+            for n_movies in [3, 4]:
+                write_dataset(dataset, n_movies)
+                response = client.post(
+                    "/admin/reload", params={"wait": True}, headers={"X-Admin-Token": "secret"}
+                )
+                assert response.status_code == 200
+                assert response.json()["movies"] == n_movies
+            stop.set()
+            status_codes = [code for search in searches for code in search.result()]
+
+        assert status_codes and set(status_codes) == {200}
+        assert utils.get_search_state().generation != generation
+        # Bambi is only in the last dataset
+        movies = client.get("/search_disney_movie", params={"query": "deer", "is_tag": False})
+        assert [movie["title"] for movie in movies.json()] == ["Bambi"]
+
+
+def test_search_uses_the_requested_k(dataset):
+    write_dataset(dataset, 4)
+    with TestClient(app_main.app) as client:
+        params = {"query": "sisters ocean lamp forest", "is_tag": False}
+        assert len(client.get("/search_disney_movie", params=params).json()) == 4
+        response = client.get("/search_disney_movie", params={**params, "k": 2})
+        assert len(response.json()) == 2
+
+
+def test_default_page_is_precomputed(dataset, monkeypatch):
+    # The frontend always sends its sort, descending relevancy by default
+    params = {"query": "", "is_tag": False, "sort_by": "relevancy", "sort_order": "descending"}
+    with TestClient(app_main.app) as client:
+        expected = client.get("/search_disney_movie", params={"query": "", "is_tag": False})
+
+        def rank_movies(*args, **kwargs):
+            raise AssertionError("Ranked instead of precomputed")
+
+        monkeypatch.setattr(utils, "rank_movies", rank_movies)
+        response = client.get("/search_disney_movie", params=params)
+        assert response.status_code == 200 and response.content == expected.content
+
+
+def test_file_watcher_reports_changes(tmp_path):
+    path = tmp_path / "movies.csv"
+    path.write_text("old")
+    changed = threading.Event()
+    watcher = FileWatcher(str(path), changed.set, interval=0.01)
+    watcher.start()
+    path.write_text("new content")
+    assert changed.wait(timeout=5)
+    watcher.stop()
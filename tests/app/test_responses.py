@@ -0,0 +1,71 @@
+import base64
+import gzip
+import json
+import numpy as np
+import pytest
+
+from fastapi import HTTPException
+
+from app.records import RankedMovies, RecordStore
+from app.responses import (
+    content_encoding,
+    decode_cursor,
+    encode_cursor,
+    etag_matches,
+    movies_response,
+    ndjson_chunks,
+    strong_etag,
+)
+from tests.app.test_records import MOVIES
+
+
+def test_cursor_round_trip():
+    assert decode_cursor(encode_cursor(generation=3, offset=20), generation=3) == 20
+
+
+@pytest.mark.parametrize("cursor, status_code", [
+    ("not a cursor", 400),
+    ("MQ==", 400),
+    (base64.urlsafe_b64encode(b"[1, 2, 3]").decode(), 400),
+    (base64.urlsafe_b64encode(b'"ab"').decode(), 400),
+    (encode_cursor(generation=2, offset=20), 410),
+    (encode_cursor(generation=3, offset=-1), 410),
+])
+def test_invalid_or_expired_cursor(cursor, status_code):
+    with pytest.raises(HTTPException) as error:
+        decode_cursor(cursor, generation=3)
+    assert error.value.status_code == status_code
+
+
+def test_content_encoding():
+    assert content_encoding("gzip, deflate") == "gzip"
+    assert content_encoding("") == "identity"
+
+
+def test_etags():
+    etag = strong_etag(1, ("princess", False), "gzip")
+    assert etag != strong_etag(2, ("princess", False), "gzip")
+    assert etag != strong_etag(1, ("princess", False), "identity")
+    assert etag_matches(etag, etag)
+    assert etag_matches(f'"other", W/{etag}', etag)
+    assert etag_matches("*", etag)
+    assert not etag_matches(None, etag)
+    assert not etag_matches('"other"', etag)
+
+
+def test_ndjson_chunks():
+    record_store = RecordStore(MOVIES)
+    chunks = list(ndjson_chunks(record_store, RankedMovies(record_store.all_ranked.rows), 3))
+    assert len(chunks) == 2
+    lines = b"".join(chunks).decode().splitlines()
+    assert [json.loads(line) for line in lines] == json.loads(record_store.all_movies)
+
+
+def test_bodies_compressed_below_the_threshold_keep_their_encoding():
+    record_store = RecordStore(MOVIES)
+    ranked = RankedMovies(np.array([0, 1, 2, 3] * 10))
+    response = movies_response(record_store, ranked, {}, "gzip")
+    assert len(response.body) < 1000 < len(record_store.render(ranked))
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert gzip.decompress(response.body) == record_store.render(ranked)
+    assert "Content-Encoding" not in movies_response(record_store, None, {}, "gzip").headers
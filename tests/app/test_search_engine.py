@@ -1,10 +1,17 @@
 import pytest
 import spacy
 
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from math import log
+
 from app.search_engine import (
+    Analyzer,
+    normalize_string,
     remove_stopwords,
+    SearchEngine,
     stemming,
     lemmatizing,
+    TextProcessing,
 )
 
 
@@ -37,3 +44,283 @@ class TestTextProcessing:
     ])
     def test_remove_stopwords(self, input_text, expected_output):
         assert remove_stopwords(input_text, self.nlp) == expected_output
+
+    def test_analyzer_lemmatizer_matches_lemmatizing(self):
+        analyzer = Analyzer(text_processing=TextProcessing.Lemmatizer, nlp=self.nlp)
+        analyzer.analyze_documents(list(self.test_data))
+        for input_text in self.test_data:
+            expected = lemmatizing(normalize_string(input_text), self.nlp).split(" ")
+            assert analyzer.analyze(input_text) == expected
+
+
+DOCUMENTS = [
+    ("aladdin", "A street rat finds a magic lamp and a genie, and falls for a princess."),
+    ("frozen", "A fearless princess sets off on a journey to find her sister."),
+    ("moana", "A daring girl sails out on a mission to save her people."),
+    ("the_little_mermaid", "A mermaid princess makes a deal with a sea witch to find love."),
+    ("toy_story", "A cowboy doll is threatened by a new spaceman toy in the room."),
+]
+
+
+class TestCompiledIndex:
+    @pytest.mark.parametrize("text_processing", [None, TextProcessing.Stemmer])
+    @pytest.mark.parametrize("query", [
+        "princess", "find the princess", "princess princess sea", "lamp genie", "unknown words",
+    ])
+    def test_compiled_search_matches_dict_search(self, text_processing, query):
+        engine = SearchEngine(text_processing=text_processing)
+        engine.bulk_index(DOCUMENTS)
+        expected = engine.search(query)
+        engine.compile()
+        result = engine.search(query)
+        assert result == expected
+        assert list(result) == list(expected)
+
+    def test_index_after_compile_invalidates(self):
+        engine = SearchEngine()
+        engine.bulk_index(DOCUMENTS)
+        engine.compile()
+        engine.index("bambi", "A young deer grows up in the forest with his mother.")
+        assert not engine.is_compiled
+        assert "bambi" in engine.search("deer")
+
+
+def bm25_from_scratch(documents: list[tuple[str, str]], query: str,
+                      k1: float = 1.5, b: float = 0.75) -> dict[str, float]:
+    tokens = {url: normalize_string(content).split(" ") for url, content in documents}
+    avdl = sum(len(words) for words in tokens.values()) / len(tokens)
+    scores = {}
+    for kw in normalize_string(query).split(" "):
+        matches = {url: words.count(kw) for url, words in tokens.items() if kw in words}
+        idf = log((len(tokens) - len(matches) + 0.5) / (len(matches) + 0.5) + 1)
+        for url, freq in matches.items():
+            norm = k1 * (1 - b + b * len(tokens[url]) / avdl)
+            scores[url] = scores.get(url, 0) + idf * freq * (k1 + 1) / (freq + norm)
+    return scores
+
+
+class TestCorpusStatistics:
+    @pytest.mark.parametrize("compiled", [False, True])
+    @pytest.mark.parametrize("query", ["princess", "find the princess", "a sea witch"])
+    def test_scores_match_from_scratch_computation(self, compiled, query):
+        engine = SearchEngine()
+        engine.bulk_index(DOCUMENTS[:3])
+        engine.search(query)  # warm the memoized statistics before the corpus changes
+        engine.bulk_index(DOCUMENTS[3:])
+        if compiled:
+            engine.compile()
+        assert engine.search(query) == bm25_from_scratch(DOCUMENTS, query)
+
+    def test_statistics_are_updated_incrementally(self):
+        engine = SearchEngine()
+        engine.bulk_index(DOCUMENTS)
+        total_tokens = sum(len(normalize_string(content).split()) for _, content in DOCUMENTS)
+        assert engine.statistics.total_tokens == total_tokens
+        assert engine.avdl == total_tokens / len(DOCUMENTS)
+
+
+class TestTopkSearch:
+    @pytest.mark.parametrize("compiled", [False, True])
+    @pytest.mark.parametrize("k", [1, 2, 3, 10])
+    @pytest.mark.parametrize("query", [
+        "princess", "find the princess", "a princess finds a magic sea lamp", "unknown",
+    ])
+    def test_search_topk_matches_sorted_search(self, compiled, k, query):
+        engine = SearchEngine(text_processing=TextProcessing.Stemmer)
+        engine.bulk_index(DOCUMENTS)
+        if compiled:
+            engine.compile()
+        expected = sorted(engine.search(query).items(), key=lambda item: item[1], reverse=True)
+        assert engine.search_topk(query, k) == expected[:k]
+
+    @pytest.mark.parametrize("compiled", [False, True])
+    @pytest.mark.parametrize("max_postings", [0, 4096])
+    @pytest.mark.parametrize("k", [1, 3, 10])
+    def test_search_many_matches_search_topk(self, compiled, max_postings, k):
+        engine = SearchEngine(text_processing=TextProcessing.Stemmer)
+        engine.bulk_index(DOCUMENTS)
+        if compiled:
+            engine.compile()
+        queries = [
+            "princess", "find the princess", "a princess finds a magic sea lamp", "unknown",
+            "", "princess princess sea", "find the princess",
+        ]
+        expected = [engine.search_topk(query, k) for query in queries]
+        assert engine.search_many(queries, k, max_postings=max_postings) == expected
+
+    def test_concurrent_searches_use_separate_buffers(self):
+        engine = SearchEngine(text_processing=TextProcessing.Stemmer)
+        engine.bulk_index([
+            (f"{url}_{i}", content) for i in range(200) for url, content in DOCUMENTS
+        ])
+        engine.compile()
+        queries = ["princess", "find the princess", "sea witch love", "magic lamp"] * 25
+        expected = [engine.search_topk(query, 3) for query in queries]
+        with ThreadPoolExecutor(4) as executor:
+            results = list(executor.map(lambda query: engine.search_topk(query, 3), queries))
+        assert results == expected
+
+
+class TestBulkIndex:
+    @pytest.mark.parametrize("workers", [1, 2])
+    def test_bulk_index_matches_sequential_index(self, workers, monkeypatch):
+        monkeypatch.setattr("app.search_engine.MIN_PARALLEL_DOCUMENTS", 0)
+        sequential = SearchEngine(text_processing=TextProcessing.Stemmer)
+        for url, content in DOCUMENTS:
+            sequential.index(url, content)
+        engine = SearchEngine(text_processing=TextProcessing.Stemmer)
+        assert engine.bulk_index(DOCUMENTS, workers=workers, batch_size=2) > 0
+        assert engine._index == sequential._index
+        assert engine.statistics.doc_lengths == sequential.statistics.doc_lengths
+        assert engine.search("find the princess") == sequential.search("find the princess")
+
+    @pytest.mark.parametrize("n_documents, expected_workers", [(8, None), (2000, 2)])
+    def test_bulk_index_workers(self, monkeypatch, n_documents, expected_workers):
+        started = []
+
+        class Executor(ProcessPoolExecutor):
+            def __init__(self, max_workers, **kwargs):
+                started.append(max_workers)
+                super().__init__(max_workers, **kwargs)
+
+        monkeypatch.setattr("app.search_engine.ProcessPoolExecutor", Executor)
+        documents = [(f"movie-{i}", "a princess") for i in range(n_documents)]
+        # Two chunks of documents, at most two workers
+        SearchEngine().bulk_index(documents, workers=16, batch_size=n_documents // 2)
+        assert started == ([] if expected_workers is None else [expected_workers])
+
+    def test_indexing_changes_generation(self):
+        engine = SearchEngine()
+        other = SearchEngine()
+        assert engine.generation != other.generation
+        generation = engine.generation
+        engine.bulk_index(DOCUMENTS[:2])
+        assert engine.generation != generation
+        generation = engine.generation
+        engine.compile()
+        assert engine.generation == generation
+        engine.index(*DOCUMENTS[2])
+        assert engine.generation != generation
+
+
+class TestSnapshot:
+    def test_load_returns_same_results(self, tmp_path):
+        engine = SearchEngine(text_processing=TextProcessing.Stemmer)
+        engine.bulk_index(DOCUMENTS)
+        engine.save(tmp_path, "dataset")
+        loaded = SearchEngine.load(tmp_path, "dataset", text_processing=TextProcessing.Stemmer)
+        assert loaded.is_compiled
+        assert loaded.posts == engine.posts
+        for query in ["princess", "find the princess sea"]:
+            assert loaded.search(query) == engine.search(query)
+            assert loaded.search_topk(query, 2) == engine.search_topk(query, 2)
+
+    def test_load_rejects_missing_or_mismatching_snapshot(self, tmp_path):
+        engine = SearchEngine(text_processing=TextProcessing.Stemmer)
+        engine.bulk_index(DOCUMENTS)
+        engine.save(tmp_path, "dataset")
+        assert SearchEngine.load(tmp_path, "other_dataset") is None
+        assert SearchEngine.load(tmp_path, "dataset", text_processing=None) is None
+        assert SearchEngine.load(tmp_path, "dataset", k1=1.2,
+                                 text_processing=TextProcessing.Stemmer) is None
+
+    def test_index_into_loaded_engine(self, tmp_path):
+        engine = SearchEngine()
+        engine.bulk_index(DOCUMENTS[:3])
+        engine.save(tmp_path, "dataset")
+        loaded = SearchEngine.load(tmp_path, "dataset")
+        loaded.bulk_index(DOCUMENTS[3:])
+        engine.bulk_index(DOCUMENTS[3:])
+        assert loaded.search("a princess") == engine.search("a princess")
+
+    def test_release_postings(self):
+        engine = SearchEngine(text_processing=TextProcessing.Stemmer)
+        engine.bulk_index(DOCUMENTS[:3])
+        engine.compile()
+        expected = engine.search_topk("find the princess", 2)
+        engine.release_postings()
+        assert not engine._index
+        assert engine.search_topk("find the princess", 2) == expected
+        assert engine.get_urls("princess")
+        engine.bulk_index(DOCUMENTS[3:])
+        full = SearchEngine(text_processing=TextProcessing.Stemmer)
+        full.bulk_index(DOCUMENTS)
+        assert engine.search("a princess") == full.search("a princess")
+
+    def test_release_postings_needs_a_compiled_engine(self):
+        engine = SearchEngine()
+        engine.bulk_index(DOCUMENTS)
+        with pytest.raises(ValueError):
+            engine.release_postings()
+
+
+class TestAnalyzer:
+    def test_spacy_model_is_loaded_on_first_use(self):
+        analyzer = Analyzer(text_processing=TextProcessing.Lemmatizer)
+        assert analyzer._nlp is None
+        analyzer.load_models()
+        assert analyzer._nlp is not None
+
+    queries = ["I change cloths", "They eating a fruit and a veggie", "a princess, finds love!"]
+
+    def test_stemmer_matches_stemming(self):
+        analyzer = Analyzer(text_processing=TextProcessing.Stemmer)
+        analyzer.analyze_documents([content for _, content in DOCUMENTS])
+        assert "princess" in analyzer.table
+        for query in self.queries:
+            assert analyzer.analyze(query) == stemming(normalize_string(query)).split(" ")
+
+    def test_unknown_words_are_cached(self):
+        analyzer = Analyzer(text_processing=TextProcessing.Stemmer, cache_size=2)
+        assert analyzer.analyze("changing changing") == ["chang", "chang"]
+        assert analyzer.table == {}
+        assert analyzer._process_unknown_word.cache_info().hits == 1
+
+    def test_stopwords_are_removed(self):
+        analyzer = Analyzer(stopwords=True)
+        tokens, _ = analyzer.analyze_documents(["And hello and world"])
+        assert tokens == [["hello", "world"]]
+        assert analyzer.analyze("and, World") == ["world"]
+
+
+class TestPositions:
+    documents = DOCUMENTS + [
+        ("mermaid_story", "A story about a little girl who wants to be a mermaid."),
+        ("toy_story_2", "The toys go on a rescue mission, a toy story sequel."),
+    ]
+
+    @pytest.fixture(params=[False, True], ids=["dict", "compiled"])
+    def engine(self, request):
+        engine = SearchEngine(text_processing=TextProcessing.Stemmer, positions=True)
+        engine.bulk_index(self.documents)
+        if request.param:
+            engine.compile()
+        return engine
+
+    @pytest.mark.parametrize("query, expected_urls", [
+        ('"toy story"', {"toy_story_2"}),
+        ('"mermaid princess" sea', {"the_little_mermaid"}),
+        ('"sea witch" "to find love"', {"the_little_mermaid"}),
+        ('"princess mermaid"', set()),
+        ('"unknown phrase"', set()),
+    ])
+    def test_phrase_queries(self, engine, query, expected_urls):
+        assert set(engine.search(query)) == expected_urls
+        assert {url for url, _ in engine.search_topk(query, 10)} == expected_urls
+
+    def test_proximity_boost(self):
+        plain = SearchEngine(positions=True)
+        plain.bulk_index(self.documents)
+        boosted = SearchEngine(positions=True, proximity_boost=1.0, proximity_window=1)
+        boosted.bulk_index(self.documents)
+        plain_scores, boosted_scores = plain.search("toy story"), boosted.search("toy story")
+        assert boosted_scores["toy_story_2"] == plain_scores["toy_story_2"] + 1.0
+        assert boosted_scores["mermaid_story"] == plain_scores["mermaid_story"]
+
+    def test_snapshot_keeps_positions(self, engine, tmp_path):
+        engine.save(tmp_path, "dataset")
+        loaded = SearchEngine.load(tmp_path, "dataset", text_processing=TextProcessing.Stemmer,
+                                   positions=True)
+        assert loaded.search('"toy story"') == engine.search('"toy story"')
+        loaded.index("toy_story_3", "Andy leaves for college in this toy story.")
+        assert set(loaded.search('"toy story"')) == {"toy_story_2", "toy_story_3"}
@@ -0,0 +1,51 @@
+import os
+import signal
+import socket
+import subprocess
+import sys
+
+import httpx
+
+from tests.app.test_reload import write_dataset
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def test_spacy_and_nltk_are_not_imported_with_the_app():
+    code = "import sys, app.main; print('spacy' in sys.modules or 'nltk' in sys.modules)"
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True)
+    assert result.stdout.strip() == "False"
+
+
+def test_preforked_workers_serve_the_preloaded_state(tmp_path):
+    write_dataset(tmp_path / "movies.csv", 4)
+    env = {
+        **os.environ,
+        "DATASET_PATH": str(tmp_path / "movies.csv"),
+        "DATASET_CACHE_DIR": str(tmp_path / "dataset"),
+        "INDEX_SNAPSHOT_DIR": str(tmp_path / "snapshots"),
+        "TEXT_PROCESSING": "stemmer",
+    }
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "app.serve", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", "2"],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True,
+    )
+    try:
+        ready = 0
+        for line in server.stderr:
+            ready += "Application startup complete" in line
+            if ready == 2:
+                break
+        assert ready == 2
+        response = httpx.get(f"http://127.0.0.1:{port}/search_disney_movie",
+                             params={"query": "deer", "is_tag": False})
+        assert [movie["title"] for movie in response.json()] == ["Bambi"]
+    finally:
+        server.send_signal(signal.SIGTERM)
+        assert server.wait(timeout=30) == 0
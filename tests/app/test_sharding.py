@@ -0,0 +1,92 @@
+import logging
+import multiprocessing
+import os
+import pytest
+
+from concurrent.futures import ThreadPoolExecutor
+
+import app.utils as utils
+
+from app.config import Config
+from app.search_engine import SearchEngine, TextProcessing
+from app.sharding import ShardedSearchEngine
+from tests.app.test_search_engine import DOCUMENTS
+
+
+@pytest.fixture(scope="module")
+def sharded_engine():
+    engine = ShardedSearchEngine(3, text_processing=TextProcessing.Stemmer, fuzzy_distance=2)
+    engine.bulk_index(DOCUMENTS[:2])
+    engine.bulk_index(DOCUMENTS[2:])
+    yield engine
+    engine.close()
+
+
+class TestShardedSearchEngine:
+    @pytest.mark.parametrize("query", [
+        "princess", "find the princess", "princess princess sea", "lamp genie", "unknown words",
+        "prinses", "lamp genei",
+    ])
+    @pytest.mark.parametrize("k", [1, 3, 10])
+    def test_search_topk_matches_single_engine(self, sharded_engine, query, k):
+        engine = SearchEngine(text_processing=TextProcessing.Stemmer, fuzzy_distance=2)
+        engine.bulk_index(DOCUMENTS)
+        engine.compile()
+        assert sharded_engine.search_topk(query, k) == engine.search_topk(query, k)
+
+    def test_documents_are_spread_over_shards(self, sharded_engine):
+        assert sharded_engine.n_shards == 3
+        assert sharded_engine.number_of_documents == len(DOCUMENTS)
+
+    def test_concurrent_queries(self, sharded_engine):
+        queries = ["princess", "lamp genie", "prinses", "sea"] * 25
+        expected = [sharded_engine.search_topk(query, 3) for query in queries]
+        with ThreadPoolExecutor(4) as executor:
+            results = list(executor.map(lambda query: sharded_engine.search_topk(query, 3),
+                                        queries))
+        assert results == expected
+
+    def test_dense_and_similar_movies_are_disabled(self, sharded_engine, monkeypatch, caplog):
+        monkeypatch.setattr(Config, "dense_dims", 8)
+        monkeypatch.setattr(Config, "similar_neighbors", 5)
+        with caplog.at_level(logging.WARNING, logger="app.utils"):
+            assert utils.build_dense_index(sharded_engine) is None
+            assert utils.build_similar_movies(None, sharded_engine) is None
+        assert len(caplog.records) == 2
+
+    def test_failed_reply_leaves_no_reply_behind(self):
+        engine = ShardedSearchEngine(2, text_processing=TextProcessing.Stemmer)
+        engine.bulk_index(DOCUMENTS)
+        expected = engine.search_topk("lamp genie", 3)
+        connection = engine._connections[0]
+
+        class FailingConnection:
+            def send(self, message):
+                connection.send(message)
+
+            def recv(self):
+                connection.recv()
+                raise ValueError("unreadable reply")
+
+        engine._connections[0] = FailingConnection()
+        with pytest.raises(ValueError):
+            engine.search_topk("princess", 3)
+        engine._connections[0] = connection
+        assert engine.search_topk("lamp genie", 3) == expected
+        engine.close()
+
+    def test_forked_copy_leaves_the_shards_alone(self, sharded_engine):
+        def child():
+            try:
+                sharded_engine.search_topk("princess", 3)
+            except RuntimeError:
+                sharded_engine.close()
+                os._exit(0)
+            os._exit(1)
+
+        process = multiprocessing.get_context("fork").Process(target=child)
+        process.start()
+        process.join(timeout=10)
+        assert process.exitcode == 0
+        assert all(shard.is_alive() for shard in sharded_engine._processes)
+        assert sharded_engine.search_topk("princess", 3)
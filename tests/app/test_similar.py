@@ -0,0 +1,126 @@
+import numpy as np
+import pytest
+
+from fastapi.testclient import TestClient
+from pandas import DataFrame
+
+import app.main as app_main
+
+from app.search_engine import SearchEngine, TextProcessing
+from app.similar import expand_ranges, SimilarityIndex, SimilarMovies
+from tests.app.test_reload import dataset, write_dataset  # noqa: F401
+
+
+MOVIES = DataFrame({
+    "movie_id": ["lion-king", "jungle-book", "little-mermaid", "moana", "frozen"],
+    "url": ["lion-king", "jungle-book", "little-mermaid", "moana", "frozen"],
+    "tags": [["animals", "africa"], ["animals", "jungle"], ["ocean", "princess"],
+             ["ocean", "island"], ["snow", "princess"]],
+    "genre": [["Animation"], ["Animation"], ["Animation", "Musical"], ["Animation"], [""]],
+    "description": [
+        "A young lion prince flees his kingdom after the death of his father",
+        "A boy raised by wolves in the jungle is chased by a tiger",
+        "A young mermaid princess trades her voice to live on land",
+        "A girl sails across the ocean to save her island",
+        "A princess with ice powers flees her kingdom",
+    ],
+})
+
+
+def index_plots(engine: SearchEngine, movies: DataFrame) -> None:
+    engine.bulk_index(list(movies[["url", "description"]].values), workers=1)
+    engine.compile()
+
+
+@pytest.fixture
+def engine():
+    engine = SearchEngine(text_processing=TextProcessing.Stemmer, stopwords=True)
+    index_plots(engine, MOVIES)
+    return engine
+
+
+def test_expand_ranges():
+    starts, lengths = np.array([5, 0, 9]), np.array([2, 0, 3])
+    assert expand_ranges(starts, lengths).tolist() == [5, 6, 9, 10, 11]
+
+
+def dense_neighbors(matrix: np.ndarray, n: int) -> list[list[int]]:
+    similarities = matrix @ matrix.T
+    np.fill_diagonal(similarities, -np.inf)
+    return [
+        [j for j in np.argsort(-row, kind="stable")[:n].tolist() if row[j] > 0]
+        for row in similarities
+    ]
+
+
+def random_features(n_rows: int, n_features: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    matrix = rng.random((n_rows, n_features)) * (rng.random((n_rows, n_features)) < 0.1)
+    rows, columns = np.nonzero(matrix)
+    indptr = np.zeros(n_rows + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=n_rows), out=indptr[1:])
+    return matrix.astype(np.float32), (indptr, columns.astype(np.int32),
+                                       matrix[rows, columns].astype(np.float32))
+
+
+@pytest.mark.parametrize("max_cells", [1 << 20, 200])
+def test_neighbors_match_the_dense_similarities(monkeypatch, max_cells):
+    monkeypatch.setattr("app.similar.MAX_CELLS", max_cells)
+    matrix, features = random_features(60, 40)
+    index = SimilarityIndex.build(features, 40, n_neighbors=5)
+    assert index.ids.dtype == np.int32 and index.scores.dtype == np.float16
+    for row, expected in enumerate(dense_neighbors(matrix, 5)):
+        ids, scores = index.neighbors(row)
+        assert ids.tolist() == expected
+        np.testing.assert_allclose(scores, [matrix[row] @ matrix[j] for j in expected], rtol=1e-3)
+
+
+def test_update_merges_the_new_rows():
+    matrix, features = random_features(50, 30, seed=1)
+    indptr, columns, values = features
+    first = (indptr[:31], columns[:indptr[30]], values[:indptr[30]])
+    index = SimilarityIndex.build(first, 30, n_neighbors=4)
+    index.update(features, 30)
+    expected = SimilarityIndex.build(features, 30, n_neighbors=4)
+    np.testing.assert_array_equal(index.ids, expected.ids)
+    np.testing.assert_array_equal(index.scores, expected.scores)
+
+
+def test_similar_movies(engine):
+    similar = SimilarMovies.build(MOVIES, engine, n_neighbors=3)
+    ranked = similar.similar("lion-king")
+    # Same tag and genre, then the shared plot words
+    assert MOVIES["movie_id"][ranked.rows].tolist()[:2] == ["jungle-book", "frozen"]
+    assert list(ranked.relevancy) == sorted(ranked.relevancy, reverse=True)
+    assert len(similar.similar("lion-king", n=1)) == 1
+    with pytest.raises(KeyError):
+        similar.similar("unknown")
+
+
+def test_similar_movies_are_added_incrementally(tmp_path):
+    engine = SearchEngine(text_processing=TextProcessing.Stemmer, stopwords=True)
+    index_plots(engine, MOVIES[:3])
+    similar = SimilarMovies.build(MOVIES[:3], engine, n_neighbors=2)
+    assert 4 not in similar.similar("little-mermaid").rows.tolist()
+    similar.save(tmp_path, {})
+    loaded = SimilarMovies.load(tmp_path, {}, list(MOVIES["movie_id"][:3]))
+    index_plots(engine, MOVIES[3:])
+    similar.add(MOVIES, engine)
+    loaded.add(MOVIES, engine)
+    full = SimilarMovies.build(MOVIES, engine, n_neighbors=2)
+    for movie_id in ["moana", "frozen"]:
+        assert similar.similar(movie_id).rows.tolist() == full.similar(movie_id).rows.tolist()
+    # Movies indexed before see the new ones
+    assert 4 in similar.similar("little-mermaid").rows.tolist()
+    np.testing.assert_array_equal(loaded.index.ids, similar.index.ids)
+
+
+def test_similar_endpoint(dataset):  # noqa: F811
+    write_dataset(dataset, 4)
+    with TestClient(app_main.app) as client:
+        response = client.get("/similar/frozen")
+        assert response.status_code == 200
+        movies = response.json()
+        assert 0 < len(movies) <= 3 and "Frozen" not in [movie["title"] for movie in movies]
+        assert client.get("/similar/frozen", params={"n": 1}).json()[:1] == movies[:1]
+        assert client.get("/similar/unknown").status_code == 404
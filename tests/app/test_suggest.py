@@ -0,0 +1,79 @@
+import pytest
+
+from pandas import DataFrame
+
+from app.search_engine import SearchEngine, TextProcessing
+from app.suggest import PrefixIndex, Suggester, word_suffixes
+
+
+MOVIES = DataFrame({
+    "url": ["lion-king", "lion-king-2019", "little-mermaid", "frozen", "lilo"],
+    "title": ["The Lion King", "The Lion King", "The Little Mermaid", "Frozen", "Lilo & Stitch"],
+    "tags": [["lions", "africa"], ["lions"], ["mermaids", "ocean"], ["snow"], ["aliens"]],
+    "box_office": [968_000_000, 1_663_000_000, 235_000_000, 1_280_000_000, ""],
+    "description": [
+        "A lion cub flees after the death of his father",
+        "A lion cub becomes king of the pride lands",
+        "A mermaid longs for life on land",
+        "A queen with ice powers flees her kingdom",
+        "A lonely girl adopts a little alien",
+    ],
+})
+
+
+@pytest.fixture(scope="module")
+def suggester():
+    engine = SearchEngine(text_processing=TextProcessing.Stemmer, stopwords=True)
+    engine.bulk_index(list(MOVIES[["url", "description"]].values), workers=1)
+    engine.compile()
+    return Suggester(MOVIES, engine, limit=3)
+
+
+def test_word_suffixes():
+    assert word_suffixes("The  Lion King") == ["the lion king", "lion king", "king"]
+
+
+@pytest.mark.parametrize("max_scan", [1, 256])
+def test_completions_are_ranked_by_score(max_scan):
+    texts = ["cat", "car", "cart", "dog", "carbon"]
+    index = PrefixIndex(texts, [5, 1, 3, 4, 2], limit=3, max_scan=max_scan)
+    assert index.complete("ca") == ["cat", "cart", "carbon"]
+    assert index.complete("car") == ["cart", "carbon", "car"]
+    assert index.complete("CAR", n=1) == ["cart"]
+    assert index.complete("") == ["cat", "dog", "cart"]
+    assert index.complete("x") == []
+
+
+def test_large_prefixes_are_precomputed():
+    texts = [f"a{i:03}" for i in range(100)] + ["b"]
+    index = PrefixIndex(texts, list(range(101)), limit=2, max_scan=10)
+    # "a0x" prefixes have 10 keys, few enough to rank on each lookup
+    assert set(index.top) == {b"", b"a", b"a0"}
+    assert index.complete("a0") == ["a099", "a098"]
+    assert index.complete("a05") == ["a059", "a058"]
+
+
+def test_entries_with_several_keys_appear_once():
+    index = PrefixIndex(["lion king", "king kong"], [1, 2], keys_of=word_suffixes)
+    assert index.complete("king") == ["king kong", "lion king"]
+    assert index.complete("k") == ["king kong", "lion king"]
+
+
+def test_suggest(suggester):
+    assert suggester.suggest("li") == {
+        "titles": ["The Lion King", "The Little Mermaid", "Lilo & Stitch"],
+        "tags": ["lions"],
+        "words": ["lion", "life", "little"],
+    }
+    assert suggester.suggest("lion") == {"titles": ["The Lion King"], "tags": ["lions"],
+                                         "words": ["lion"]}
+
+
+def test_suggest_completes_the_last_word(suggester):
+    suggestions = suggester.suggest("mermaid  fle", n=2)
+    assert suggestions["titles"] == []
+    assert suggestions["words"] == ["mermaid flees"]
+
+
+def test_suggest_footprint(suggester):
+    assert 0 < suggester.nbytes < 10_000